@@ -0,0 +1,115 @@
+"""
+Benchmark de fechas en los caminos masivos (normalizar filas, clase "due", resumen de retoques).
+
+Compara la versión anterior (strptime por fila, excepciones como control de flujo)
+con la actual de crm_web (parseo memoizado + cálculo en lote). No toca Supabase.
+
+    python bench_dates.py            # 10k y 100k filas
+    python bench_dates.py 50000      # tamaños a elección
+"""
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import crm_web
+
+
+# ---------- versión anterior (referencia) ----------
+def old_parse_ddmmyyyy(s):
+    return datetime.strptime(s.strip(), "%d/%m/%Y")
+
+
+def old_supa_to_ui_date(fecha_raw):
+    s = (fecha_raw or "").strip()
+    if not s:
+        return ""
+    if "/" in s:
+        return s
+    try:
+        return datetime.strptime(s, "%Y-%m-%d").strftime("%d/%m/%Y")
+    except Exception:
+        return s
+
+
+def old_compute_retouch_date(fecha_str, service):
+    dt = old_parse_ddmmyyyy(fecha_str)
+    days = 365 if crm_web.is_retouch_service(service) else 21
+    return (dt + timedelta(days=days)).strftime("%d/%m/%Y")
+
+
+def old_is_due(retouch_str):
+    try:
+        return old_parse_ddmmyyyy(retouch_str).date() <= datetime.now().date()
+    except Exception:
+        return False
+
+
+def old_pipeline(raw):
+    rows = []
+    for r in raw:
+        fecha_ui = old_supa_to_ui_date(r["fecha"])
+        try:
+            retoque = old_compute_retouch_date(fecha_ui, r["servicio"])
+        except Exception:
+            retoque = ""
+        rows.append({**r, "fecha": fecha_ui, "retoque": retoque})
+    rows = [{**r, "row_class": ("due" if old_is_due(r["retoque"]) else "")} for r in rows]
+    due = sum(1 for r in rows if old_is_due(r["retoque"]))
+    return rows, due
+
+
+# ---------- versión actual ----------
+def new_pipeline(raw):
+    rows = crm_web.present_rows(crm_web._normalize_row(r) for r in raw)
+    due = crm_web.retouch_summary_from_rows(rows)["due"]
+    return rows, due
+
+
+def make_rows(n, seed=1):
+    rnd = random.Random(seed)
+    start = date(2022, 1, 1)
+    return [
+        {
+            "id": str(i),
+            "nombre": f"Cliente {i}",
+            "telefono": "",
+            "fecha": (start + timedelta(days=rnd.randrange(1500))).isoformat(),
+            "servicio": rnd.choice(crm_web.SERVICES),
+            "comentario": "",
+            "recordatorio": False,
+        }
+        for i in range(n)
+    ]
+
+
+def clear_memo():
+    for fn in (crm_web.ui_date, crm_web.iso_date, crm_web._retouch_ui,
+               crm_web.supa_to_ui_date, crm_web.ui_to_supa_date):
+        fn.cache_clear()
+
+
+def timed(fn, raw, repeat=3):
+    best = None
+    for _ in range(repeat):
+        clear_memo()  # en frío: cada corrida vuelve a parsear las fechas distintas
+        t0 = time.perf_counter()
+        out = fn(raw)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, out
+
+
+def main(sizes):
+    print(f"{'filas':>8} {'anterior':>10} {'actual':>10} {'mejora':>8}")
+    for n in sizes:
+        raw = make_rows(n)
+        t_old, (rows_old, due_old) = timed(old_pipeline, raw)
+        t_new, (rows_new, due_new) = timed(new_pipeline, raw)
+        assert due_old == due_new
+        assert [(r["retoque"], r["row_class"]) for r in rows_old] == [(r["retoque"], r["row_class"]) for r in rows_new]
+        print(f"{n:>8} {t_old * 1000:>8.1f}ms {t_new * 1000:>8.1f}ms {t_old / t_new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [10_000, 100_000])
@@ -0,0 +1,538 @@
+"""
+Almacenamiento local en SQLite (modo WAL) con la misma interfaz que usa crm_web del cliente de Supabase:
+    sb.table("crm_records").select("*").eq("id", rid).order("created_at", desc=True).limit(1).execute()
+    sb.rpc("crm_apply_changes", {...}).execute()
+.execute() devuelve un objeto con .data (lista de dicts) y .count, igual que postgrest.
+
+Solo implementa lo que la app usa: select (con count="exact"), insert, upsert, update, delete,
+los filtros eq/neq/lt/lte/gt/gte/in_/is_/ilike, or_ con sintaxis PostgREST (incluye and(...) y not.),
+order/limit/range, y las funciones crm_apply_changes / crm_push_undo / crm_apply_undo
+(sql/003 y sql/004). crm_search_records no existe acá: la app usa su fallback con ilike.
+
+El esquema replica sql/001..008: updated_at en cada escritura, fecha_retoque calculada
+y los mismos índices (created_at, updated_at, fecha_retoque, pendientes de recordatorio).
+"""
+import json
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+SCHEMA = """
+create table if not exists crm_records (
+  id text primary key,
+  nombre text not null default '',
+  telefono text,
+  fecha text,
+  servicio text not null default '',
+  comentario text,
+  recordatorio integer not null default 0,
+  created_at text not null,
+  updated_at text not null,
+  -- misma regla que sql/005_fecha_retoque.sql
+  fecha_retoque text generated always as (
+    case when fecha is null or fecha = '' then null
+    else date(fecha, case when upper(trim(coalesce(servicio, ''))) = 'RETOQUE' then '+365 days' else '+21 days' end)
+    end
+  ) stored
+);
+create index if not exists crm_records_created_at_idx on crm_records (created_at desc, id desc);
+create index if not exists crm_records_updated_at_idx on crm_records (updated_at desc);
+create index if not exists crm_records_fecha_retoque_idx on crm_records (fecha_retoque);
+create index if not exists crm_records_reminders_due_idx on crm_records (fecha_retoque, id) where recordatorio = 0;
+
+-- registro de cambios para el feed en vivo (sql/007_change_log.sql)
+create table if not exists crm_changes (
+  seq integer primary key autoincrement,
+  op text not null,
+  record_id text not null,
+  changed_at text not null default (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+);
+create trigger if not exists crm_records_log_insert after insert on crm_records
+begin
+  insert into crm_changes (op, record_id) values ('INSERT', new.id);
+end;
+create trigger if not exists crm_records_log_update after update on crm_records
+begin
+  insert into crm_changes (op, record_id) values ('UPDATE', new.id);
+end;
+create trigger if not exists crm_records_log_delete after delete on crm_records
+begin
+  insert into crm_changes (op, record_id) values ('DELETE', old.id);
+end;
+-- el feed solo necesita lo reciente
+create trigger if not exists crm_changes_prune after insert on crm_changes when new.seq % 1000 = 0
+begin
+  delete from crm_changes where seq <= new.seq - 5000;
+end;
+
+create table if not exists crm_undo_snapshots (
+  id integer primary key autoincrement,
+  snapshot text not null,
+  created_at text not null
+);
+
+create table if not exists crm_undo_ops (
+  id text primary key,
+  pushed_at text not null
+);
+"""
+
+COLUMNS = {
+    "crm_records": (
+        "id", "nombre", "telefono", "fecha", "servicio", "comentario",
+        "recordatorio", "created_at", "updated_at", "fecha_retoque",
+    ),
+    "crm_undo_snapshots": ("id", "snapshot", "created_at"),
+    "crm_changes": ("seq", "op", "record_id", "changed_at"),
+}
+WRITABLE = {
+    "crm_records": ("id", "nombre", "telefono", "fecha", "servicio", "comentario", "recordatorio", "created_at"),
+    "crm_undo_snapshots": ("snapshot",),
+    "crm_changes": (),
+}
+BOOL_COLUMNS = {"recordatorio"}
+UNDO_OPS_DAYS = 7  # op_id de la cola ya apilados que se recuerdan (sql/008)
+JSON_COLUMNS = {"snapshot"}
+
+_OPS = {"eq": "=", "neq": "<>", "lt": "<", "lte": "<=", "gt": ">", "gte": ">="}
+
+
+class StorageError(Exception):
+    pass
+
+
+# rechazos de la base (tabla/columna inexistente, NOT NULL, unique...): como un 4xx de PostgREST
+REJECTED = (StorageError, sqlite3.IntegrityError)
+
+
+class Response:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+def now_ts() -> str:
+    # mismo formato que timestamptz de Supabase (siempre con microsegundos: se compara como texto)
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+def _ilike_pattern(pat: str) -> str:
+    # comodín de PostgREST (*) -> LIKE (%)
+    return pat.replace("*", "%")
+
+
+def _split_top(expr: str):
+    """
+    Separa por comas de primer nivel, respetando paréntesis y comillas.
+    """
+    out, cur, depth, quoted = [], [], 0, False
+    i = 0
+    while i < len(expr):
+        ch = expr[i]
+        if quoted:
+            if ch == "\\" and i + 1 < len(expr):
+                cur.append(expr[i:i + 2])
+                i += 2
+                continue
+            if ch == '"':
+                quoted = False
+        elif ch == '"':
+            quoted = True
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            out.append("".join(cur))
+            cur = []
+            i += 1
+            continue
+        cur.append(ch)
+        i += 1
+    out.append("".join(cur))
+    return [p for p in out if p]
+
+
+def _unquote(v: str) -> str:
+    if len(v) >= 2 and v[0] == '"' and v[-1] == '"':
+        return re.sub(r"\\(.)", r"\1", v[1:-1])
+    return v
+
+
+class _Query:
+    def __init__(self, client, table: str):
+        if table not in COLUMNS:
+            raise StorageError(f'relation "{table}" does not exist')
+        self._client = client
+        self._table = table
+        self._op = "select"
+        self._cols = "*"
+        self._count = None
+        self._payload = None
+        self._where = []
+        self._params = []
+        self._order = []
+        self._limit = None
+        self._offset = 0
+
+    # ----- operación -----
+    def select(self, *cols, count=None):
+        self._cols = ",".join(cols) if cols else "*"
+        self._count = count
+        return self
+
+    def insert(self, payload, **_):
+        self._op, self._payload = "insert", payload
+        return self
+
+    def upsert(self, payload, **_):
+        self._op, self._payload = "upsert", payload
+        return self
+
+    def update(self, payload, **_):
+        self._op, self._payload = "update", payload
+        return self
+
+    def delete(self, **_):
+        self._op = "delete"
+        return self
+
+    # ----- filtros -----
+    def _col(self, col: str) -> str:
+        col = (col or "").strip()
+        if col not in COLUMNS[self._table]:
+            raise StorageError(f'column {self._table}.{col} does not exist')
+        return col
+
+    def _value(self, col: str, value):
+        if col in BOOL_COLUMNS:
+            if isinstance(value, str):
+                return 1 if value.lower() == "true" else 0
+            return 1 if value else 0
+        if value is None or isinstance(value, (int, float)):
+            return value
+        return str(value)
+
+    def _cond(self, col, op, value):
+        col = self._col(col)
+        if op in _OPS:
+            return f"{col} {_OPS[op]} ?", [self._value(col, value)]
+        if op == "ilike":
+            return f"crm_lower({col}) like crm_lower(?) escape '\\'", [_ilike_pattern(str(value))]
+        if op == "like":
+            return f"{col} like ? escape '\\'", [_ilike_pattern(str(value))]
+        if op == "in":
+            values = [self._value(col, v) for v in value]
+            if not values:
+                return "0", []
+            return f"{col} in ({','.join('?' * len(values))})", values
+        if op == "is":
+            if value is None or str(value).lower() == "null":
+                return f"{col} is null", []
+            return f"{col} = ?", [self._value(col, value)]
+        raise StorageError(f"operador no soportado: {op}")
+
+    def _filter(self, col, op, value):
+        sql, params = self._cond(col, op, value)
+        self._where.append(sql)
+        self._params.extend(params)
+        return self
+
+    def eq(self, col, value):
+        return self._filter(col, "eq", value)
+
+    def neq(self, col, value):
+        return self._filter(col, "neq", value)
+
+    def lt(self, col, value):
+        return self._filter(col, "lt", value)
+
+    def lte(self, col, value):
+        return self._filter(col, "lte", value)
+
+    def gt(self, col, value):
+        return self._filter(col, "gt", value)
+
+    def gte(self, col, value):
+        return self._filter(col, "gte", value)
+
+    def in_(self, col, values):
+        return self._filter(col, "in", list(values))
+
+    def is_(self, col, value):
+        return self._filter(col, "is", value)
+
+    def ilike(self, col, pattern):
+        return self._filter(col, "ilike", pattern)
+
+    def _logic(self, expr: str, joiner: str):
+        parts, params = [], []
+        for item in _split_top(expr):
+            item = item.strip()
+            m = re.fullmatch(r"(and|or)\((.*)\)", item, re.S)
+            if m:
+                sql, p = self._logic(m.group(2), " and " if m.group(1) == "and" else " or ")
+            else:
+                col, op, value = item.split(".", 2)
+                negate = op == "not"
+                if negate:
+                    op, value = value.split(".", 1)
+                if op == "in":
+                    value = [_unquote(v) for v in _split_top(value.strip("()"))]
+                else:
+                    value = _unquote(value)
+                sql, p = self._cond(col, op, value)
+                if negate:
+                    sql = f"not ({sql})"
+            parts.append(f"({sql})")
+            params.extend(p)
+        return joiner.join(parts), params
+
+    def or_(self, expr: str):
+        sql, params = self._logic(expr, " or ")
+        self._where.append(f"({sql})")
+        self._params.extend(params)
+        return self
+
+    # ----- orden / paginado -----
+    def order(self, col, desc=False, nullsfirst=None):
+        col = self._col(col)
+        if nullsfirst is None:
+            nullsfirst = desc  # default de Postgres: nulls al final en asc, al principio en desc
+        self._order.append(f"{col} {'desc' if desc else 'asc'} nulls {'first' if nullsfirst else 'last'}")
+        return self
+
+    def limit(self, n):
+        self._limit = int(n)
+        return self
+
+    def range(self, start, end):
+        self._offset = int(start)
+        self._limit = int(end) - int(start) + 1
+        return self
+
+    # ----- ejecución -----
+    def _where_sql(self):
+        return (" where " + " and ".join(self._where)) if self._where else ""
+
+    def _select_cols(self):
+        if self._cols.strip() == "*":
+            return list(COLUMNS[self._table])
+        return [self._col(c) for c in self._cols.split(",")]
+
+    def execute(self) -> Response:
+        conn = self._client.conn()
+        if self._op == "select":
+            return self._run_select(conn)
+        with self._client.write(conn):
+            if self._op in ("insert", "upsert"):
+                return Response(self._client._write_rows(conn, self._table, self._payload, self._op == "upsert"))
+            if self._op == "update":
+                return Response(self._run_update(conn))
+            return Response(self._run_delete(conn))
+
+    def _run_select(self, conn):
+        cols = self._select_cols()
+        sql = f"select {', '.join(cols)} from {self._table}{self._where_sql()}"
+        if self._order:
+            sql += " order by " + ", ".join(self._order)
+        if self._limit is not None or self._offset:
+            sql += f" limit {self._limit if self._limit is not None else -1} offset {self._offset}"
+        rows = [self._client._row(self._table, cols, r) for r in conn.execute(sql, self._params)]
+
+        count = None
+        if self._count:
+            count = conn.execute(f"select count(*) from {self._table}{self._where_sql()}", self._params).fetchone()[0]
+        return Response(rows, count)
+
+    def _ids(self, conn):
+        return [r[0] for r in conn.execute(f"select id from {self._table}{self._where_sql()}", self._params)]
+
+    def _run_update(self, conn):
+        values = {self._col(k): self._value(k, v) for k, v in (self._payload or {}).items() if k != "id"}
+        ids = self._ids(conn)
+        if not ids or not values:
+            return self._client._fetch(conn, self._table, ids)
+        if self._table == "crm_records":
+            values["updated_at"] = now_ts()
+        sets = ", ".join(f"{k} = ?" for k in values)
+        for chunk in _chunks(ids, 500):
+            conn.execute(
+                f"update {self._table} set {sets} where id in ({','.join('?' * len(chunk))})",
+                [*values.values(), *chunk],
+            )
+        return self._client._fetch(conn, self._table, ids)
+
+    def _run_delete(self, conn):
+        ids = self._ids(conn)
+        rows = self._client._fetch(conn, self._table, ids)
+        for chunk in _chunks(ids, 500):
+            conn.execute(f"delete from {self._table} where id in ({','.join('?' * len(chunk))})", chunk)
+        return rows
+
+
+class _Rpc:
+    def __init__(self, client, fn: str, params: dict):
+        self._client, self._fn, self._params = client, fn, params or {}
+
+    def execute(self) -> Response:
+        impl = getattr(self._client, f"_rpc_{self._fn}", None)
+        if impl is None:
+            raise StorageError(f"function {self._fn} does not exist")
+        conn = self._client.conn()
+        with self._client.write(conn):
+            return Response(impl(conn, **self._params))
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class SQLiteClient:
+    """
+    Cliente compatible con el subconjunto de supabase-py que usa crm_web.
+    Una conexión por hilo (sqlite3 no se comparte entre hilos); WAL deja leer mientras otro escribe.
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self.conn()  # crea el archivo y el esquema al arrancar
+
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.execute(f"pragma busy_timeout = {int(self.busy_timeout_ms)}")
+            conn.execute("pragma journal_mode = wal")
+            conn.execute("pragma synchronous = normal")
+            conn.create_function("crm_lower", 1, lambda s: s.lower() if isinstance(s, str) else s, deterministic=True)
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def write(self, conn):
+        return _Transaction(conn)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ----- interfaz tipo supabase -----
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def rpc(self, fn: str, params: dict = None) -> _Rpc:
+        return _Rpc(self, fn, params)
+
+    # ----- helpers -----
+    def _row(self, table, cols, values) -> dict:
+        out = {}
+        for c, v in zip(cols, values):
+            if c in BOOL_COLUMNS:
+                v = bool(v)
+            elif c in JSON_COLUMNS and v is not None:
+                v = json.loads(v)
+            out[c] = v
+        return out
+
+    def _fetch(self, conn, table, ids):
+        cols = list(COLUMNS[table])
+        out = []
+        for chunk in _chunks(list(ids), 500):
+            sql = f"select {', '.join(cols)} from {table} where id in ({','.join('?' * len(chunk))})"
+            out.extend(self._row(table, cols, r) for r in conn.execute(sql, chunk))
+        order = {rid: i for i, rid in enumerate(ids)}
+        out.sort(key=lambda r: order.get(r["id"], 0))
+        return out
+
+    def _write_rows(self, conn, table, payload, upsert: bool):
+        items = payload if isinstance(payload, list) else [payload]
+        ids = []
+        for item in items:
+            values = {}
+            for k, v in item.items():
+                if k not in WRITABLE[table]:
+                    continue
+                if k in BOOL_COLUMNS:
+                    v = 1 if v else 0
+                elif k in JSON_COLUMNS:
+                    v = json.dumps(v, ensure_ascii=False)
+                values[k] = v
+
+            ts = now_ts()
+            if table == "crm_records":
+                if not values.get("created_at"):
+                    values.pop("created_at", None)
+                    insert_values = {**values, "created_at": ts, "updated_at": ts}
+                else:
+                    insert_values = {**values, "updated_at": ts}
+            else:
+                insert_values = {**values, "created_at": ts}
+
+            cols = list(insert_values)
+            sql = f"insert into {table} ({', '.join(cols)}) values ({','.join('?' * len(cols))})"
+            if upsert and "id" in values:
+                # como PostgREST: solo se pisan las columnas que vienen en el payload
+                sets = [f"{c} = excluded.{c}" for c in values if c != "id"]
+                if table == "crm_records":
+                    sets.append("updated_at = excluded.updated_at")
+                sql += f" on conflict (id) do update set {', '.join(sets)}" if sets else " on conflict (id) do nothing"
+            cur = conn.execute(sql, list(insert_values.values()))
+            ids.append(values.get("id", cur.lastrowid))
+        return self._fetch(conn, table, ids)
+
+    # ----- funciones (sql/003, sql/004, sql/008) -----
+    def _rpc_crm_apply_changes(self, conn, upserts=None, delete_ids=None):
+        delete_ids = [str(rid) for rid in (delete_ids or [])]
+        for chunk in _chunks(delete_ids, 500):
+            conn.execute(f"delete from crm_records where id in ({','.join('?' * len(chunk))})", chunk)
+        rows = []
+        for r in upserts or []:
+            r = {**r, "recordatorio": bool(r.get("recordatorio"))}
+            rows.extend(self._write_rows(conn, "crm_records", r, upsert=True))
+        return rows
+
+    def _rpc_crm_push_undo(self, conn, entry=None, keep=30, op_id=None):
+        if op_id is not None:
+            # sql/008: un op_id ya visto es un reenvío de la cola
+            if conn.execute("insert or ignore into crm_undo_ops (id, pushed_at) values (?, ?)", [op_id, now_ts()]).rowcount == 0:
+                return None
+            cutoff = (datetime.now(timezone.utc) - timedelta(days=UNDO_OPS_DAYS)).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+            conn.execute("delete from crm_undo_ops where pushed_at < ?", [cutoff])
+        self._write_rows(conn, "crm_undo_snapshots", {"snapshot": entry}, upsert=False)
+        conn.execute(
+            "delete from crm_undo_snapshots where id not in "
+            "(select id from crm_undo_snapshots order by id desc limit ?)",
+            [int(keep)],
+        )
+        return None
+
+    def _rpc_crm_apply_undo(self, conn, undo_id=None, upserts=None, delete_ids=None):
+        if conn.execute("delete from crm_undo_snapshots where id = ?", [undo_id]).rowcount == 0:
+            return None  # otro request ya la aplicó
+        rows = self._rpc_crm_apply_changes(conn, upserts, delete_ids)
+        more = conn.execute("select 1 from crm_undo_snapshots limit 1").fetchone() is not None
+        return {"rows": rows, "more": more}
+
+
+class _Transaction:
+    """
+    BEGIN IMMEDIATE ... COMMIT (o ROLLBACK si algo falla): toma el lock de escritura al empezar.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("begin immediate")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("rollback" if exc_type else "commit")
+        return False
@@ -1,20 +1,47 @@
+import base64
+import codecs
+import csv
+import functools
+import hashlib
+import heapq
+import io
 import json
 import os
+import queue
+import threading
+import time
+import unicodedata
 import uuid
-from copy import deepcopy
-from datetime import datetime, timedelta
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from typing import NamedTuple, Optional
 
-from flask import Flask, request, redirect, send_file, render_template_string, Response
+import click
+
+from flask import Flask, request, redirect, send_file, render_template, Response, jsonify, stream_with_context, g, has_request_context
 
 from openpyxl import Workbook, load_workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
 
 # --- Supabase ---
-from supabase import create_client, Client
+import httpx
+from postgrest.exceptions import APIError
+from postgrest.utils import SyncClient as PostgrestSession
+from supabase import create_client, Client, ClientOptions
+
+import crm_sqlite
+
+try:
+    import fcntl  # lock de la cola de escrituras entre workers (POSIX)
+except ImportError:  # Windows: un solo proceso, alcanza con el lock de hilos
+    fcntl = None
 
 APP = Flask(__name__)
 
-EXPORT_FILE = "crm_export.xlsx"
+EXPORT_FILE = "crm_export.xlsx"  # nombre de descarga
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
 UNDO_MAX = 30  # historial tipo Ctrl+Z (en Supabase)
 
 SERVICES = [
@@ -28,48 +55,312 @@ SERVICES = [
 
 COLUMNS_XLSX = ["NOMBRE", "TELEFONO", "FECHA", "FECHA RETOQUE", "SERVICIO", "COMENTARIO"]
 
+# listado paginado en "/" (0 = todo en una sola página, como antes)
+PAGE_SIZE = int(os.environ.get("CRM_PAGE_SIZE") or 0)
+PAGE_MAX = 500
+
 CRM_TABLE = "crm_records"
 UNDO_TABLE = "crm_undo_snapshots"  # tabla para snapshots undo (opcional)
 
+# "supabase" (por defecto) o "sqlite": archivo local, sin red (ver crm_sqlite.py)
+STORAGE = (os.environ.get("CRM_STORAGE") or "supabase").strip().lower()
+SQLITE_PATH = os.environ.get("CRM_SQLITE_PATH") or "crm.db"
+
 
 # ---------- fechas ----------
+# En una tabla hay pocas fechas distintas y se repiten mucho: cada texto se parsea una sola vez
+# (memoizado) y por dentro se trabaja con date. Las variantes en lote sirven para listas enteras.
+DATE_MEMO = 8192
+
+
+def _split_date(s: str, sep: str, year_at: int):
+    # "d/m/yyyy" o "yyyy-m-d" -> 3 enteros, sin strptime ni excepciones; None si no tiene esa forma
+    parts = s.split(sep)
+    if len(parts) != 3 or not all(p.isdigit() and len(p) <= 2 for i, p in enumerate(parts) if i != year_at):
+        return None
+    if not (parts[year_at].isdigit() and len(parts[year_at]) == 4):
+        return None
+    return [int(p) for p in parts]
+
+
+def _make_date(y: int, m: int, d: int):
+    if not (1 <= m <= 12 and 1 <= d <= 31 and 1 <= y <= 9999):
+        return None
+    try:
+        return date(y, m, d)  # 31/02 y similares
+    except ValueError:
+        return None
+
+
+@functools.lru_cache(maxsize=DATE_MEMO)
+def ui_date(s: str):
+    """
+    DD/MM/YYYY -> date (memoizado). None si no es una fecha válida.
+    """
+    parts = _split_date((s or "").strip(), "/", 2)
+    if not parts:
+        return None
+    d, m, y = parts
+    return _make_date(y, m, d)
+
+
+@functools.lru_cache(maxsize=DATE_MEMO)
+def iso_date(s: str):
+    """
+    YYYY-MM-DD (o timestamp ISO) -> date (memoizado). None si no es una fecha válida.
+    """
+    parts = _split_date((s or "").strip()[:10], "-", 0)
+    if not parts:
+        return None
+    y, m, d = parts
+    return _make_date(y, m, d)
+
+
 def parse_ddmmyyyy(s: str):
-    return datetime.strptime(s.strip(), "%d/%m/%Y")
+    d = ui_date(s)
+    if d is None:
+        raise ValueError(f"fecha inválida: {s!r}")
+    return datetime(d.year, d.month, d.day)
 
 
-def fmt_ddmmyyyy(dt: datetime):
-    return dt.strftime("%d/%m/%Y")
+def fmt_ddmmyyyy(dt) -> str:
+    return f"{dt.day:02d}/{dt.month:02d}/{dt.year:04d}"
 
 
 def is_retouch_service(service: str) -> bool:
     return (service or "").strip().upper() == "RETOQUE"
 
 
-def compute_retouch_date(fecha_str: str, service: str) -> str:
-    dt = parse_ddmmyyyy(fecha_str)
+def retouch_days(service: str) -> int:
     # ✅ 21 días para todos, 365 para RETOQUE
-    days = 365 if is_retouch_service(service) else 21
-    return fmt_ddmmyyyy(dt + timedelta(days=days))
+    return 365 if is_retouch_service(service) else 21
 
 
-def is_due(retouch_str: str) -> bool:
-    try:
-        r = parse_ddmmyyyy(retouch_str).date()
-        return r <= datetime.now().date()
-    except Exception:
-        return False
+@functools.lru_cache(maxsize=DATE_MEMO)
+def _retouch_ui(fecha_str: str, days: int) -> str:
+    d = ui_date(fecha_str)
+    return fmt_ddmmyyyy(d + timedelta(days=days)) if d else ""
+
+
+def compute_retouch_date(fecha_str: str, service: str) -> str:
+    retoque = _retouch_ui(fecha_str, retouch_days(service))
+    if not retoque:
+        raise ValueError(f"fecha inválida: {fecha_str!r}")
+    return retoque
+
+
+def is_due(retouch_str: str, today=None) -> bool:
+    r = ui_date(retouch_str)
+    return r is not None and r <= (today or datetime.now().date())
+
+
+def due_flags(retouches, today=None) -> list:
+    """
+    is_due() para una lista entera de fechas DD/MM/YYYY, con "hoy" calculado una sola vez.
+    """
+    today = today or datetime.now().date()
+    return [(d is not None and d <= today) for d in map(ui_date, retouches)]
 
 
 # ---------- Supabase client ----------
+# Un solo cliente por proceso (worker de gunicorn), compartido entre hilos.
+# httpx mantiene el pool de conexiones keep-alive: una sola conexión TLS se reutiliza en todo el request.
+SB_POOL_SIZE = int(os.environ.get("SUPABASE_POOL_SIZE") or 10)
+SB_TIMEOUT = float(os.environ.get("SUPABASE_TIMEOUT") or 20)
+SB_CONNECT_TIMEOUT = float(os.environ.get("SUPABASE_CONNECT_TIMEOUT") or 5)
+SB_KEEPALIVE_EXPIRY = float(os.environ.get("SUPABASE_KEEPALIVE_EXPIRY") or 60)
+# al reconstruir el cliente, el pool viejo se cierra recién pasado este tiempo (requests en curso)
+SB_CLOSE_GRACE = float(os.environ.get("SUPABASE_CLOSE_GRACE") or 60)
+
+_SB_LOCK = threading.Lock()
+_SB = {"client": None, "pid": None, "healthy": True}
+
+# contadores para /health: reuses = get_sb() sin reconstruir, handshakes = conexiones TLS nuevas
+SB_STATS = {"builds": 0, "reuses": 0, "reconnects": 0, "connection_errors": 0, "connections": 0, "handshakes": 0}
+_SB_STATS_LOCK = threading.Lock()
+
+
+def _sb_count(name: str, n: int = 1):
+    with _SB_STATS_LOCK:
+        SB_STATS[name] += n
+
+
+def _sb_trace(event: str, info: dict):
+    # eventos de httpcore: solo cuentan las conexiones que realmente se abren
+    if event == "connection.connect_tcp.complete":
+        _sb_count("connections")
+    elif event == "connection.start_tls.complete":
+        _sb_count("handshakes")
+
+
+_SB_CALL = threading.local()
+
+
+@contextmanager
+def sb_timeout(seconds: float):
+    """
+    Timeout más corto para las consultas de este hilo dentro del bloque (lecturas que no deben
+    frenar la respuesta). Los demás hilos siguen con SB_TIMEOUT aunque compartan el cliente.
+    """
+    prev = getattr(_SB_CALL, "timeout", None)
+    _SB_CALL.timeout = seconds
+    try:
+        yield
+    finally:
+        _SB_CALL.timeout = prev
+
+
+def _sb_request_hook(req: httpx.Request):
+    req.extensions["trace"] = _sb_trace
+    timeout = getattr(_SB_CALL, "timeout", None)
+    if timeout:
+        req.extensions["timeout"] = httpx.Timeout(timeout).as_dict()
+
+
+def _sb_response_hook(resp: httpx.Response):
+    # APIError no guarda el status HTTP: el último de este hilo es el de la consulta que falló
+    _SB_CALL.status = resp.status_code
+
+
+def sb_rejected(e) -> bool:
+    """
+    True si la BD rechazó la operación (4xx: dato inválido, RLS, columna inexistente...):
+    reintentar no sirve. Red, timeouts, 5xx, 408 y 429 no cuentan (se reintentan).
+    """
+    if isinstance(e, APIError):
+        status = getattr(_SB_CALL, "status", 0)
+        return 400 <= status < 500 and status not in (408, 429)
+    return isinstance(e, crm_sqlite.REJECTED)
+
+
+def sb_missing_function(e) -> bool:
+    """
+    True si la función RPC no existe (falta correr su sql/00x): PGRST202 / 404 en PostgREST,
+    42883 (undefined_function) en Postgres.
+    """
+    if isinstance(e, APIError):
+        return str(e.code) in ("PGRST202", "42883") or getattr(_SB_CALL, "status", 0) == 404
+    return isinstance(e, crm_sqlite.StorageError) and str(e).startswith("function ")
+
+
+class _PooledTransport(httpx.HTTPTransport):
+    """
+    Transporte con pool keep-alive.
+    Si la conexión falla (DNS, TLS, timeout, reset...), marca el cliente para reconstruirlo en el próximo get_sb().
+    """
+
+    def handle_request(self, req: httpx.Request) -> httpx.Response:
+        try:
+            return super().handle_request(req)
+        except httpx.TransportError:
+            _sb_count("connection_errors")
+            _SB["healthy"] = False
+            raise
+
+
+def _build_sb(url: str, key: str) -> Client:
+    timeout = httpx.Timeout(SB_TIMEOUT, connect=SB_CONNECT_TIMEOUT)
+    sb = create_client(url, key, options=ClientOptions(postgrest_client_timeout=timeout))
+
+    # reemplazamos la sesión de postgrest por una con pool configurable
+    rest = sb.postgrest
+    default_session = rest.session
+    rest.session = PostgrestSession(
+        base_url=default_session.base_url,
+        headers=default_session.headers,
+        timeout=timeout,
+        follow_redirects=True,
+        event_hooks={"request": [_sb_request_hook], "response": [_sb_response_hook]},
+        transport=_PooledTransport(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=SB_POOL_SIZE,
+                max_keepalive_connections=SB_POOL_SIZE,
+                keepalive_expiry=SB_KEEPALIVE_EXPIRY,
+            ),
+        ),
+    )
+    default_session.close()
+    return sb
+
+
+def _close_sb(sb):
+    """
+    Cierra el pool del cliente viejo (si no, cada reconexión deja hasta SB_POOL_SIZE sockets abiertos),
+    pero SB_CLOSE_GRACE segundos después: otros hilos pueden estar en medio de un request con él
+    (p.ej. un timeout de lectura no significa que todas sus conexiones estén muertas).
+    """
+    session = getattr(getattr(sb, "postgrest", None), "session", None)
+    if session is None:
+        return
+
+    def close():
+        try:
+            session.close()
+        except Exception:
+            pass
+
+    timer = threading.Timer(SB_CLOSE_GRACE, close)
+    timer.daemon = True
+    timer.start()
+
+
 def get_sb() -> Client:
-    url = (os.environ.get("SUPABASE_URL") or "").strip()
-    key = (os.environ.get("SUPABASE_ANON_KEY") or "").strip()
-    if not url or not key:
-        raise RuntimeError("Falta SUPABASE_URL o SUPABASE_ANON_KEY en Environment Variables (Render).")
-    return create_client(url, key)
+    sb = _SB["client"]
+    # pid distinto = proceso hijo tras fork (gunicorn --preload): no compartir sockets del padre
+    if sb is not None and _SB["healthy"] and _SB["pid"] == os.getpid():
+        _sb_count("reuses")
+        return sb
+
+    with _SB_LOCK:
+        sb = _SB["client"]
+        if sb is not None and _SB["healthy"] and _SB["pid"] == os.getpid():
+            _sb_count("reuses")
+            return sb
+
+        if sb is not None:
+            _sb_count("reconnects")
+            if _SB["pid"] == os.getpid():
+                _close_sb(sb)  # tras un fork el pool es del padre: no se toca
+
+        if STORAGE == "sqlite":
+            # misma interfaz (table/rpc/execute) sobre un archivo SQLite local
+            sb = crm_sqlite.SQLiteClient(SQLITE_PATH)
+        else:
+            url = (os.environ.get("SUPABASE_URL") or "").strip()
+            key = (os.environ.get("SUPABASE_ANON_KEY") or "").strip()
+            if not url or not key:
+                raise RuntimeError("Falta SUPABASE_URL o SUPABASE_ANON_KEY en Environment Variables (Render).")
+            sb = _build_sb(url, key)
+        _sb_count("builds")
+        _SB.update(client=sb, pid=os.getpid(), healthy=True)
+        return sb
+
+
+def sb_health_check() -> bool:
+    """
+    Consulta mínima contra Supabase. Si falla, el cliente se reconstruye y se reintenta una vez.
+    """
+    for _ in range(2):
+        try:
+            get_sb().table(CRM_TABLE).select("id").limit(1).execute()
+            return True
+        except Exception:
+            _SB["healthy"] = False
+    return False
+
+
+def sb_stats() -> dict:
+    with _SB_STATS_LOCK:
+        out = dict(SB_STATS)
+    out["pid"] = os.getpid()
+    out["storage"] = STORAGE
+    out["pool_size"] = SB_POOL_SIZE
+    return out
 
 
 # ---------- helpers fecha: supabase <-> UI ----------
+@functools.lru_cache(maxsize=DATE_MEMO)
 def supa_to_ui_date(fecha_raw: str) -> str:
     """
     Convierte fecha de Supabase (YYYY-MM-DD) a UI (DD/MM/YYYY).
@@ -82,12 +373,11 @@ def supa_to_ui_date(fecha_raw: str) -> str:
     if "/" in s:
         return s
     # supabase
-    try:
-        return datetime.strptime(s, "%Y-%m-%d").strftime("%d/%m/%Y")
-    except Exception:
-        return s
+    d = iso_date(s) if len(s) <= 10 else None
+    return fmt_ddmmyyyy(d) if d else s
 
 
+@functools.lru_cache(maxsize=DATE_MEMO)
 def ui_to_supa_date(fecha_ui: str) -> str:
     """
     Convierte fecha de UI (DD/MM/YYYY) a Supabase (YYYY-MM-DD).
@@ -98,140 +388,1369 @@ def ui_to_supa_date(fecha_ui: str) -> str:
         return ""
     if "-" in s:
         return s
+    d = ui_date(s)
+    return d.isoformat() if d else s
+
+
+# ---------- caché de registros (por worker) ----------
+# Filas normalizadas en memoria. La versión es (cantidad de filas, max(updated_at));
+# si coincide con la de la BD no hace falta volver a bajar la tabla (ver sql/001_updated_at.sql).
+_CACHE_LOCK = threading.RLock()
+# synced = versión de la BD con la que la caché coincide (None = hay que recargar)
+# undo = (versión de la BD, hay entradas de Deshacer): solo vale mientras la versión no cambie
+_CACHE = {"rows": None, "stamps": {}, "undo": None, "synced": None}
+CACHE_STATS = {"hits": 0, "misses": 0, "stale": 0}
+
+
+class Record(NamedTuple):
+    """
+    Fila normalizada en memoria: tupla inmutable (sin __dict__), así la caché la comparte entre
+    requests sin copiarla. Se lee como dict (r["nombre"], r.get(...), dict(r)) o por atributo en las
+    plantillas. Se convierte a dict (formato JSON/undo de siempre) solo al salir: to_dict() / present_rows().
+    """
+    id: str = ""
+    nombre: str = ""
+    telefono: str = ""
+    fecha: str = ""  # DD/MM/YYYY
+    servicio: str = ""
+    comentario: str = ""
+    recordatorio: bool = False
+    created_at: Optional[str] = None
+    retoque: str = ""  # DD/MM/YYYY
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in _RECORD_INDEX:
+                raise KeyError(key)
+            return tuple.__getitem__(self, _RECORD_INDEX[key])
+        return tuple.__getitem__(self, key)
+
+    def __contains__(self, key):
+        return key in _RECORD_INDEX
+
+    def get(self, key, default=None):
+        i = _RECORD_INDEX.get(key)
+        return default if i is None else tuple.__getitem__(self, i)
+
+    def keys(self):
+        return self._fields
+
+    @property
+    def row_class(self) -> str:
+        return "due" if is_due(self.retoque) else ""
+
+    def replace(self, **changes) -> "Record":
+        return self._replace(**changes)
+
+    def to_dict(self, **extra) -> dict:
+        out = dict(zip(self._fields, self))
+        if extra:
+            out.update(extra)
+        return out
+
+
+_RECORD_INDEX = {f: i for i, f in enumerate(Record._fields)}
+
+
+def _normalize_row(r) -> Record:
+    fecha_raw = (r.get("fecha") or "").strip()
+    fecha_ui = supa_to_ui_date(fecha_raw)  # ✅ CONVERSIÓN CLAVE
+    servicio = (r.get("servicio") or "").strip()
+
+    # fecha_retoque viene de la BD (sql/005_fecha_retoque.sql); si no existe se calcula aquí
+    retoque = supa_to_ui_date(r.get("fecha_retoque") or "")
+    if not retoque:
+        retoque = _retouch_ui(fecha_ui, retouch_days(servicio))
+
+    return Record(
+        id=str(r.get("id") or ""),
+        nombre=(r.get("nombre") or "").strip(),
+        telefono=(r.get("telefono") or "").strip(),
+        fecha=fecha_ui,  # ✅ SIEMPRE DD/MM/YYYY para la app
+        servicio=servicio,
+        comentario=(r.get("comentario") or "").strip(),
+        recordatorio=bool(r.get("recordatorio", False)),
+        created_at=r.get("created_at"),
+        retoque=retoque,  # DD/MM/YYYY
+    )
+
+
+def db_version(fresh: bool = False):
+    """
+    (count, max updated_at) de CRM_TABLE en una consulta mínima.
+    None si no se puede (p.ej. falta la columna updated_at): en ese caso no se usa la caché.
+    Dentro de un request se consulta una sola vez (ETag, caché y resumen comparten el valor);
+    fresh=True vuelve a consultar.
+    """
+    if not fresh and has_request_context() and "data_version" in g:
+        return g.data_version
+    ver = _query_db_version()
+    if has_request_context():
+        g.data_version = ver
+    return ver
+
+
+def _query_db_version():
     try:
-        return datetime.strptime(s, "%d/%m/%Y").strftime("%Y-%m-%d")
+        sb = get_sb()
+        resp = (
+            sb.table(CRM_TABLE)
+            .select("updated_at", count="exact")
+            .order("updated_at", desc=True)
+            .limit(1)
+            .execute()
+        )
     except Exception:
-        return s
+        return None
+    top = (resp.data or [{}])[0].get("updated_at") or ""
+    return (resp.count or 0, top)
 
 
-# ---------- persistencia (Supabase) ----------
-def load_data(q: str = ""):
-    sb = get_sb()
-    q = (q or "").strip()
+def _cache_version():
+    return (len(_CACHE["rows"]), max(_CACHE["stamps"].values(), default=""))
 
+
+def _cache_reload():
+    sb = get_sb()
     resp = sb.table(CRM_TABLE).select("*").order("created_at", desc=True).execute()
-    rows = resp.data or []
+    raw = resp.data or []
+    _CACHE["rows"] = [_normalize_row(r) for r in raw]
+    _CACHE["stamps"] = {str(r.get("id") or ""): (r.get("updated_at") or "") for r in raw}
+    _CACHE["synced"] = _cache_version()
+    _clients_rebuild(_CACHE["rows"])
 
-    out = []
+
+_WRITING = threading.local()
+
+
+@contextmanager
+def cache_write(check: bool = True):
+    """
+    Envuelve una escritura propia a CRM_TABLE. El write-through (_cache_put/_cache_drop) solo adelanta
+    la versión de la caché si estaba al día justo antes de escribir: si otro worker escribió antes,
+    su max(updated_at) queda tapado por el nuestro, así que la caché se marca para recargar.
+    Después de escribir se confirma (_cache_confirm) que nadie escribió entre esa consulta y la nuestra.
+    check=False (feed de cambios) no consulta la versión antes: adelanta mientras la caché no esté
+    marcada para recargar y quien llama confirma la versión al final.
+    """
+    before = db_version(fresh=True) if check and _CACHE["rows"] is not None else None
+    fresh = _CACHE["rows"] is not None and (not check or (before is not None and before == _CACHE["synced"]))
+    prev = getattr(_WRITING, "fresh", False), getattr(_WRITING, "ids", None)
+    _WRITING.fresh, _WRITING.ids = fresh, set()
+    try:
+        yield
+        if fresh and check and _CACHE["synced"] is not None and not _cache_confirm(before, _WRITING.ids):
+            with _CACHE_LOCK:
+                _CACHE["synced"] = None
+    finally:
+        _WRITING.fresh, _WRITING.ids = prev
+        if has_request_context():
+            # lo que se lea después en este request ve la escritura: si la caché quedó al día,
+            # su versión es la de la BD y no hace falta volver a consultarla
+            if fresh and _CACHE["synced"] is not None:
+                g.data_version = _CACHE["synced"]
+            else:
+                g.pop("data_version", None)
+
+
+def _cache_confirm(before, written) -> bool:
+    """
+    True si después de nuestra escritura la BD es la versión de antes + lo nuestro: la misma versión
+    que la caché (cantidad de filas ya con nuestras altas/bajas) y ninguna fila con updated_at
+    posterior a la consulta de antes que no hayamos escrito nosotros (el max(updated_at) nuestro
+    taparía una edición de otro worker hecha en el medio).
+    """
+    try:
+        if db_version(fresh=True) != _CACHE["synced"]:
+            return False
+        resp = get_sb().table(CRM_TABLE).select("id").gt("updated_at", before[1]).execute()
+    except Exception:
+        return False
+    return {str(r["id"]) for r in (resp.data or [])} <= written
+
+
+def _cache_mark():
+    if getattr(_WRITING, "fresh", False) and _CACHE["synced"] is not None:
+        old, _CACHE["synced"] = _CACHE["synced"], _cache_version()
+        if _CACHE["undo"] is not None and _CACHE["undo"][0] == old:
+            _CACHE["undo"] = (_CACHE["synced"], _CACHE["undo"][1])  # la escritura propia no lo cambia
+    else:
+        _CACHE["synced"] = None
+
+
+def _created_desc(r):
+    return r.created_at or ""
+
+
+def _cache_put(raw_rows):
+    """
+    Write-through: aplica filas devueltas por Supabase (insert/upsert/update) a la caché.
+    Todo el lote en una pasada (reemplazo por id + merge de las nuevas), no una búsqueda por fila:
+    O(filas en caché + lote) con el lock tomado. La caché se reemplaza, no se modifica en el lugar.
+    """
+    batch = [(_normalize_row(raw), raw.get("updated_at") or "") for raw in raw_rows or []]
+    written = getattr(_WRITING, "ids", None)
+    if written is not None:
+        written.update(row.id for row, _ in batch)  # para _cache_confirm
+    with _CACHE_LOCK:
+        if _CACHE["rows"] is None:
+            return
+        stamps = _CACHE["stamps"]
+        incoming = {}
+        for row, stamp in batch:
+            if stamp and stamp < stamps.get(row.id, ""):
+                continue  # leída antes que la que ya está en memoria (p.ej. el feed tras una recarga)
+            stamps[row.id] = stamp
+            incoming[row.id] = row
+        if incoming:
+            changed = list(incoming.values())
+            rows = [incoming.pop(r.id, r) for r in _CACHE["rows"]]
+            if incoming:
+                # orden created_at desc: cada fila nueva va antes de la primera más antigua
+                new = sorted(incoming.values(), key=_created_desc, reverse=True)
+                rows = list(heapq.merge(rows, new, key=_created_desc, reverse=True))
+            _CACHE["rows"] = rows
+            _clients_put(changed)
+        _cache_mark()
+
+
+def _cache_drop(rids):
+    with _CACHE_LOCK:
+        if _CACHE["rows"] is None:
+            return
+        rids = set(rids)
+        _CACHE["rows"] = [r for r in _CACHE["rows"] if r["id"] not in rids]
+        for rid in rids:
+            _CACHE["stamps"].pop(rid, None)
+        _clients_drop(rids)
+        _cache_mark()
+
+
+def _cache_reset():
+    with _CACHE_LOCK:
+        _CACHE["rows"] = None
+        _CACHE["stamps"] = {}
+        _CACHE["undo"] = None
+        _CACHE["synced"] = None
+        _clients_rebuild([])
+
+
+def cached_rows():
+    ver = db_version()
+    with _CACHE_LOCK:
+        if ver is not None and _CACHE["rows"] is not None and ver == _CACHE["synced"]:
+            CACHE_STATS["hits"] += 1
+            return overlay_pending(_CACHE["rows"])
+
+        CACHE_STATS["misses"] += 1
+        try:
+            _cache_reload()
+        except Exception:
+            # sin conexión y con cola de escrituras: lo último conocido (o nada, recién arrancado) + lo pendiente
+            if get_write_queue() is None:
+                raise
+            CACHE_STATS["stale"] += 1
+            if has_request_context():
+                g.offline = True
+            return overlay_pending(_CACHE["rows"] or [])
+        rows = _CACHE["rows"]
+        if ver is None and get_write_queue() is None:
+            _cache_reset()  # sin versión no podemos confiar en la caché
+        return overlay_pending(rows)
+
+
+# ---------- índice de clientes ----------
+# Las filas son visitas; un cliente = mismo teléfono normalizado (o mismo nombre si no hay teléfono).
+# El índice vive junto a la caché: _cache_reload lo arma, _cache_put/_cache_drop lo actualizan
+# solo para los clientes tocados (así también con /save, /delete y los cambios del feed).
+CLIENT_PHONE_DIGITS = 9  # celulares de 9 dígitos: se ignora el prefijo de país
+_CLIENTS = {"visits": {}, "key_of": {}, "summary": {}}
+
+
+def _slug(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return "-".join("".join(ch if ch.isalnum() else " " for ch in text).split())
+
+
+def client_key(r) -> str:
+    """
+    "tel-971012160" por teléfono (solo dígitos, últimos CLIENT_PHONE_DIGITS), si no "nom-rosa-soto".
+    """
+    digits = "".join(ch for ch in (r.get("telefono") or "") if ch.isdigit())
+    if len(digits) >= 6:
+        return "tel-" + digits[-CLIENT_PHONE_DIGITS:]
+    name = _slug(r.get("nombre") or "")
+    return ("nom-" + name) if name else ""
+
+
+def _visit_order(r):
+    # más reciente primero: fecha de la visita y, a igual fecha, la cargada después
+    return (ui_date(r["fecha"]) or date.min, r["created_at"] or "")
+
+
+def _client_summary(key: str, visits) -> dict:
+    last = max(visits.values(), key=_visit_order)
+    return {
+        "key": key,
+        "nombre": last["nombre"],
+        "telefono": last["telefono"],
+        "visitas": len(visits),
+        "ultima_visita": last["fecha"],
+        "ultimo_servicio": last["servicio"],
+        "proximo_retoque": last["retoque"],
+        "recordatorio": last["recordatorio"],
+    }
+
+
+def _clients_touch(key: str):
+    visits = _CLIENTS["visits"].get(key)
+    if visits:
+        _CLIENTS["summary"][key] = _client_summary(key, visits)
+    else:
+        _CLIENTS["visits"].pop(key, None)
+        _CLIENTS["summary"].pop(key, None)
+
+
+def _clients_remove(rid: str):
+    key = _CLIENTS["key_of"].pop(rid, None)
+    if key is not None:
+        _CLIENTS["visits"].get(key, {}).pop(rid, None)
+    return key
+
+
+def _clients_put(rows):
+    # cada cliente tocado se recalcula una vez por lote, no una vez por fila
+    touched = set()
+    for row in rows:
+        touched.add(_clients_remove(row["id"]))
+        key = client_key(row)
+        if key:
+            _CLIENTS["visits"].setdefault(key, {})[row["id"]] = row
+            _CLIENTS["key_of"][row["id"]] = key
+            touched.add(key)
+    for key in touched - {None}:
+        _clients_touch(key)
+
+
+def _clients_drop(rids):
+    for key in {_clients_remove(rid) for rid in rids} - {None}:
+        _clients_touch(key)
+
+
+def _clients_rebuild(rows):
+    _CLIENTS.update(visits={}, key_of={}, summary={})
     for r in rows:
-        fecha_raw = (r.get("fecha") or "").strip()
-        fecha_ui = supa_to_ui_date(fecha_raw)  # ✅ CONVERSIÓN CLAVE
-
-        out.append({
-            "id": str(r.get("id") or ""),
-            "nombre": (r.get("nombre") or "").strip(),
-            "telefono": (r.get("telefono") or "").strip(),
-            "fecha": fecha_ui,  # ✅ SIEMPRE DD/MM/YYYY para la app
-            "servicio": (r.get("servicio") or "").strip(),
-            "comentario": (r.get("comentario") or "").strip(),
-            "recordatorio": bool(r.get("recordatorio", False)),
-            "created_at": r.get("created_at"),
-        })
+        key = client_key(r)
+        if key:
+            _CLIENTS["visits"].setdefault(key, {})[r["id"]] = r
+            _CLIENTS["key_of"][r["id"]] = key
+    for key in _CLIENTS["visits"]:
+        _clients_touch(key)
+
+
+def _clients_synced() -> bool:
+    """
+    True si _CLIENTS está al día con la BD. La versión se consulta fuera del lock;
+    solo si cambió se recarga la caché (y con ella el índice).
+    """
+    ver = db_version()
+    if ver is None:
+        # sin conexión y con cola: lo último conocido; sin updated_at: no hay índice confiable
+        return _CACHE["rows"] is not None and get_write_queue() is not None
+    if _CACHE["rows"] is None or ver != _CACHE["synced"]:
+        cached_rows()
+    return _CACHE["rows"] is not None
+
+
+def _client_pattern(key: str):
+    """
+    (columna, patrón ilike) que trae al menos las filas de la clave; después se filtra con client_key.
+    """
+    kind, _, value = key.partition("-")
+    if kind == "tel":
+        return "telefono", "*" + "*".join(value) + "*"  # admite espacios/guiones entre dígitos
+    # vocales y ñ pueden venir con tilde en la BD: comodín de un carácter
+    return "nombre", "*" + "".join("_" if ch in "aeioun" else ch for ch in value.replace("-", "*")) + "*"
+
+
+def client_visits(key: str):
+    """
+    Visitas (Record) de un cliente, en O(visitas del cliente): del índice si está al día,
+    si no (BD sin updated_at) con una consulta filtrada. Incluye lo pendiente en la cola.
+    """
+    if not key.startswith(("tel-", "nom-")):
+        return []
+    if _clients_synced():
+        with _CACHE_LOCK:
+            visits = list(_CLIENTS["visits"].get(key, {}).values())
+    else:
+        col, pattern = _client_pattern(key)
+        resp = get_sb().table(CRM_TABLE).select("*").ilike(col, pattern).execute()
+        visits = [_normalize_row(r) for r in (resp.data or [])]
+    return [r for r in overlay_pending(visits) if client_key(r) == key]
+
+
+def client_summaries():
+    """
+    Resúmenes de todos los clientes. Con la caché al día salen del índice (O(clientes));
+    los clientes con escrituras en cola se recalculan aparte.
+    """
+    if not _clients_synced():
+        visits = {}
+        for r in cached_rows():
+            key = client_key(r)
+            if key:
+                visits.setdefault(key, {})[r["id"]] = r
+        return [_client_summary(k, v) for k, v in visits.items()]
+
+    q = get_write_queue()
+    ops = [op for _, op in q.pending() if op["op"] != "undo"] if q is not None else []
+    with _CACHE_LOCK:
+        summary = dict(_CLIENTS["summary"])
+        touched = {_CLIENTS["key_of"].get(op["id"]) for op in ops}
+    touched |= {client_key(op["row"]) for op in ops if op["op"] == "upsert"}
+    for key in touched - {None, ""}:
+        visits = client_visits(key)
+        if visits:
+            summary[key] = _client_summary(key, {r["id"]: r for r in visits})
+        else:
+            summary.pop(key, None)
+    return list(summary.values())
+
+
+# ---------- persistencia (Supabase) ----------
+def load_data(q: str = ""):
+    q = (q or "").strip()
 
     if q:
-        ql = q.lower()
-        out = [r for r in out if ql in (r["nombre"] or "").lower()]
+        # ✅ la búsqueda corre en la BD (ver sql/002_search_trgm.sql)
+        return search_rows(q, limit=None)
 
-    return out
+    return cached_rows()
+
+
+SEARCH_COLUMNS = ("nombre", "telefono", "servicio", "comentario")
+SEARCH_LIMIT = 50
 
 
-def push_undo_snapshot(before_rows):
+def _search_score(ql: str, r) -> int:
     """
-    Guarda snapshot en tabla UNDO_TABLE para Deshacer.
-    Si no existe la tabla, simplemente no rompe (solo deshabilita undo).
+    Menor = mejor: nombre que empieza con q, palabra del nombre, nombre contiene, y luego otras columnas.
+    """
+    nombre = (r["nombre"] or "").lower()
+    if nombre.startswith(ql):
+        return 0
+    if any(w.startswith(ql) for w in nombre.split()):
+        return 1
+    if ql in nombre:
+        return 2
+    for i, col in enumerate(SEARCH_COLUMNS[1:], start=3):
+        if ql in (r[col] or "").lower():
+            return i
+    return len(SEARCH_COLUMNS) + 2
+
+
+def search_rows(q: str, limit=SEARCH_LIMIT):
+    """
+    Busca q en nombre/telefono/servicio/comentario sin bajar la tabla.
+    Usa la función crm_search_records si existe; si no, ilike vía PostgREST.
+    limit=None -> todas las coincidencias.
+    """
+    q = (q or "").strip()
+    if not q:
+        return []
+
+    sb = get_sb()
+    try:
+        resp = sb.rpc("crm_search_records", {"q": q, "lim": limit}).execute()
+    except Exception as e:
+        if not sb_missing_function(e):
+            raise  # función rota o error de red: no se tapa con un scan lento
+        # caracteres reservados de PostgREST / comodines fuera
+        term = "".join(ch for ch in q if ch not in '%*,:()"\\')
+        if not term.strip():
+            return []
+        cond = ",".join(f'{col}.ilike."*{term}*"' for col in SEARCH_COLUMNS)
+        qb = sb.table(CRM_TABLE).select("*").or_(cond).order("created_at", desc=True)
+        if limit:
+            qb = qb.limit(limit)
+        resp = qb.execute()
+
+    rows = [_normalize_row(r) for r in (resp.data or [])]
+    ql = q.lower()
+    # sort estable: dentro del mismo grupo se respeta el orden de la BD
+    rows.sort(key=lambda r: _search_score(ql, r))
+    return rows
+
+
+def encode_cursor(row, key: str = "created_at") -> str:
+    raw = f"{row.get(key) or ''}|{row.get('id') or ''}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, nullable: bool = False, parse=None):
+    """
+    Devuelve (valor de la clave, id) o None si el cursor no es válido.
+    nullable=True: un valor vacío es una fila con la clave en NULL (se devuelve "").
+    parse: valida el valor (p.ej. date.fromisoformat) antes de que vaya a un filtro; si falla, None.
     """
+    try:
+        raw = base64.urlsafe_b64decode((cursor or "").encode("ascii")).decode("utf-8")
+        value, rid = raw.split("|", 1)
+        uuid.UUID(rid)
+    except Exception:
+        return None
+    if not value and not nullable:
+        return None
+    if value and parse is not None:
+        try:
+            parse(value)
+        except ValueError:
+            return None
+    return value, rid
+
+
+def load_page(cursor: str = "", limit: int = 100):
+    """
+    Página de registros por keyset (created_at desc, id desc).
+    Devuelve (filas, cursor_siguiente); cursor_siguiente es None en la última página.
+    """
+    limit = max(1, min(int(limit), PAGE_MAX))
+    pos = decode_cursor(cursor, nullable=True, parse=datetime.fromisoformat)
     try:
         sb = get_sb()
-        sb.table(UNDO_TABLE).insert({"snapshot": before_rows}).execute()
+        qb = (
+            sb.table(CRM_TABLE)
+            .select("*")
+            .order("created_at", desc=True)
+            .order("id", desc=True)
+        )
+        if pos:
+            created_at, rid = pos
+            if created_at:
+                # (created_at, id) < (cursor): la fila siguiente en el orden desc
+                qb = qb.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{rid})')
+            else:
+                # created_at NULL va primero en desc: siguen las NULL de id menor y después todas las demás
+                qb = qb.or_(f"and(created_at.is.null,id.lt.{rid}),created_at.not.is.null")
+
+        # pedimos una de más para saber si hay otra página
+        resp = qb.range(0, limit).execute()
+    except Exception:
+        if get_write_queue() is None:
+            raise
+        # sin conexión: lo que haya en memoria (+ la cola), paginado con el mismo cursor
+        return _rows_page(cached_rows(), pos, limit)
+    raw = resp.data or []
+
+    rows = [_normalize_row(r) for r in raw[:limit]]
+    next_cursor = encode_cursor(rows[-1]) if len(raw) > limit else None
+    return rows, next_cursor
+
+
+def _page_key(created_at, rid):
+    # created_at desc con NULL primero, como Postgres
+    return (not created_at, created_at or "", rid)
+
+
+def _rows_page(rows, pos, limit: int):
+    """
+    load_page sobre filas en memoria: mismo orden (created_at desc, id desc) y mismo cursor.
+    """
+    rows = sorted(rows, key=lambda r: _page_key(r["created_at"], r["id"]), reverse=True)
+    if pos:
+        rows = [r for r in rows if _page_key(r["created_at"], r["id"]) < _page_key(*pos)]
+    page = rows[:limit]
+    return page, (encode_cursor(page[-1]) if len(rows) > limit else None)
+
+
+def load_reminders(cursor: str = "", limit: int = 50):
+    """
+    Pendientes de recordatorio: retoque ya toca (<= hoy) y recordatorio = false,
+    por fecha de retoque (índice parcial de sql/006_reminders_index.sql), paginado por keyset.
+    Devuelve (filas, cursor_siguiente, total de pendientes), el total siempre de toda la lista.
+    Un cursor inválido levanta ValueError.
+    """
+    limit = max(1, min(int(limit), PAGE_MAX))
+    today = datetime.now().date()
+    pos = decode_cursor(cursor, parse=date.fromisoformat)
+    if cursor and pos is None:
+        raise ValueError("Cursor inválido.")
+
+    def pending_query(columns):
+        return (
+            get_sb().table(CRM_TABLE)
+            .select(columns, count="exact")
+            .eq("recordatorio", False)
+            .lte("fecha_retoque", today.isoformat())
+        )
+
+    try:
+        qb = pending_query("*").order("fecha_retoque").order("id")
+        if pos:
+            fecha, rid = pos
+            qb = qb.or_(f"fecha_retoque.gt.{fecha},and(fecha_retoque.eq.{fecha},id.gt.{rid})")
+        resp = qb.range(0, limit).execute()
+        total = resp.count or 0
+        if pos:
+            # el count de arriba es desde el cursor: el total va sin él
+            total = pending_query("id").limit(1).execute().count or 0
+    except Exception as e:
+        # BD sin sql/005, o sin conexión con cola de escrituras (como load_page): filtrando las filas
+        if not _missing_column(e) and get_write_queue() is None:
+            raise
+        return _load_reminders_from_rows(cursor, limit)
+
+    raw = resp.data or []
+    rows = [_normalize_row(r) for r in raw[:limit]]
+    next_cursor = None
+    if len(raw) > limit:
+        last = rows[-1]
+        next_cursor = encode_cursor({"id": last["id"], "fecha_retoque": ui_to_supa_date(last["retoque"])}, "fecha_retoque")
+    return rows, next_cursor, total
+
+
+def _missing_column(e) -> bool:
+    # 42703 = undefined_column de Postgres (la consulta nombra fecha_retoque y falta la migración)
+    if isinstance(e, APIError):
+        return str(e.code) == "42703"
+    return isinstance(e, crm_sqlite.StorageError) and str(e).startswith("column ")
+
+
+def _load_reminders_from_rows(cursor: str, limit: int):
+    # BD sin fecha_retoque: mismo resultado filtrando las filas en Python
+    today = datetime.now().date()
+    pending = []
+    for r in load_data():
+        if r["recordatorio"] or not is_due(r["retoque"], today):
+            continue
+        pending.append((ui_to_supa_date(r["retoque"]), r["id"], r))
+    pending.sort(key=lambda t: (t[0], t[1]))
+    total = len(pending)
+
+    pos = decode_cursor(cursor, parse=date.fromisoformat)
+    if pos:
+        pending = [t for t in pending if (t[0], t[1]) > pos]
+
+    page = pending[:limit]
+    next_cursor = None
+    if len(pending) > limit:
+        fecha, rid, _ = page[-1]
+        next_cursor = encode_cursor({"id": rid, "fecha_retoque": fecha}, "fecha_retoque")
+    return [t[2] for t in page], next_cursor, total
+
+
+def undo_entry(restore=(), remove=()):
+    """
+    Entrada de undo por delta: solo lo que tocó la edición, no toda la tabla.
+    restore = filas tal como estaban antes (se vuelven a guardar), remove = ids nuevos (se borran).
+    """
+    return {
+        "restore": [dict(r) for r in restore],  # Record -> dict (JSON)
+        "remove": [str(rid) for rid in remove],
+    }
 
+
+def _push_undo(sb, entries, op_ids=None):
+    """
+    Apila entradas de undo en orden y recorta a UNDO_MAX, cada una en una llamada a crm_push_undo
+    (ver sql/004_undo_functions.sql). op_ids (cola de escrituras): crm_push_undo ignora los que ya
+    vio (sql/008_undo_op_ids.sql), así reenviar un lote no duplica entradas.
+    Sin la función, todas en un insert. Falla si no se pudieron guardar.
+    """
+    op_ids = list(op_ids or [None] * len(entries))
+    pushed = 0
+    try:
+        for entry, op_id in zip(entries, op_ids):
+            params = {"entry": entry, "keep": UNDO_MAX}
+            if op_id:
+                params["op_id"] = op_id
+            sb.rpc("crm_push_undo", params).execute()
+            pushed += 1
+        return
+    except Exception:
+        if pushed:
+            raise  # la función existe: se reintenta el lote (las ya apiladas se ignoran por op_id)
+
+    sb.table(UNDO_TABLE).insert([{"snapshot": e} for e in entries]).execute()
+    try:
         resp = sb.table(UNDO_TABLE).select("id").order("id", desc=True).execute()
         ids = [r["id"] for r in (resp.data or [])]
         if len(ids) > UNDO_MAX:
             to_delete = ids[UNDO_MAX:]
             sb.table(UNDO_TABLE).delete().in_("id", to_delete).execute()
+    except Exception:
+        pass  # ya quedó guardada; se recorta en la próxima
+
+
+def push_undo_snapshot(entry):
+    """
+    Guarda la entrada de undo (ver undo_entry) en tabla UNDO_TABLE para Deshacer.
+    Con cola de escrituras se anota en la cola, en orden con la edición (sin llamar a Supabase).
+    Si no existe la tabla, simplemente no rompe (solo deshabilita undo).
+    """
+    q = get_write_queue()
+    if q is not None:
+        q.append({"op": "undo", "op_id": str(uuid.uuid4()), "entry": entry})
+        return
+
+    try:
+        _push_undo(get_sb(), [entry])
+        # vale para la versión actual; la escritura que sigue la adelanta (ver _cache_mark)
+        _CACHE["undo"] = (_CACHE["synced"], True)
     except Exception:
         pass
 
 
 def can_undo():
+    # el estado se guarda con la versión de la BD en que se leyó: si otro worker escribe
+    # (y apila o saca entradas), la versión cambia y se vuelve a consultar la tabla de undo.
+    # No depende de cached_rows(): el listado paginado (CRM_PAGE_SIZE) no la usa.
+    q = get_write_queue()
+    if q is not None and any(op["op"] == "undo" for _, op in q.pending()):
+        return True
+    ver = db_version()
+    known = _CACHE["undo"]
+    if ver is not None and known is not None and known[0] == ver:
+        return known[1]
     try:
         sb = get_sb()
         resp = sb.table(UNDO_TABLE).select("id").order("id", desc=True).limit(1).execute()
+        _CACHE["undo"] = (ver, bool(resp.data))
         return bool(resp.data)
     except Exception:
         return False
 
 
-def pop_undo_snapshot():
-    try:
-        sb = get_sb()
-        resp = sb.table(UNDO_TABLE).select("*").order("id", desc=True).limit(1).execute()
-        if not resp.data:
-            return None
-        row = resp.data[0]
-        sid = row["id"]
-        snap = row.get("snapshot")
-        sb.table(UNDO_TABLE).delete().eq("id", sid).execute()
-        return snap
-    except Exception:
+def peek_undo_snapshot():
+    """
+    (id, entrada) de la última entrada de undo sin sacarla; None si no hay.
+    apply_undo la saca en la misma transacción en que la aplica, así un error no la pierde.
+    """
+    sb = get_sb()
+    resp = sb.table(UNDO_TABLE).select("*").order("id", desc=True).limit(1).execute()
+    if not resp.data:
         return None
+    row = resp.data[0]
+    return row["id"], row.get("snapshot")
+
 
+def drop_undo_snapshot(sid):
+    get_sb().table(UNDO_TABLE).delete().eq("id", sid).execute()
+    _CACHE["undo"] = None
 
-def save_row_upsert(rid, nombre, telefono, fecha_ui, servicio, comentario, recordatorio=False):
+
+def _row_payload(r, keep_created: bool = False) -> dict:
     """
-    Guarda en Supabase con fecha en YYYY-MM-DD.
+    Fila de la app (fecha DD/MM/YYYY) -> payload para Supabase (fecha YYYY-MM-DD).
     IMPORTANTE: manda None si telefono/comentario vienen vacíos.
     """
-    sb = get_sb()
-
-    fecha_supa = ui_to_supa_date(fecha_ui)
-
     payload = {
-        "id": rid,
-        "nombre": (nombre or "").strip(),
+        "id": r.get("id") or str(uuid.uuid4()),
+        "nombre": (r.get("nombre") or "").strip(),
         # ✅ si está vacío, manda None (evita error si DB es numeric)
-        "telefono": (telefono.strip() if (telefono or "").strip() else None),
-        "fecha": fecha_supa,  # YYYY-MM-DD
-        "servicio": (servicio or "").strip(),
-        "comentario": (comentario.strip() if (comentario or "").strip() else None),
-        "recordatorio": bool(recordatorio),
+        "telefono": ((r.get("telefono") or "").strip() or None),
+        "fecha": ui_to_supa_date(r.get("fecha", "")),  # YYYY-MM-DD
+        "servicio": (r.get("servicio") or "").strip(),
+        "comentario": ((r.get("comentario") or "").strip() or None),
+        "recordatorio": bool(r.get("recordatorio", False)),
     }
+    if keep_created and r.get("created_at"):
+        payload["created_at"] = r["created_at"]
+    return payload
+
+
+def save_row_upsert(rid, nombre, telefono, fecha_ui, servicio, comentario, recordatorio=False, existing=False):
+    """
+    Guarda en Supabase con fecha en YYYY-MM-DD (o en la cola de escrituras, si está activa).
+    En la cola, una fila existente va como patch de los campos del formulario (sin recordatorio).
+    """
+    payload = _row_payload({
+        "id": rid,
+        "nombre": nombre,
+        "telefono": telefono,
+        "fecha": fecha_ui,
+        "servicio": servicio,
+        "comentario": comentario,
+        "recordatorio": recordatorio,
+    })
+
+    q = get_write_queue()
+    if q is not None:
+        if existing:
+            fields = {k: v for k, v in payload.items() if k not in ("id", "recordatorio")}
+            q.append({"op": "patch", "id": payload["id"], "fields": fields})
+        else:
+            q.append({"op": "upsert", "id": payload["id"], "row": payload})
+        # fila editada que no está en memoria ni se pudo leer: al menos lo que se acaba de anotar
+        return queued_row(payload["id"]) or _normalize_row(payload)
 
-    sb.table(CRM_TABLE).upsert(payload).execute()
+    with cache_write():
+        resp = get_sb().table(CRM_TABLE).upsert(payload).execute()
+        _cache_put(resp.data)
+    return _normalize_row(resp.data[0]) if resp.data else None
 
 
 def delete_row(rid):
-    sb = get_sb()
-    sb.table(CRM_TABLE).delete().eq("id", rid).execute()
+    q = get_write_queue()
+    if q is not None:
+        q.append({"op": "delete", "id": rid})
+        return
+
+    with cache_write():
+        get_sb().table(CRM_TABLE).delete().eq("id", rid).execute()
+        _cache_drop([rid])
 
 
 def set_recordatorio(rid, want: bool):
+    q = get_write_queue()
+    if q is not None:
+        q.append({"op": "patch", "id": rid, "fields": {"recordatorio": bool(want)}})
+        return queued_row(rid)
+
+    with cache_write():
+        resp = get_sb().table(CRM_TABLE).update({"recordatorio": bool(want)}).eq("id", rid).execute()
+        _cache_put(resp.data)
+    return _normalize_row(resp.data[0]) if resp.data else None
+
+
+def fetch_row(rid):
+    """
+    Una fila por id (primary key), normalizada; None si no existe o el id no es un UUID.
+    """
+    rid = (rid or "").strip()
+    try:
+        uuid.UUID(rid)
+    except Exception:
+        return None
+    if get_write_queue() is not None:
+        return queued_rows([rid]).get(rid)
     sb = get_sb()
-    sb.table(CRM_TABLE).update({"recordatorio": bool(want)}).eq("id", rid).execute()
+    resp = sb.table(CRM_TABLE).select("*").eq("id", rid).limit(1).execute()
+    return _normalize_row(resp.data[0]) if resp.data else None
+
+
+def fetch_rows(rids):
+    """
+    Filas por id (una consulta por cada WRITE_BATCH ids: van en la URL), normalizadas.
+    """
+    rids = [str(rid) for rid in rids if rid]
+    if not rids:
+        return []
+    if get_write_queue() is not None:
+        found = queued_rows(rids)
+        return [found[rid] for rid in rids if rid in found]
+    sb = get_sb()
+    out = []
+    for chunk in _batches(rids, WRITE_BATCH):
+        resp = sb.table(CRM_TABLE).select("*").in_("id", chunk).execute()
+        out.extend(_normalize_row(r) for r in (resp.data or []))
+    return out
+
+
+def set_recordatorio_many(rids, want: bool):
+    rids = list(rids)
+    q = get_write_queue()
+    if q is not None:
+        q.extend([{"op": "patch", "id": rid, "fields": {"recordatorio": bool(want)}} for rid in rids])
+        return
+
+    with cache_write():
+        sb = get_sb()
+        for chunk in _batches(rids, WRITE_BATCH):
+            resp = sb.table(CRM_TABLE).update({"recordatorio": bool(want)}).in_("id", chunk).execute()
+            _cache_put(resp.data)
+
+
+# ---------- cola de escrituras (offline) ----------
+# Con CRM_WRITE_QUEUE=<archivo>, /save, /delete y /toggle_reminder anotan la operación en un archivo
+# append-only (una línea JSON por operación, con fsync) y responden al instante. Un hilo por worker
+# la manda a Supabase en lotes (upsert por id: reenviar es inofensivo), con reintentos y backoff.
+# Mientras tanto load_data() y fetch_row() ya muestran lo pendiente. Vacío = escritura directa, como antes.
+WRITE_QUEUE_PATH = (os.environ.get("CRM_WRITE_QUEUE") or "").strip()
+QUEUE_BATCH = int(os.environ.get("CRM_QUEUE_BATCH") or 200)
+QUEUE_INTERVAL = float(os.environ.get("CRM_QUEUE_INTERVAL") or 2)
+QUEUE_BACKOFF_MAX = float(os.environ.get("CRM_QUEUE_BACKOFF_MAX") or 60)
+# lectura de filas que no están en memoria al anotar una edición (segundos; después se sigue sin ellas)
+QUEUE_READ_TIMEOUT = float(os.environ.get("CRM_QUEUE_READ_TIMEOUT") or 2)
+
+
+@contextmanager
+def _file_lock(path: str, exclusive: bool = True, blocking: bool = True):
+    """
+    flock sobre path (entre procesos). Devuelve True/False según si se obtuvo (blocking=False).
+    """
+    with open(path, "a+b") as f:
+        if fcntl is None:
+            yield True
+            return
+        flags = (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | (0 if blocking else fcntl.LOCK_NB)
+        try:
+            fcntl.flock(f, flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
 
+class WriteQueue:
+    """
+    <path>: operaciones pendientes, <path>.ack: offset (bytes) ya enviado a Supabase y generación
+    (sube con cada compactación: el mismo offset/tamaño de antes y después de vaciar el archivo
+    son líneas distintas). <path>.lock protege append/compactación; <path>.flush asegura un solo
+    worker enviando a la vez. <path>.dead: operaciones que la BD rechazó (ver sb_rejected), apartadas
+    para revisarlas a mano; si no, la cola entera quedaría trabada detrás de ellas.
+    """
 
-def replace_all_rows(rows):
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pending = {"key": None, "ops": [], "bad": [], "end": 0}
+        self._dead_lines = set()  # (generación, offset) de líneas corruptas ya apartadas
+        self.stats = {
+            "enqueued": 0, "flushed": 0, "batches": 0, "failures": 0,
+            "retry_in": 0.0, "last_flush": None, "last_error": "", "dead": 0, "last_dead": "",
+        }
+        open(path, "ab").close()
+
+    # ----- archivo -----
+    def _read_ack(self):
+        """(offset, generación)"""
+        try:
+            with open(self.path + ".ack", encoding="ascii") as f:
+                parts = [int(p) for p in f.read().split()]
+        except (OSError, ValueError):
+            parts = []
+        return (parts + [0, 0])[0], (parts + [0, 0])[1]
+
+    def _write_ack(self, offset: int, gen: int):
+        tmp = f"{self.path}.ack.{os.getpid()}"
+        with open(tmp, "w", encoding="ascii") as f:
+            f.write(f"{offset} {gen}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path + ".ack")
+
+    def append(self, op: dict):
+        self.extend([op])
+
+    def extend(self, ops):
+        # varias operaciones con una sola escritura y un solo fsync (p.ej. un lote del import)
+        ts = time.time()
+        data = b"".join(
+            (json.dumps({"ts": ts, **op}, ensure_ascii=False) + "\n").encode("utf-8") for op in ops
+        )
+        with self._lock, _file_lock(self.path + ".lock"):
+            with open(self.path, "ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        self.stats["enqueued"] += len(ops)
+        self.start()
+        self._wake.set()
+
+    def pending(self):
+        """
+        [(offset al final de la línea, operación)] todavía no enviadas (de todos los workers).
+        """
+        return self._scan()[0]
+
+    def _scan(self):
+        """
+        (operaciones pendientes, [(offset, línea)] corruptas, offset al final de la última línea completa).
+        Una línea que no es JSON (disco lleno, edición a mano...) se saltea; flush la aparta al .dead.
+        """
+        with self._lock, _file_lock(self.path + ".lock", exclusive=False):
+            ack, gen = self._read_ack()
+            size = os.path.getsize(self.path)
+            if self._pending["key"] == (gen, ack, size):
+                return self._pending["ops"], self._pending["bad"], self._pending["end"]
+            with open(self.path, "rb") as f:
+                f.seek(ack)
+                data = f.read(max(0, size - ack))
+
+            ops, bad = [], []
+            offset = ack
+            for line in data.splitlines(keepends=True):
+                if not line.endswith(b"\n"):
+                    break  # línea a medio escribir
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    ops.append((offset, json.loads(line)))
+                except ValueError:
+                    bad.append((offset, line))
+            self._pending.update(key=(gen, ack, size), ops=ops, bad=bad, end=offset)
+            return ops, bad, offset
+
+    def marker(self):
+        # cambia con cada operación anotada o enviada (para ETags)
+        with _file_lock(self.path + ".lock", exclusive=False):
+            return self._read_ack(), os.path.getsize(self.path)
+
+    def _compact(self):
+        # todo enviado: se vacía el archivo para que no crezca
+        with self._lock, _file_lock(self.path + ".lock"):
+            ack, gen = self._read_ack()
+            if ack == os.path.getsize(self.path) > 0:
+                open(self.path, "wb").close()
+                self._write_ack(0, gen + 1)
+
+    # ----- envío -----
+    def flush(self, wait: bool = False) -> int:
+        """
+        Manda lo pendiente en lotes de QUEUE_BATCH; devuelve cuántas operaciones se enviaron.
+        Con wait=False, si otro worker ya está enviando no hace nada.
+        """
+        sent = 0
+        with _file_lock(self.path + ".flush", blocking=wait) as got:
+            if not got:
+                return 0
+            gen = self._read_ack()[1]  # no cambia mientras se tenga el lock de envío
+            ops, bad, end = self._scan()
+            for offset, line in bad:
+                if (gen, offset) not in self._dead_lines:
+                    self._dead_letter({"raw": line.decode("utf-8", "replace")}, "línea corrupta en la cola")
+                    self._dead_lines.add((gen, offset))
+            for chunk in _batches(ops, QUEUE_BATCH):
+                try:
+                    _send_queued_ops([op for _, op in chunk])
+                except Exception as e:
+                    if not sb_rejected(e):
+                        raise  # sin conexión: se reintenta el lote con backoff
+                    self._send_singly(chunk, gen)
+                else:
+                    self._write_ack(chunk[-1][0], gen)
+                sent += len(chunk)
+                self.stats["flushed"] += len(chunk)
+                self.stats["batches"] += 1
+            if bad and end > self._read_ack()[0]:
+                self._write_ack(end, gen)  # las corruptas del final también quedan atrás
+            if sent:
+                self.stats["last_flush"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+            self._compact()
+        return sent
+
+    def _send_singly(self, chunk, gen: int):
+        # el lote tiene alguna operación rechazada: de a una (reenviar es inofensivo), las rechazadas al .dead
+        for offset, op in chunk:
+            try:
+                _send_queued_ops([op])
+            except Exception as e:
+                if not sb_rejected(e):
+                    raise
+                self._dead_letter(op, e)
+            self._write_ack(offset, gen)
+
+    def _dead_letter(self, op: dict, error):
+        msg = str(error).replace("\n", " ")[:500]
+        line = json.dumps({"failed_at": time.time(), "error": msg, "op": op}, ensure_ascii=False) + "\n"
+        with open(self.path + ".dead", "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self.stats["dead"] += 1
+        self.stats["last_dead"] = msg[:200]
+        APP.logger.warning("cola de escrituras: operación rechazada, apartada en %s.dead: %s", self.path, msg)
+
+    def dead_letters(self) -> int:
+        try:
+            with open(self.path + ".dead", "rb") as f:
+                return sum(1 for _ in f)
+        except OSError:
+            return 0
+
+    def _run(self):
+        delay = 0.0
+        while True:
+            if delay:
+                time.sleep(delay)
+            else:
+                self._wake.wait(QUEUE_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+                delay = 0.0
+            except Exception as e:
+                self.stats["failures"] += 1
+                self.stats["last_error"] = str(e).replace("\n", " ")[:200]
+                delay = min(QUEUE_BACKOFF_MAX, max(1.0, delay * 2))
+            self.stats["retry_in"] = delay
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="crm-write-queue", daemon=True)
+            self._thread.start()
+
+    def offline(self) -> bool:
+        # el último envío falló y se está esperando para reintentar
+        return self.stats["retry_in"] > 0
+
+    def info(self) -> dict:
+        ops = self.pending()
+        oldest = ops[0][1].get("ts") if ops else None
+        return {
+            **self.stats,
+            "path": self.path,
+            "depth": len(ops),
+            "dead_letters": self.dead_letters(),
+            "lag_seconds": round(time.time() - oldest, 1) if oldest else 0.0,
+        }
+
+
+_WQ = {"queue": None, "pid": None}
+
+
+def get_write_queue():
     """
-    Restaura todo a un snapshot (para Undo).
-    OJO: snapshot trae fecha en DD/MM/YYYY (por nuestra app), aquí la convertimos al guardar.
+    Cola de escrituras de este proceso (None si CRM_WRITE_QUEUE no está configurado).
     """
+    if not WRITE_QUEUE_PATH:
+        return None
+    if _WQ["queue"] is None or _WQ["pid"] != os.getpid():
+        with _SB_LOCK:
+            if _WQ["queue"] is None or _WQ["pid"] != os.getpid():
+                q = WriteQueue(WRITE_QUEUE_PATH)
+                q.start()  # también envía lo que quedó de una ejecución anterior
+                _WQ.update(queue=q, pid=os.getpid())
+    return _WQ["queue"]
+
+
+def _send_queued_ops(ops):
+    """
+    Aplica un lote de la cola: se queda con el estado final de cada id y manda
+    un delete, un upsert y un update por valor de campos (todo idempotente).
+    Las entradas de undo del lote se apilan después, en el orden en que se anotaron
+    (con su op_id: reenviar el lote no las duplica).
+    """
+    undo_ops = [op for op in ops if op["op"] == "undo"]
+    final = OrderedDict()
+    for op in ops:
+        if op["op"] == "undo":
+            continue
+        rid = op["id"]
+        prev = final.get(rid)
+        if op["op"] == "patch" and prev is not None:
+            if prev["op"] == "upsert":
+                op = {**prev, "row": {**prev["row"], **op["fields"]}}
+            elif prev["op"] == "patch":
+                op = {**op, "fields": {**prev["fields"], **op["fields"]}}
+            else:
+                continue  # ya borrada
+        final[rid] = op
+
     sb = get_sb()
+    deletes = [rid for rid, op in final.items() if op["op"] == "delete"]
+    upserts = [op["row"] for op in final.values() if op["op"] == "upsert"]
+    patches = OrderedDict()
+    for rid, op in final.items():
+        if op["op"] == "patch":
+            patches.setdefault(json.dumps(op["fields"], sort_keys=True), []).append(rid)
+
+    with cache_write():
+        if deletes:
+            sb.table(CRM_TABLE).delete().in_("id", deletes).execute()
+            _cache_drop(deletes)
+        if upserts:
+            resp = sb.table(CRM_TABLE).upsert(upserts).execute()
+            _cache_put(resp.data)
+        for fields, rids in patches.items():
+            resp = sb.table(CRM_TABLE).update(json.loads(fields)).in_("id", rids).execute()
+            _cache_put(resp.data)
+
+    if undo_ops:
+        try:
+            _push_undo(sb, [op["entry"] for op in undo_ops], [op.get("op_id") for op in undo_ops])
+        except Exception:
+            # sin conexión se reintenta el lote entero; si hay conexión es que falta la tabla de undo
+            sb.table(CRM_TABLE).select("id").limit(1).execute()
+
+
+def sync_write_queue():
+    """
+    Antes de escribir directo (Deshacer): manda lo pendiente, incluidas las entradas de undo,
+    si no al sincronizar pisaría lo recién escrito. Falla si no hay conexión.
+    """
+    q = get_write_queue()
+    if q is not None:
+        q.flush(wait=True)
+
+
+def overlay_pending(rows):
+    """
+    Filas (orden created_at desc) con las operaciones de la cola todavía no enviadas aplicadas encima.
+    """
+    q = get_write_queue()
+    ops = q.pending() if q is not None else []
+    if not ops:
+        return list(rows)
+
+    current = {r["id"]: r for r in rows}
+    new = {}
+    for _, op in ops:
+        if op["op"] == "undo":
+            continue
+        rid = op["id"]
+        target = current if rid in current else new
+        base = target.get(rid)
+        if op["op"] == "delete":
+            target.pop(rid, None)
+        elif op["op"] == "upsert":
+            created = base["created_at"] if base else datetime.fromtimestamp(op["ts"], timezone.utc).isoformat()
+            target[rid] = _normalize_row({**op["row"], "created_at": created})
+        elif base is not None:
+            # campos en formato Supabase (fecha YYYY-MM-DD), como en _row_payload
+            target[rid] = _normalize_row({**_row_payload(base, keep_created=True), **op["fields"]})
+    return list(reversed(new.values())) + list(current.values())
+
+
+def queued_row(rid):
+    return queued_rows([rid]).get(rid)
+
+
+def queued_rows(rids):
+    """
+    {id: fila} desde la caché en memoria + la cola, sin esperar a Supabase (así /save, /delete y los
+    recordatorios responden al instante). No se consulta la versión como en cached_rows(): eso ya es
+    ir a la BD. Las ediciones se anotan como patch de sus campos, así una caché atrasada no pisa lo que
+    cambió otro worker. Solo los ids que no estén en memoria ni en la cola se consultan, con
+    QUEUE_READ_TIMEOUT y nunca si la cola ya sabe que no hay conexión.
+    """
+    rids = set(rids)
+    q = get_write_queue()
+    with _CACHE_LOCK:
+        base = [r for r in (_CACHE["rows"] or []) if r["id"] in rids]
+    queued = {op["id"] for _, op in q.pending() if op["op"] in ("upsert", "delete")}
+    missing = rids - {r["id"] for r in base} - queued
+    if missing and not q.offline():
+        try:
+            with sb_timeout(QUEUE_READ_TIMEOUT):
+                for chunk in _batches(sorted(missing), WRITE_BATCH):
+                    resp = get_sb().table(CRM_TABLE).select("*").in_("id", chunk).execute()
+                    base += [_normalize_row(r) for r in (resp.data or [])]
+        except Exception:
+            pass  # sin conexión: solo lo que esté en la cola
+    return {r["id"]: r for r in overlay_pending(base) if r["id"] in rids}
+
+
+ROW_FIELDS = ("nombre", "telefono", "fecha", "servicio", "comentario", "recordatorio")
+WRITE_BATCH = int(os.environ.get("CRM_WRITE_BATCH") or 200)
+
+
+def _row_differs(a, b) -> bool:
+    for f in ROW_FIELDS:
+        if f == "recordatorio":
+            if bool(a.get(f, False)) != bool(b.get(f, False)):
+                return True
+        elif (a.get(f) or "").strip() != (b.get(f) or "").strip():
+            return True
+    return False
+
+
+def snapshot_delta(rows):
+    """
+    (upserts, delete_ids) para restaurar todo a un snapshot completo (formato de undo anterior).
+    Solo lo que cambió: compara el snapshot con lo actual.
+    OJO: snapshot trae fecha en DD/MM/YYYY (por nuestra app), la conversión va en _row_payload.
+    """
+    current = {r["id"]: r for r in load_data()}
+
+    target = {}
+    for r in rows or []:
+        rid = r.get("id") or str(uuid.uuid4())
+        target[rid] = {**r, "id": rid}
+
+    upserts = [r for rid, r in target.items() if rid not in current or _row_differs(current[rid], r)]
+    delete_ids = [rid for rid in current if rid not in target]
+    return upserts, delete_ids
+
+
+def _batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
 
-    sb.table(CRM_TABLE).delete().neq("id", "00000000-0000-0000-0000-000000000000").execute()
 
-    if rows:
-        ins = []
-        for r in rows:
-            ins.append({
-                "id": r.get("id") or str(uuid.uuid4()),
-                "nombre": r.get("nombre", ""),
-                "telefono": r.get("telefono", ""),
-                "fecha": ui_to_supa_date(r.get("fecha", "")),  # ✅ convertir
-                "servicio": r.get("servicio", ""),
-                "comentario": r.get("comentario", ""),
-                "recordatorio": bool(r.get("recordatorio", False)),
-            })
-        sb.table(CRM_TABLE).insert(ins).execute()
+def apply_row_changes(upserts=(), delete_ids=()):
+    """
+    Aplica un delta: borra delete_ids y vuelve a guardar upserts (filas de la app).
+    Primero intenta crm_apply_changes (una transacción, ver sql/003_apply_changes.sql);
+    si no existe, manda los mismos cambios en lotes de WRITE_BATCH.
+    Devuelve (filas guardadas normalizadas, ids borrados).
+    """
+    with cache_write():
+        return _apply_row_changes(get_sb(), upserts, delete_ids)
+
+
+def _apply_row_changes(sb, upserts, delete_ids):
+    delete_ids = [str(rid) for rid in delete_ids if rid]
+    payload = [_row_payload(r, keep_created=True) for r in upserts]
+    if not delete_ids and not payload:
+        return [], []
+
+    try:
+        resp = sb.rpc("crm_apply_changes", {"upserts": payload, "delete_ids": delete_ids}).execute()
+        _cache_drop(delete_ids)
+        _cache_put(resp.data)
+        return [_normalize_row(r) for r in (resp.data or [])], delete_ids
+    except Exception:
+        pass
+
+    saved = []
+
+    for chunk in _batches(delete_ids, WRITE_BATCH):
+        sb.table(CRM_TABLE).delete().in_("id", chunk).execute()
+        _cache_drop(chunk)
+
+    # PostgREST rellena con NULL las claves que faltan: separamos filas con/sin created_at
+    with_created = [p for p in payload if "created_at" in p]
+    without_created = [p for p in payload if "created_at" not in p]
+    for group in (with_created, without_created):
+        for chunk in _batches(group, WRITE_BATCH):
+            resp = sb.table(CRM_TABLE).upsert(chunk).execute()
+            _cache_put(resp.data)
+            saved.extend(_normalize_row(r) for r in (resp.data or []))
+    return saved, delete_ids
+
+
+def apply_undo(snap, sid):
+    """
+    Aplica la entrada de undo `sid` y la saca de UNDO_TABLE. Devuelve (filas restauradas, ids borrados).
+    crm_apply_undo (sql/004_undo_functions.sql) borra la entrada y aplica el delta en una transacción:
+    dos Deshacer a la vez no aplican la misma entrada (el segundo no hace nada) y si algo falla la
+    entrada queda. Sin la función se aplica y después se borra, como antes.
+    """
+    if isinstance(snap, list):
+        # snapshot completo guardado por versiones anteriores
+        upserts, delete_ids = snapshot_delta(snap)
+    else:
+        upserts, delete_ids = snap.get("restore") or [], snap.get("remove") or []
+
+    delete_ids = [str(rid) for rid in delete_ids if rid]
+    payload = [_row_payload(r, keep_created=True) for r in upserts]
+    with cache_write():
+        sb = get_sb()
+        try:
+            resp = sb.rpc("crm_apply_undo", {"undo_id": sid, "upserts": payload, "delete_ids": delete_ids}).execute()
+        except Exception:
+            resp = None
+        if resp is not None:
+            out = resp.data
+            if not out:
+                return [], []  # otro request ya la aplicó
+            _cache_drop(delete_ids)
+            _cache_put(out["rows"])
+            _CACHE["undo"] = (_CACHE["synced"], bool(out.get("more")))
+            return [_normalize_row(r) for r in out["rows"]], delete_ids
+        done = _apply_row_changes(sb, upserts, delete_ids)
+    drop_undo_snapshot(sid)
+    return done
 
 
 # ---------- validación ----------
@@ -256,59 +1775,10 @@ HTML = r"""
   <meta name="theme-color" content="#2563eb"/>
   <title>CRM Salón</title>
 
-  <style>
-    body { font-family: Arial, sans-serif; margin: 14px; background:#f6f7fb; }
-    .wrap { max-width: 1100px; margin: 0 auto; }
-    .card { background: white; border-radius: 14px; padding: 14px; box-shadow: 0 6px 18px rgba(0,0,0,.06); margin-bottom: 12px; }
-    h1 { margin: 0 0 10px 0; font-size: 20px; }
-    .grid { display:grid; grid-template-columns: 1fr 1fr; gap: 10px; }
-    .grid3 { display:grid; grid-template-columns: 1fr 1fr 1fr; gap: 10px; }
-    label { font-size: 12px; color: #333; }
-    input, select, textarea { width: 100%; padding: 10px; border-radius: 10px; border: 1px solid #d9dbe7; font-size: 14px; background:#fff; }
-    textarea { min-height: 70px; resize: vertical; }
-    .row { display:flex; gap:10px; flex-wrap: wrap; align-items: center; }
-    .btn { padding: 10px 12px; border-radius: 10px; border: 0; cursor:pointer; font-weight:700; text-decoration:none; display:inline-block; }
-    .btn-primary { background:#2563eb; color:#fff; }
-    .btn-danger { background:#ef4444; color:#fff; }
-    .btn-ghost { background:#eef2ff; }
-    .btn-ok { background:#16a34a; color:#fff; }
-    .btn-warn { background:#f59e0b; color:#111827; }
-    .btn-dark { background:#111827; color:#fff; }
-    .muted { color:#555; font-size: 13px; }
-    .banner { font-weight: 800; font-size: 14px; }
-    .error { color:#b91c1c; font-weight:700; }
-
-    table { width:100%; border-collapse: collapse; overflow:hidden; border-radius: 12px; }
-    th, td { border: 1px solid #e6e8f2; padding: 10px; text-align: center; vertical-align: middle; font-size: 14px; }
-    th { background:#d9ead3; font-size: 13px; }
-    td.comment { text-align:left; white-space: pre-wrap; }
-    tr.due { background: #fff2cc; }
-    tr:hover { outline: 2px solid rgba(37,99,235,.15); }
-
-    th.rem, td.rem { width: 62px; padding-left: 6px; padding-right: 6px; }
-    th.act, td.act { width: 62px; padding-left: 6px; padding-right: 6px; }
-
-    .chk { width: 22px; height: 22px; accent-color: #16a34a; cursor: pointer; }
-    .chkWrap { display:flex; justify-content:center; align-items:center; }
-
-    .tableWrap{
-      overflow:auto;
-      max-height: 58vh;
-      -webkit-overflow-scrolling: touch;
-      margin-top:10px;
-      border-radius: 12px;
-    }
-
-    @media (max-width: 820px){
-      .grid, .grid3 { grid-template-columns: 1fr; }
-      th, td { font-size: 13px; padding: 8px; }
-      th.rem, td.rem, th.act, td.act { width: 56px; }
-      .tableWrap{ max-height: 52vh; }
-    }
-  </style>
+  <link rel="stylesheet" href="{{ asset_url('crm.css') }}">
 </head>
 
-<body>
+<body data-today-iso="{{ today_iso }}" data-today-ddmmyyyy="{{ today_ddmmyyyy }}" data-feed="{{ feed_id }}"{% if feed_on %} data-feed-on="1"{% endif %}>
 <div class="wrap">
 
   <div class="card">
@@ -322,9 +1792,9 @@ HTML = r"""
       <button class="btn btn-dark" type="button" onclick="goFullscreen()">⛶ Pantalla completa</button>
     </div>
 
-    {% if error %}
-      <p class="error">⚠️ {{ error }}</p>
-    {% endif %}
+    <p class="error" id="errorMsg"{% if not error %} style="display:none;"{% endif %}>
+      {% if error %}⚠️ {{ error }}{% endif %}
+    </p>
   </div>
 
   <div class="card">
@@ -365,287 +1835,864 @@ HTML = r"""
         </div>
       </div>
 
-      <div style="margin-top:10px;">
-        <label>COMENTARIO</label>
-        <textarea name="comentario" id="comentario" placeholder="Ej: Se usó black y brown..." autocomplete="off"></textarea>
-      </div>
+      <div style="margin-top:10px;">
+        <label>COMENTARIO</label>
+        <textarea name="comentario" id="comentario" placeholder="Ej: Se usó black y brown..." autocomplete="off"></textarea>
+      </div>
+
+      <div class="row" style="margin-top:12px;">
+        <button class="btn btn-primary" type="submit">💾 Guardar (Agregar/Actualizar)</button>
+        <button class="btn btn-ghost" type="button" onclick="clearForm()">🧹 Limpiar</button>
+
+        <button class="btn btn-warn" type="submit" id="undoBtn"
+                formaction="/undo" formmethod="post" formnovalidate
+                {% if not can_undo %}disabled{% endif %}>
+          ↩️ Deshacer
+        </button>
+
+        <a class="btn btn-ok" href="/export">📤 Exportar</a>
+        <a class="btn btn-ghost" href="/reminders">🔔 Recordatorios</a>
+      </div>
+    </form>
+  </div>
+
+  <div class="card">
+    <div class="row" style="justify-content:space-between;">
+      <div style="flex:1; min-width:240px;">
+        <label>Filtrar (en vivo)</label>
+        <input id="q" placeholder="Escribe para filtrar..." autocomplete="off">
+        <div class="muted" id="countInfo" style="margin-top:6px;"></div>
+      </div>
+    </div>
+
+    <div class="tableWrap">
+      <table>
+        <thead>
+          <tr>
+            <th>NOMBRE</th>
+            <th>TELEFONO</th>
+            <th>FECHA</th>
+            <th>RETOQUE</th>
+            <th>SERVICIO</th>
+            <th>COMENTARIO</th>
+            <th class="rem">REC.</th>
+            <th class="act">ACC.</th>
+          </tr>
+        </thead>
+
+        <tbody id="tbodyRows"></tbody>
+      </table>
+      <script id="rowsData" type="application/json">{{ compact_rows(rows)|tojson }}</script>
+      <div id="moreRows" class="muted" data-next="{{ next_cursor or '' }}"
+           style="padding:10px; text-align:center;{% if not next_cursor %} display:none;{% endif %}">
+        Cargando más...
+      </div>
+    </div>
+  </div>
+
+</div>
+
+<script src="{{ asset_url('crm.js') }}"></script>
+</body>
+</html>
+"""
+
+
+REMINDERS_HTML = r"""
+<!doctype html>
+<html lang="es">
+<head>
+  <meta charset="utf-8"/>
+  <meta name="viewport" content="width=device-width, initial-scale=1, viewport-fit=cover"/>
+  <meta name="theme-color" content="#2563eb"/>
+  <title>Recordatorios · CRM Salón</title>
+
+  <link rel="stylesheet" href="{{ asset_url('crm.css') }}">
+</head>
+
+<body>
+<div class="wrap">
+  <div class="card">
+    <div class="row" style="justify-content:space-between;">
+      <h1>🔔 Recordatorios pendientes ({{ total }})</h1>
+      <a class="btn btn-ghost" href="/">← Volver</a>
+    </div>
+    <div class="muted">Clientes con retoque vencido y sin recordatorio enviado, del más antiguo al más reciente.</div>
+  </div>
+
+  <div class="card">
+    <table>
+      <thead>
+        <tr>
+          <th>NOMBRE</th>
+          <th>TELEFONO</th>
+          <th>RETOQUE</th>
+          <th>SERVICIO</th>
+          <th>COMENTARIO</th>
+          <th>REC.</th>
+        </tr>
+      </thead>
+      <tbody>
+        {% for r in rows %}
+          <tr class="due">
+            <td><b>{{ r.nombre }}</b></td>
+            <td>{{ r.telefono }}</td>
+            <td>{{ r.retoque }}</td>
+            <td>{{ r.servicio }}</td>
+            <td class="comment">{{ r.comentario }}</td>
+            <td><input class="chk pick" type="checkbox" value="{{ r.id }}"></td>
+          </tr>
+        {% endfor %}
+
+        {% if rows|length == 0 %}
+          <tr><td colspan="6" class="muted">No hay recordatorios pendientes.</td></tr>
+        {% endif %}
+      </tbody>
+    </table>
+
+    <div class="row" style="margin-top:12px;">
+      <button class="btn btn-ok" type="button" id="markBtn" onclick="markSelected()" disabled>✅ Marcar enviados (0)</button>
+      {% if next_cursor %}
+        <a class="btn btn-ghost" href="/reminders?cursor={{ next_cursor|urlencode }}">Siguientes →</a>
+      {% endif %}
+    </div>
+  </div>
+</div>
+
+<script>
+  function picked(){
+    return Array.from(document.querySelectorAll(".pick:checked"));
+  }
+
+  function updateMarkBtn(){
+    const n = picked().length;
+    const btn = document.getElementById("markBtn");
+    btn.textContent = `✅ Marcar enviados (${n})`;
+    btn.disabled = n === 0;
+  }
+
+  async function markSelected(){
+    const chks = picked();
+    if(!chks.length || !confirm(`¿Se les envió recordatorio a ${chks.length} clientes?`)) return;
+
+    const resp = await fetch("/reminders/bulk", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ ids: chks.map(c => c.value), target: true }),
+    });
+    const data = await resp.json();
+    if(!resp.ok || !data.ok){
+      alert(`No se pudo guardar: ${data.error || resp.statusText}`);
+      return;
+    }
+    for(const c of chks) c.closest("tr").remove();
+    updateMarkBtn();
+  }
+
+  document.querySelectorAll(".pick").forEach(c => c.addEventListener("change", updateMarkBtn));
+</script>
+</body>
+</html>
+"""
+
+
+# ---------- templates y estáticos ----------
+STATIC_MAX_AGE = 365 * 24 * 3600
+STREAM_BUFFER = 50  # trozos de template por escritura al socket
+
+
+def _asset_hash(name: str) -> str:
+    with open(os.path.join(APP.static_folder, name), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+# hash del contenido en la URL: el navegador puede guardarlos un año y un deploy nuevo cambia la URL
+ASSET_HASHES = {name: _asset_hash(name) for name in ("crm.css", "crm.js")}
+
+
+@APP.template_global()
+def asset_url(name: str) -> str:
+    return f"/static/{name}?v={ASSET_HASHES[name]}"
+
+
+@APP.after_request
+def static_cache_headers(resp):
+    if request.endpoint == "static" and request.args.get("v"):
+        resp.cache_control.no_cache = None
+        resp.cache_control.public = True
+        resp.cache_control.max_age = STATIC_MAX_AGE
+        resp.cache_control.immutable = True
+    return resp
+
+
+# compilados una sola vez al importar
+INDEX_TEMPLATE = APP.jinja_env.from_string(HTML)
+REMINDERS_TEMPLATE = APP.jinja_env.from_string(REMINDERS_HTML)
+
+
+def stream_page(template, **context):
+    """
+    Como flask.stream_template, pero juntando trozos: la cabecera y el formulario salen
+    antes de que se terminen de renderizar las filas.
+    """
+    APP.update_template_context(context)
+    stream = template.stream(context)
+    stream.enable_buffering(STREAM_BUFFER)
+    return Response(stream_with_context(stream), mimetype="text/html")
+
+
+# ---------- HTTP cache (ETag / 304) ----------
+HTTP_CACHE_STATS = {"hits": 0, "misses": 0}
+
+
+def data_etag(*parts):
+    """
+    ETag a partir de la versión de datos (count + max updated_at) y lo que además cambie la respuesta.
+    None si no hay versión: entonces no se cachea.
+    """
+    ver = db_version()
+    if ver is None:
+        return None
+    q = get_write_queue()
+    marker = q.marker() if q is not None else ()
+    raw = "|".join(str(p) for p in (*ver, *marker, *parts))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24]
+
+
+def not_modified(etag):
+    """
+    304 si el cliente ya tiene esta versión (If-None-Match), sin leer la tabla ni renderizar.
+    """
+    if not etag:
+        return None
+    if etag in request.if_none_match:
+        HTTP_CACHE_STATS["hits"] += 1
+        APP.logger.info("etag hit %s %s (hits=%d misses=%d)", request.path, etag,
+                        HTTP_CACHE_STATS["hits"], HTTP_CACHE_STATS["misses"])
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        resp.cache_control.no_cache = True
+        return resp
+
+    HTTP_CACHE_STATS["misses"] += 1
+    APP.logger.info("etag miss %s (hits=%d misses=%d)", request.path,
+                    HTTP_CACHE_STATS["hits"], HTTP_CACHE_STATS["misses"])
+    return None
+
+
+def with_etag(resp, etag):
+    if not etag:
+        return resp
+    resp.set_etag(etag)
+    # el navegador puede guardar la respuesta pero debe revalidar cada vez
+    resp.cache_control.no_cache = True
+    top = (g.get("data_version") or (0, ""))[1]
+    if top:
+        try:
+            # el día también cuenta: las filas "due" cambian a medianoche
+            midnight = datetime.now().astimezone().replace(hour=0, minute=0, second=0, microsecond=0)
+            resp.last_modified = max(datetime.fromisoformat(top), midnight)
+        except ValueError:
+            pass
+    return resp
+
+
+# ---------- cambios en vivo (SSE) ----------
+# Un hilo por worker consulta cada CRM_FEED_INTERVAL segundos qué filas cambiaron (crm_changes,
+# ver sql/007_change_log.sql; si no existe, por updated_at), actualiza la caché solo con esas filas
+# (sin recargar la tabla, ver ChangeFeed.poll) y las empuja a los navegadores abiertos por GET /events (Server-Sent Events).
+# Desactivado por defecto. Cada conexión SSE ocupa un hilo mientras la pestaña esté abierta:
+# activarlo (CRM_FEED_INTERVAL=2) solo con un servidor con hilos, ver start.sh.
+CHANGES_TABLE = "crm_changes"
+FEED_INTERVAL = float(os.environ.get("CRM_FEED_INTERVAL") or 0)  # 0 = sin feed
+FEED_BATCH = 500
+FEED_BACKLOG = 1000  # eventos que se guardan para reconectar (Last-Event-ID)
+FEED_KEEPALIVE = 15
+
+
+class ChangeFeed:
+    """
+    Posición global (igual en todos los workers): "L<seq>" con crm_changes, "T<updated_at>" sin ella.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs = []
+        self._backlog = deque(maxlen=FEED_BACKLOG)
+        self._backlog_from = None  # desde qué posición el backlog está completo
+        self._thread = None
+        self.mode = None  # "log" / "updated_at"
+        self.pos = None
+        self.ids = None  # solo modo updated_at: para detectar borrados
+        self.stats = {"polls": 0, "events": 0, "errors": 0, "last_error": "", "last_poll": None}
+
+    # ----- consulta -----
+    def _poll_log(self, sb):
+        if self.pos is None:
+            resp = sb.table(CHANGES_TABLE).select("seq").order("seq", desc=True).limit(1).execute()
+            self.pos = int((resp.data or [{"seq": 0}])[0]["seq"])
+            return []
+
+        resp = (
+            sb.table(CHANGES_TABLE)
+            .select("seq,record_id")
+            .gt("seq", self.pos)
+            .order("seq")
+            .limit(FEED_BATCH)
+            .execute()
+        )
+        log = resp.data or []
+        if not log:
+            return []
+        self.pos = int(log[-1]["seq"])
+
+        # estado final de cada fila tocada (varias operaciones sobre la misma fila = un evento)
+        rids = list(dict.fromkeys(str(c["record_id"]) for c in log))
+        raw = []
+        for chunk in _batches(rids, WRITE_BATCH):
+            raw.extend(sb.table(CRM_TABLE).select("*").in_("id", chunk).execute().data or [])
+        found = {str(r.get("id")) for r in raw}
+        return [(f"L{self.pos}", raw, [rid for rid in rids if rid not in found])]
+
+    def _poll_updated(self, sb):
+        if self.pos is None:
+            ver = db_version()
+            if ver is None:
+                raise RuntimeError("sin crm_changes ni updated_at: no hay feed")
+            self.pos = ver[1]
+            self.ids = {str(r["id"]) for r in (sb.table(CRM_TABLE).select("id").execute().data or [])}
+            return []
+
+        resp = (
+            sb.table(CRM_TABLE)
+            .select("*")
+            .gt("updated_at", self.pos)
+            .order("updated_at")
+            .limit(FEED_BATCH)
+            .execute()
+        )
+        raw = resp.data or []
+        if raw:
+            self.pos = raw[-1]["updated_at"]
+
+        # borrados: solo si la cantidad de filas no cuadra se vuelve a pedir la lista de ids
+        new_ids = {str(r.get("id")) for r in raw} - self.ids
+        ver = db_version()
+        deleted = []
+        if ver is None or ver[0] != len(self.ids) + len(new_ids):
+            ids = {str(r["id"]) for r in (sb.table(CRM_TABLE).select("id").execute().data or [])}
+            deleted = sorted(self.ids - ids)
+            self.ids = ids
+        else:
+            self.ids |= new_ids
+
+        if not raw and not deleted:
+            return []
+        return [(f"T{self.pos}", raw, deleted)]
+
+    def _poll(self, sb):
+        if self.mode is None:
+            try:
+                changes = self._poll_log(sb)
+                self.mode = "log"
+            except Exception:
+                self.pos = None
+                changes = self._poll_updated(sb)
+                self.mode = "updated_at"
+        elif self.mode == "log":
+            changes = self._poll_log(sb)
+        else:
+            changes = self._poll_updated(sb)
+        return changes
+
+    def poll(self) -> int:
+        """
+        Consulta una vez y aplica los cambios a la caché de este worker. El feed aplica todo cambio
+        que ve, así que si la caché no estaba marcada para recargar y después de aplicar coincide
+        con la versión de la BD, queda al día: la próxima lectura es un acierto, no una recarga.
+        """
+        sb = get_sb()
+        n = 0
+        with cache_write(check=False):
+            changes = self._poll(sb)
+            self.stats["polls"] += 1
+            self.stats["last_poll"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+            if self._backlog_from is None:
+                self._backlog_from = self.position()
+            for pos, raw, deleted in changes:
+                _cache_drop(deleted)
+                _cache_put(raw)
+                events = [{"op": "upsert", "row": r} for r in present_rows(_normalize_row(x) for x in raw)]
+                events += [{"op": "delete", "id": rid} for rid in deleted]
+                self.publish(pos, events)
+                n += len(events)
+        if n:
+            # un lote incompleto (FEED_BATCH) o una escritura en el medio: se recarga en la próxima lectura
+            ver = db_version(fresh=True)
+            with _CACHE_LOCK:
+                if _CACHE["synced"] != ver:
+                    _CACHE["synced"] = None
+        return n
+
+    def _run(self):
+        delay = FEED_INTERVAL
+        while True:
+            time.sleep(delay)
+            if self.pos is not None and not self._subs:
+                continue  # nadie escuchando: no se consulta la BD
+            try:
+                self.poll()
+                delay = FEED_INTERVAL
+            except Exception as e:
+                self.stats["errors"] += 1
+                self.stats["last_error"] = str(e).replace("\n", " ")[:200]
+                delay = min(60.0, delay * 2)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="crm-change-feed", daemon=True)
+            self._thread.start()
+
+    # ----- suscriptores -----
+    def position(self) -> str:
+        if self.pos is None:
+            return ""
+        return f"{'L' if self.mode == 'log' else 'T'}{self.pos}"
+
+    def publish(self, pos: str, events):
+        with self._lock:
+            for ev in events:
+                if len(self._backlog) == self._backlog.maxlen:
+                    self._backlog_from = self._backlog[0][0]
+                self._backlog.append((pos, ev))
+                self.stats["events"] += 1
+            for sub in list(self._subs):
+                try:
+                    for ev in events:
+                        sub.put_nowait((pos, ev))
+                except queue.Full:
+                    # cliente demasiado lento: se corta la conexión y al reconectar recupera del backlog
+                    self._subs.remove(sub)
+                    while not sub.empty():
+                        sub.get_nowait()
+                    sub.put_nowait((None, None))
+
+    def subscribe(self, since: str = ""):
+        """
+        (cola de eventos nuevos, eventos posteriores a `since` o None si ya no se pueden recuperar).
+        """
+        sub = queue.Queue(maxsize=FEED_BACKLOG)
+        with self._lock:
+            self._subs.append(sub)
+            return sub, self._missed(since)
+
+    def _missed(self, since: str):
+        current = self.position()
+        if not since or not current or since == current:
+            return []
+        kind = current[:1]
+        if since[:1] != kind:
+            return None
+        value = _feed_key(kind, since[1:])
+        if value > _feed_key(kind, current[1:]):
+            return []  # este worker va atrasado: los verá en la próxima consulta
+        if self._backlog_from is None or value < _feed_key(kind, self._backlog_from[1:]):
+            return None
+        return [(p, ev) for p, ev in self._backlog if _feed_key(kind, p[1:]) > value]
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            if sub in self._subs:
+                self._subs.remove(sub)
+
+    def info(self) -> dict:
+        return {**self.stats, "mode": self.mode, "position": self.position(), "subscribers": len(self._subs)}
+
+
+def _feed_key(kind: str, value: str):
+    if kind == "L":
+        try:
+            return int(value)
+        except ValueError:
+            return -1
+    return value
+
 
-      <div class="row" style="margin-top:12px;">
-        <button class="btn btn-primary" type="submit">💾 Guardar (Agregar/Actualizar)</button>
-        <button class="btn btn-ghost" type="button" onclick="clearForm()">🧹 Limpiar</button>
+_FEED = {"feed": None, "pid": None}
 
-        <button class="btn btn-warn" type="submit"
-                formaction="/undo" formmethod="post" formnovalidate
-                {% if not can_undo %}disabled{% endif %}>
-          ↩️ Deshacer
-        </button>
 
-        <a class="btn btn-ok" href="/export">📤 Exportar</a>
-      </div>
-    </form>
-  </div>
+def get_change_feed():
+    """
+    Feed de este proceso (None con CRM_FEED_INTERVAL=0). Arranca el hilo la primera vez.
+    """
+    if FEED_INTERVAL <= 0:
+        return None
+    if _FEED["feed"] is None or _FEED["pid"] != os.getpid():
+        with _SB_LOCK:
+            if _FEED["feed"] is None or _FEED["pid"] != os.getpid():
+                feed = ChangeFeed()
+                feed.start()
+                _FEED.update(feed=feed, pid=os.getpid())
+    return _FEED["feed"]
 
-  <div class="card">
-    <div class="row" style="justify-content:space-between;">
-      <div style="flex:1; min-width:240px;">
-        <label>Filtrar (en vivo)</label>
-        <input id="q" placeholder="Escribe para filtrar..." autocomplete="off">
-        <div class="muted" id="countInfo" style="margin-top:6px;"></div>
-      </div>
-    </div>
 
-    <div class="tableWrap">
-      <table>
-        <thead>
-          <tr>
-            <th>NOMBRE</th>
-            <th>TELEFONO</th>
-            <th>FECHA</th>
-            <th>RETOQUE</th>
-            <th>SERVICIO</th>
-            <th>COMENTARIO</th>
-            <th class="rem">REC.</th>
-            <th class="act">ACC.</th>
-          </tr>
-        </thead>
+@APP.before_request
+def start_change_feed():
+    get_change_feed()
 
-        <tbody id="tbodyRows">
-          {% for r in rows %}
-            <tr class="{{ r.row_class }}"
-                data-search="{{ (r.nombre ~ ' ' ~ r.telefono ~ ' ' ~ r.fecha ~ ' ' ~ r.servicio ~ ' ' ~ r.comentario)|lower }}"
-                onclick='loadRow({{ r|tojson }})'
-                style="cursor:pointer;">
-              <td><b>{{ r.nombre }}</b></td>
-              <td>{{ r.telefono }}</td>
-              <td>{{ r.fecha }}</td>
-              <td>{{ r.retoque }}</td>
-              <td>{{ r.servicio }}</td>
-              <td class="comment">{{ r.comentario }}</td>
-
-              <td class="rem" onclick="event.stopPropagation();">
-                <form method="post" action="/toggle_reminder" style="margin:0;" onclick="event.stopPropagation();">
-                  <input type="hidden" name="id" value="{{ r.id }}">
-                  <input type="hidden" name="target" value="">
-                  <div class="chkWrap">
-                    <input class="chk" type="checkbox"
-                           {% if r.recordatorio %}checked{% endif %}
-                           onclick="event.stopPropagation();"
-                           onchange="confirmReminder(this);">
-                  </div>
-                </form>
-              </td>
-
-              <td class="act" onclick="event.stopPropagation();">
-                <form method="post" action="/delete"
-                      onsubmit="return confirm('¿Eliminar este registro?');"
-                      style="margin:0;" onclick="event.stopPropagation();">
-                  <input type="hidden" name="id" value="{{ r.id }}">
-                  <button class="btn btn-danger" type="submit" onclick="event.stopPropagation();">🗑️</button>
-                </form>
-              </td>
-            </tr>
-          {% endfor %}
-
-          {% if rows|length == 0 %}
-            <tr><td colspan="8" class="muted">No hay resultados.</td></tr>
-          {% endif %}
-        </tbody>
-      </table>
-    </div>
-  </div>
 
-</div>
+def _sse(pos, ev) -> str:
+    data = json.dumps(ev, ensure_ascii=False)
+    return f"id: {pos}\nevent: {ev['op']}\ndata: {data}\n\n"
 
-<script>
-  function goFullscreen(){
-    const el = document.documentElement;
-    if (el.requestFullscreen) el.requestFullscreen();
-    else if (el.webkitRequestFullscreen) el.webkitRequestFullscreen();
-  }
 
-  function dateValueToDDMMYYYY(val){
-    const parts = (val || "").split("-");
-    if(parts.length !== 3) return "";
-    const yy = parts[0], mm = parts[1], dd = parts[2];
-    if(!yy || !mm || !dd) return "";
-    return `${dd}/${mm}/${yy}`;
-  }
+@APP.get("/events")
+def events():
+    """
+    Cambios de filas por Server-Sent Events: event upsert {row}, delete {id}, y reset
+    (se perdieron eventos: el navegador tiene que recargar).
+    """
+    feed = get_change_feed()
+    if feed is None:
+        return Response("feed desactivado (CRM_FEED_INTERVAL=0)", status=404)
 
-  function ddmmyyyyToDateValue(ddmmyyyy){
-    const parts = (ddmmyyyy || "").split("/");
-    if(parts.length !== 3) return "";
-    const dd = parts[0], mm = parts[1], yy = parts[2];
-    if(dd.length!==2 || mm.length!==2 || yy.length!==4) return "";
-    return `${yy}-${mm}-${dd}`;
-  }
+    since = request.headers.get("Last-Event-ID") or request.args.get("since") or ""
+    sub, missed = feed.subscribe(since)
 
-  function computeRetouchFromHidden(servicio){
-    const ddmmyyyy = document.getElementById("fecha_hidden").value.trim();
-    try{
-      const parts = ddmmyyyy.split("/");
-      if(parts.length !== 3) return "";
-      const d = parseInt(parts[0],10), m = parseInt(parts[1],10)-1, y = parseInt(parts[2],10);
-      const dt = new Date(y, m, d);
-      if(isNaN(dt.getTime())) return "";
-      const isRet = (servicio || "").trim().toUpperCase() === "RETOQUE";
-      const days = isRet ? 365 : 21; // ✅ 21 para todos, 365 si RETOQUE
-      dt.setDate(dt.getDate() + days);
-      const dd = String(dt.getDate()).padStart(2,"0");
-      const mm = String(dt.getMonth()+1).padStart(2,"0");
-      const yy = dt.getFullYear();
-      return `${dd}/${mm}/${yy}`;
-    }catch(e){ return ""; }
-  }
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            if missed is None:
+                yield f"id: {feed.position()}\nevent: reset\ndata: {{}}\n\n"
+            else:
+                for pos, ev in missed:
+                    yield _sse(pos, ev)
+            while True:
+                try:
+                    pos, ev = sub.get(timeout=FEED_KEEPALIVE)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                if ev is None:
+                    return
+                yield _sse(pos, ev)
+        finally:
+            feed.unsubscribe(sub)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-  function updateRetouch(){
-    const s = document.getElementById("servicio").value.trim();
-    document.getElementById("retoque").value = computeRetouchFromHidden(s);
-  }
 
-  function syncHiddenFromPicker(){
-    const picker = document.getElementById("fecha_picker");
-    const hidden = document.getElementById("fecha_hidden");
-    const ddmmyyyy = dateValueToDDMMYYYY(picker.value);
-    if(ddmmyyyy) hidden.value = ddmmyyyy;
-    updateRetouch();
-  }
+@APP.get("/health")
+def health():
+    ok = sb_health_check()
+    return {
+        "ok": ok,
+        "supabase": sb_stats(),
+        "cache": dict(CACHE_STATS),
+        "export_cache": dict(EXPORT_STATS, items=len(_EXPORT_CACHE)),
+        "http_cache": dict(HTTP_CACHE_STATS),
+        "write_queue": (get_write_queue().info() if WRITE_QUEUE_PATH else None),
+        "feed": (get_change_feed().info() if FEED_INTERVAL > 0 else None),
+    }, (200 if ok else 503)
 
-  function loadRow(r){
-    document.getElementById("rid").value = r.id || "";
-    document.getElementById("nombre").value = r.nombre || "";
-    document.getElementById("telefono").value = r.telefono || "";
-    document.getElementById("servicio").value = r.servicio || "";
-    document.getElementById("comentario").value = r.comentario || "";
-
-    const picker = document.getElementById("fecha_picker");
-    const hidden = document.getElementById("fecha_hidden");
-    hidden.value = r.fecha || hidden.value;
-    const iso = ddmmyyyyToDateValue(hidden.value);
-    if(iso) picker.value = iso;
-
-    updateRetouch();
-    window.scrollTo({ top: 0, behavior: "smooth" });
-  }
 
-  function clearForm(){
-    document.getElementById("rid").value = "";
-    document.getElementById("nombre").value = "";
-    document.getElementById("telefono").value = "";
-    document.getElementById("servicio").value = "";
-    document.getElementById("comentario").value = "";
+def present_rows(data):
+    """
+    Filas para responder JSON: dicts con la clase de fila (due) para la tabla.
+    La tabla de la página principal va con compact_rows.
+    """
+    data = list(data)
+    flags = due_flags(r["retoque"] for r in data)
+    return [r.to_dict(row_class=("due" if due else "")) for r, due in zip(data, flags)]
 
-    document.getElementById("fecha_picker").value = "{{ today_iso }}";
-    document.getElementById("fecha_hidden").value = "{{ today_ddmmyyyy }}";
 
-    updateRetouch();
-  }
+TABLE_COLUMNS = ("id", "created_at", "nombre", "telefono", "fecha", "retoque",
+                 "servicio", "comentario", "recordatorio")
 
-  function confirmReminder(chk){
-    const form = chk.closest("form");
-    const targetInput = form.querySelector('input[name="target"]');
-    const want = chk.checked ? "1" : "0";
-    targetInput.value = want;
-
-    const msg = (want === "1")
-      ? "¿Se le envió recordatorio?\n\nSí = marcar / No = no marcar"
-      : "¿Quitar marca de recordatorio?\n\nSí = quitar / No = mantener";
-
-    const ok = confirm(msg);
-    if(ok){
-      form.submit();
-    } else {
-      chk.checked = !chk.checked;
-    }
-  }
 
-  function applyFilterLive(){
-    const q = (document.getElementById("q").value || "").trim().toLowerCase();
-    const tbody = document.getElementById("tbodyRows");
-    const trs = Array.from(tbody.querySelectorAll("tr"));
-
-    let shown = 0;
-    let total = 0;
-
-    for(const tr of trs){
-      if(tr.children.length < 2) continue;
-      total += 1;
-      const hay = (tr.getAttribute("data-search") || "");
-      const ok = !q || hay.includes(q);
-      tr.style.display = ok ? "" : "none";
-      if(ok) shown += 1;
+@APP.template_global()
+def compact_rows(data):
+    """
+    Filas para la tabla del navegador sin repetir las claves: {"cols": [...], "rows": [[...], ...]}.
+    crm.js arma con esto el índice de búsqueda y dibuja solo las filas visibles.
+    """
+    data = list(data)
+    flags = due_flags(r["retoque"] for r in data)
+    return {
+        "cols": [*TABLE_COLUMNS, "row_class"],
+        "rows": [[r[c] for c in TABLE_COLUMNS] + ["due" if due else ""] for r, due in zip(data, flags)],
     }
 
-    document.getElementById("countInfo").textContent = `Mostrando ${shown} de ${total} registros`;
-  }
 
-  document.getElementById("q").addEventListener("input", applyFilterLive);
-  document.getElementById("fecha_picker").addEventListener("change", syncHiddenFromPicker);
-  document.getElementById("servicio").addEventListener("change", updateRetouch);
+_SUMMARY = {"key": None, "value": None}
 
-  syncHiddenFromPicker();
-  applyFilterLive();
-</script>
-</body>
-</html>
-"""
 
+def retouch_summary():
+    """
+    {"nearest": fecha de retoque más cercana, "due": cuántos ya tocan, "week": cuántos tocan en 7 días}
+    con consultas por índice sobre fecha_retoque. Se recalcula solo si cambian los datos o el día.
+    None si la BD no tiene la columna.
+    """
+    today = datetime.now().date()
+    ver = db_version()
+    key = (today, ver)
+    if ver is not None and _SUMMARY["key"] == key:
+        return _SUMMARY["value"]
 
-@APP.get("/")
-def index():
-    data = load_data()
+    try:
+        sb = get_sb()
+        first = sb.table(CRM_TABLE).select("fecha_retoque").order("fecha_retoque").limit(1).execute()
+        due = (
+            sb.table(CRM_TABLE).select("id", count="exact")
+            .lte("fecha_retoque", today.isoformat())
+            .limit(1).execute()
+        )
+        week = (
+            sb.table(CRM_TABLE).select("id", count="exact")
+            .gt("fecha_retoque", today.isoformat())
+            .lte("fecha_retoque", (today + timedelta(days=7)).isoformat())
+            .limit(1).execute()
+        )
+    except Exception:
+        return None
 
-    rows = []
-    nearest = None
+    top = (first.data or [{}])[0].get("fecha_retoque")
+    value = {
+        "nearest": datetime.strptime(top[:10], "%Y-%m-%d").date() if top else None,
+        "due": due.count or 0,
+        "week": week.count or 0,
+    }
+    if ver is not None:
+        _SUMMARY.update(key=key, value=value)
+    return value
 
-    for r in data:
-        retoque = ""
-        due = False
-        try:
-            retoque = compute_retouch_date(r["fecha"], r["servicio"])
-            due = is_due(retoque)
-        except Exception:
-            pass
 
-        if retoque:
-            try:
-                d = parse_ddmmyyyy(retoque).date()
-                if nearest is None or d < nearest[0]:
-                    nearest = (d, retoque)
-            except Exception:
-                pass
+def retouch_summary_from_rows(data):
+    # misma respuesta que retouch_summary(), recorriendo las filas (BD sin fecha_retoque)
+    today = datetime.now().date()
+    nearest = None
+    due = week = 0
+    week_end = today + timedelta(days=7)
+    for d in map(ui_date, (r["retoque"] for r in data)):
+        if d is None:
+            continue
+        if nearest is None or d < nearest:
+            nearest = d
+        if d <= today:
+            due += 1
+        elif d <= week_end:
+            week += 1
+    return {"nearest": nearest, "due": due, "week": week}
+
+
+def compute_banner(summary) -> str:
+    nearest = summary["nearest"]
+    if not nearest:
+        return "Retoque: —"
+
+    txt = nearest.strftime("%d/%m/%Y")
+    diff = (nearest - datetime.now().date()).days
+    if diff > 0:
+        banner = f"Próximo retoque más cercano: {txt} (faltan {diff} días)"
+        if summary["week"]:
+            banner += f" · {summary['week']} esta semana"
+        return banner
+    return f"⚠️ Hay {summary['due']} retoques que ya tocan (ej: {txt})"
 
-        rows.append({**r, "retoque": retoque, "row_class": ("due" if due else "")})
 
+@APP.get("/")
+def index():
     today_iso = datetime.now().strftime("%Y-%m-%d")
     today_ddmmyyyy = datetime.now().strftime("%d/%m/%Y")
-
-    banner = "Retoque: —"
-    if nearest:
-        d, txt = nearest
-        diff = (d - datetime.now().date()).days
-        if diff > 0:
-            banner = f"Próximo retoque más cercano: {txt} (faltan {diff} días)"
-        else:
-            banner = f"⚠️ Hay retoques que ya tocan (ej: {txt})"
-
     error = request.args.get("error") or ""
-    return render_template_string(
-        HTML,
+    feed = get_change_feed()
+    feed_id = feed.position() if feed is not None else ""
+
+    etag = data_etag("index", today_iso, error, can_undo(), PAGE_SIZE, feed is not None, feed_id,
+                     *ASSET_HASHES.values())
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    next_cursor = None
+    data = None
+    if PAGE_SIZE > 0:
+        rows, next_cursor = load_page("", PAGE_SIZE)
+    else:
+        rows = data = load_data()
+
+    # ✅ el banner siempre se calcula sobre TODOS los registros, no solo la página
+    summary = retouch_summary()
+    if summary is None:
+        summary = retouch_summary_from_rows(data if data is not None else load_data())
+    banner = compute_banner(summary)
+    if g.get("offline") and not error:
+        error = "Sin conexión con Supabase: se muestran los datos guardados y los cambios pendientes."
+
+    resp = stream_page(
+        INDEX_TEMPLATE,
         rows=rows,
+        next_cursor=next_cursor,
         services=SERVICES,
         today_iso=today_iso,
         today_ddmmyyyy=today_ddmmyyyy,
         banner=banner,
         error=error,
         can_undo=can_undo(),
+        feed_id=feed_id,
+        feed_on=feed is not None,
     )
+    return with_etag(resp, etag)
+
+
+@APP.get("/rows")
+def rows_page():
+    """
+    Siguientes páginas del listado (scroll infinito): ?cursor=...&limit=...
+    """
+    cursor = (request.args.get("cursor") or "").strip()
+    try:
+        limit = int(request.args.get("limit") or PAGE_SIZE or 100)
+    except ValueError:
+        limit = PAGE_SIZE or 100
+
+    etag = data_etag("rows", cursor, limit, datetime.now().date())
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    page, next_cursor = load_page(cursor, limit)
+    return with_etag(jsonify(rows=present_rows(page), next=next_cursor), etag)
+
+
+def _reminders_args():
+    cursor = (request.args.get("cursor") or "").strip()
+    try:
+        limit = int(request.args.get("limit") or 50)
+    except ValueError:
+        limit = 50
+    return cursor, limit
+
+
+@APP.get("/reminders")
+def reminders():
+    cursor, limit = _reminders_args()
+    etag = data_etag("reminders", cursor, limit, datetime.now().date(), *ASSET_HASHES.values())
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    try:
+        rows, next_cursor, total = load_reminders(cursor, limit)
+    except ValueError as e:
+        return str(e), 400
+    resp = APP.make_response(render_template(REMINDERS_TEMPLATE, rows=rows, next_cursor=next_cursor, total=total))
+    return with_etag(resp, etag)
+
+
+@APP.get("/reminders.json")
+def reminders_json():
+    cursor, limit = _reminders_args()
+    etag = data_etag("reminders.json", cursor, limit, datetime.now().date())
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    try:
+        rows, next_cursor, total = load_reminders(cursor, limit)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return with_etag(jsonify(rows=present_rows(rows), next=next_cursor, total=total), etag)
+
+
+@APP.get("/clients")
+def clients():
+    """
+    Clientes (agrupados por teléfono o nombre), última visita primero. ?q= filtra por nombre/teléfono.
+    """
+    q = _slug(request.args.get("q") or "")
+    try:
+        limit = max(1, min(int(request.args.get("limit") or PAGE_MAX), PAGE_MAX))
+        offset = max(0, int(request.args.get("offset") or 0))
+    except ValueError:
+        return jsonify(error="limit/offset inválidos"), 400
+
+    etag = data_etag("clients", q, limit, offset, datetime.now().date())
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    summaries = client_summaries()
+    if q:
+        summaries = [c for c in summaries if q in c["key"] or q in _slug(c["nombre"])]
+    summaries.sort(key=lambda c: (ui_date(c["ultima_visita"]) or date.min, c["key"]), reverse=True)
+    page = summaries[offset:offset + limit]
+    return with_etag(jsonify(total=len(summaries), clients=page), etag)
+
+
+@APP.get("/clients/<key>")
+def client_history(key):
+    """
+    Historial de un cliente: resumen + visitas (más reciente primero). O(visitas del cliente).
+    """
+    etag = data_etag("client", key, datetime.now().date())
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    visits = sorted(client_visits(key), key=_visit_order, reverse=True)
+    if not visits:
+        return jsonify(error="Cliente no encontrado."), 404
+    summary = _client_summary(key, {r["id"]: r for r in visits})
+    return with_etag(jsonify(client=summary, visits=present_rows(visits)), etag)
+
+
+@APP.get("/search")
+def search():
+    """
+    Búsqueda en la BD: ?q=...&limit=... -> JSON ordenado por relevancia (rank 1 = mejor).
+    """
+    q = (request.args.get("q") or "").strip()
+    try:
+        limit = max(1, min(int(request.args.get("limit") or SEARCH_LIMIT), PAGE_MAX))
+    except ValueError:
+        limit = SEARCH_LIMIT
+
+    etag = data_etag("search", q, limit, datetime.now().date())
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    rows = present_rows(search_rows(q, limit=limit))
+    for i, r in enumerate(rows, start=1):
+        r["rank"] = i
+    return with_etag(jsonify(q=q, rows=rows), etag)
+
+
+def wants_json() -> bool:
+    """
+    Modo JSON para fetch (Accept: application/json): responde solo lo que cambió, sin redirect.
+    """
+    best = request.accept_mimetypes.best_match(["text/html", "application/json"])
+    return best == "application/json"
+
+
+def present_row(row):
+    return present_rows([row])[0] if row else None
+
+
+def mutation_error(msg: str, status: int = 400):
+    if wants_json():
+        return jsonify(ok=False, error=msg), status
+    return redirect(f"/?error={msg}")
 
 
 @APP.post("/save")
 def save():
-    data = load_data()
-    before = deepcopy(data)
-
     rid = (request.form.get("id") or "").strip()
     nombre = (request.form.get("nombre") or "").strip()
     telefono = (request.form.get("telefono") or "").strip()
@@ -655,7 +2702,7 @@ def save():
 
     err = validate_row(nombre, fecha, servicio)
     if err:
-        return redirect(f"/?error={err}")
+        return mutation_error(err)
 
     # ✅ Si viene rid pero NO es UUID válido, lo tratamos como nuevo
     if rid:
@@ -664,148 +2711,541 @@ def save():
         except Exception:
             rid = ""
 
-    recordatorio_actual = False
-    if rid:
-        for r in data:
-            if r.get("id") == rid:
-                recordatorio_actual = bool(r.get("recordatorio", False))
-                break
-    else:
-        rid = str(uuid.uuid4())
-
-    push_undo_snapshot(before)
-
     try:
-        save_row_upsert(
+        # solo la fila que se edita (por id), no toda la tabla
+        before = fetch_row(rid) if rid else None
+        recordatorio_actual = bool(before.get("recordatorio", False)) if before else False
+        if not rid:
+            rid = str(uuid.uuid4())
+
+        # undo: si existía se restaura como estaba, si es nuevo se borra
+        if before:
+            push_undo_snapshot(undo_entry(restore=[before]))
+        else:
+            push_undo_snapshot(undo_entry(remove=[rid]))
+
+        row = save_row_upsert(
             rid=rid,
             nombre=nombre,
             telefono=telefono,
             fecha_ui=fecha,
             servicio=servicio,
             comentario=comentario,
-            recordatorio=recordatorio_actual
+            recordatorio=recordatorio_actual,
+            existing=before is not None,
         )
     except Exception as e:
         # ✅ en vez de 500 silencioso, te muestra el error REAL
         msg = str(e).replace("\n", " ")
-        return redirect(f"/?error=Supabase error: {msg}")
+        return mutation_error(f"Supabase error: {msg}", 502)
 
+    if wants_json():
+        return jsonify(ok=True, row=present_row(row), created=before is None, can_undo=can_undo())
     return redirect("/")
 
 
 @APP.post("/delete")
 def delete():
-    data = load_data()
-    before = deepcopy(data)
-
     rid = (request.form.get("id") or "").strip()
-    if rid:
-        push_undo_snapshot(before)
-        delete_row(rid)
+    try:
+        before = fetch_row(rid)
+        if before:
+            push_undo_snapshot(undo_entry(restore=[before]))
+            delete_row(rid)
+    except Exception as e:
+        msg = str(e).replace("\n", " ")
+        return mutation_error(f"Supabase error: {msg}", 502)
 
+    if wants_json():
+        return jsonify(ok=True, deleted=([rid] if before else []), can_undo=can_undo())
     return redirect("/")
 
 
 @APP.post("/toggle_reminder")
 def toggle_reminder():
-    data = load_data()
-    before = deepcopy(data)
-
     rid = (request.form.get("id") or "").strip()
     target = (request.form.get("target") or "").strip()
     want = True if target == "1" else False
 
-    if rid:
-        push_undo_snapshot(before)
-        set_recordatorio(rid, want)
+    row = None
+    try:
+        before = fetch_row(rid)
+        if before:
+            push_undo_snapshot(undo_entry(restore=[before]))
+            row = set_recordatorio(rid, want)
+    except Exception as e:
+        msg = str(e).replace("\n", " ")
+        return mutation_error(f"Supabase error: {msg}", 502)
 
+    if wants_json():
+        return jsonify(ok=True, row=present_row(row), can_undo=can_undo())
     return redirect("/")
 
 
+REMINDERS_BULK_MAX = 1000
+
+
+@APP.post("/reminders/bulk")
+def reminders_bulk():
+    """
+    Marca/desmarca recordatorio de varias filas: JSON {"ids": [...], "target": true|false}.
+    Un solo update y una sola entrada de Deshacer; responde JSON (sin recargar la página).
+    """
+    body = request.get_json(silent=True) or {}
+    want = bool(body.get("target"))
+
+    rids = []
+    for rid in body.get("ids") or []:
+        rid = str(rid or "").strip()
+        try:
+            uuid.UUID(rid)
+        except Exception:
+            continue
+        if rid not in rids:
+            rids.append(rid)
+
+    if not rids:
+        return jsonify(ok=False, error="No hay ids válidos."), 400
+    if len(rids) > REMINDERS_BULK_MAX:
+        return jsonify(ok=False, error=f"Máximo {REMINDERS_BULK_MAX} ids por llamada."), 400
+
+    try:
+        # solo las que realmente cambian
+        before = [r for r in fetch_rows(rids) if r["recordatorio"] != want]
+        if before:
+            push_undo_snapshot(undo_entry(restore=before))
+            set_recordatorio_many([r["id"] for r in before], want)
+    except Exception as e:
+        msg = str(e).replace("\n", " ")
+        return jsonify(ok=False, error=f"Supabase error: {msg}"), 502
+
+    return jsonify(ok=True, changed=[r["id"] for r in before], target=want, can_undo=can_undo())
+
+
 @APP.post("/undo")
 def undo():
-    snap = pop_undo_snapshot()
-    if snap is None:
-        return redirect("/")
-    replace_all_rows(snap)
+    try:
+        sync_write_queue()
+    except Exception as e:
+        msg = str(e).replace("\n", " ")
+        return mutation_error(f"Sin conexión, hay cambios pendientes de sincronizar: {msg}", 503)
+
+    rows, deleted = [], []
+    try:
+        top = peek_undo_snapshot()
+        if top is not None:
+            rows, deleted = apply_undo(top[1], top[0])
+    except Exception as e:
+        msg = str(e).replace("\n", " ")
+        return mutation_error(f"Supabase error: {msg}", 502)
+
+    if wants_json():
+        return jsonify(ok=True, rows=present_rows(rows), deleted=deleted, can_undo=can_undo())
     return redirect("/")
 
 
 # ---------- Export Excel ----------
-def build_export_excel(path: str, data: list):
-    if os.path.exists(path):
-        try:
-            wb = load_workbook(path)
-            if "CRM" in wb.sheetnames:
-                ws = wb["CRM"]
-                wb.remove(ws)
-            ws = wb.create_sheet("CRM", 0)
-        except Exception:
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "CRM"
-    else:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "CRM"
+# exports ya generados, por versión de datos (LRU acotado por tamaño total)
+EXPORT_CACHE_MAX_BYTES = int(float(os.environ.get("CRM_EXPORT_CACHE_MB") or 32) * 1024 * 1024)
+EXPORT_CACHE_MAX_ITEMS = int(os.environ.get("CRM_EXPORT_CACHE_ITEMS") or 8)
+_EXPORT_CACHE = OrderedDict()
+_EXPORT_CACHE_LOCK = threading.Lock()
+EXPORT_STATS = {"hits": 0, "misses": 0, "evictions": 0}
 
-    ws.append(COLUMNS_XLSX)
-
-    for r in data:
-        retoque = ""
-        try:
-            retoque = compute_retouch_date(r["fecha"], r["servicio"])
-        except Exception:
-            pass
-        ws.append([r["nombre"], r["telefono"], r["fecha"], retoque, r["servicio"], r["comentario"]])
+EXPORT_COL_WIDTHS = {"A": 18, "B": 16, "C": 14, "D": 16, "E": 22, "F": 48}
 
-    header_fill = PatternFill("solid", fgColor="D9EAD3")
-    header_font = Font(bold=True, size=12)
-    cell_font = Font(size=11)
 
+def _export_named_styles():
+    # estilos con nombre: cada celda guarda solo la referencia, sin pasada de estilos al final
     thin = Side(style="thin", color="999999")
     border = Border(left=thin, right=thin, top=thin, bottom=thin)
     align = Alignment(horizontal="center", vertical="center", wrap_text=True)
 
-    due_fill = PatternFill("solid", fgColor="FFF2CC")
+    return [
+        NamedStyle(name="crm_header", font=Font(bold=True, size=12),
+                   fill=PatternFill("solid", fgColor="D9EAD3"), border=border, alignment=align),
+        NamedStyle(name="crm_cell", font=Font(size=11), border=border, alignment=align),
+        NamedStyle(name="crm_due", font=Font(size=11),
+                   fill=PatternFill("solid", fgColor="FFF2CC"), border=border, alignment=align),
+    ]
+
 
-    col_widths = {"A": 18, "B": 16, "C": 14, "D": 16, "E": 22, "F": 48}
-    for col, w in col_widths.items():
+def build_export_excel(out, data):
+    """
+    Escribe el Excel en modo write-only: cada fila sale ya con su estilo y no queda en memoria.
+    out = ruta o archivo binario (BytesIO para responder directo).
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("CRM")
+    for style in _export_named_styles():
+        wb.add_named_style(style)
+
+    for col, w in EXPORT_COL_WIDTHS.items():
         ws.column_dimensions[col].width = w
 
+    # alto fijo por defecto (sin un objeto por fila) y encabezado más bajo
+    ws.sheet_format.defaultRowHeight = 42
+    ws.sheet_format.customHeight = True
     ws.row_dimensions[1].height = 26
-    for i in range(2, ws.max_row + 1):
-        ws.row_dimensions[i].height = 42
-
-    for row in ws.iter_rows(min_row=1, max_row=ws.max_row, min_col=1, max_col=len(COLUMNS_XLSX)):
-        row_idx = row[0].row
-        retoque_cell = ws.cell(row=row_idx, column=4)
-        due = (row_idx != 1) and is_due(str(retoque_cell.value or ""))
-
-        for cell in row:
-            cell.border = border
-            cell.alignment = align
-            if row_idx == 1:
-                cell.fill = header_fill
-                cell.font = header_font
-            else:
-                cell.font = cell_font
-                if due:
-                    cell.fill = due_fill
 
-    if "Sheet" in wb.sheetnames and len(wb.sheetnames) > 1:
-        sh = wb["Sheet"]
-        if sh.max_row == 1 and sh.max_column == 1 and (sh["A1"].value is None):
-            wb.remove(sh)
+    def styled(values, style):
+        cells = []
+        for v in values:
+            cell = WriteOnlyCell(ws, value=v)
+            cell.style = style
+            cells.append(cell)
+        return cells
+
+    ws.append(styled(COLUMNS_XLSX, "crm_header"))
+
+    today = datetime.now().date()
+    for r in data:
+        style = "crm_due" if is_due(r["retoque"], today) else "crm_cell"
+        ws.append(styled([r["nombre"], r["telefono"], r["fecha"], r["retoque"], r["servicio"], r["comentario"]], style))
+
+    wb.save(out)
 
-    wb.save(path)
+
+def export_fingerprint(kind: str):
+    """
+    Clave del export (y su ETag): versión de datos + día (las filas "due" cambian con la fecha).
+    None si no hay versión (sin caché).
+    """
+    return data_etag("export", kind, datetime.now().date())
+
+
+def _export_cache_get(key):
+    with _EXPORT_CACHE_LOCK:
+        blob = _EXPORT_CACHE.get(key)
+        if blob is not None:
+            _EXPORT_CACHE.move_to_end(key)
+        return blob
+
+
+def _export_cache_put(key, blob: bytes):
+    if len(blob) > EXPORT_CACHE_MAX_BYTES:
+        return
+    with _EXPORT_CACHE_LOCK:
+        _EXPORT_CACHE[key] = blob
+        _EXPORT_CACHE.move_to_end(key)
+        total = sum(len(b) for b in _EXPORT_CACHE.values())
+        while len(_EXPORT_CACHE) > EXPORT_CACHE_MAX_ITEMS or total > EXPORT_CACHE_MAX_BYTES:
+            _, old = _EXPORT_CACHE.popitem(last=False)
+            total -= len(old)
+            EXPORT_STATS["evictions"] += 1
 
 
 @APP.get("/export")
 def export():
-    data = load_data()
-    build_export_excel(EXPORT_FILE, data)
-    return send_file(EXPORT_FILE, as_attachment=True, download_name=EXPORT_FILE)
+    key = export_fingerprint("xlsx")
+    cached = not_modified(key)
+    if cached:
+        return cached
+
+    blob = _export_cache_get(key) if key else None
+
+    if blob is None:
+        EXPORT_STATS["misses"] += 1
+        buf = io.BytesIO()  # ✅ un buffer por request: exports simultáneos no se pisan
+        build_export_excel(buf, load_data())
+        blob = buf.getvalue()
+        if key:
+            _export_cache_put(key, blob)
+    else:
+        EXPORT_STATS["hits"] += 1
+
+    resp = send_file(io.BytesIO(blob), as_attachment=True, download_name=EXPORT_FILE, mimetype=XLSX_MIMETYPE)
+    return with_etag(resp, key)
+
+
+# ---------- Export CSV / NDJSON (streaming) ----------
+def iter_export_rows():
+    """
+    Filas del export (mismas columnas que COLUMNS_XLSX), página por página desde Supabase:
+    nunca se tiene toda la tabla en memoria. Con cola de escrituras, lo pendiente va encima como en
+    load_data(): primero las filas nuevas (las más recientes) y cada página con sus cambios.
+    """
+    queued = overlay_pending([])  # altas en la cola, ya con sus cambios
+    done = {r["id"] for r in queued}
+    for r in queued:
+        yield [r["nombre"], r["telefono"], r["fecha"], r["retoque"], r["servicio"], r["comentario"]]
+
+    cursor, seen = "", set()
+    while True:
+        page, cursor = load_page(cursor, PAGE_MAX)
+        if get_write_queue() is not None:
+            ids = {r["id"] for r in page} - done
+            page = [r for r in overlay_pending(page) if r["id"] in ids]
+        for r in page:
+            yield [r["nombre"], r["telefono"], r["fecha"], r["retoque"], r["servicio"], r["comentario"]]
+        if not cursor:
+            break
+        if cursor in seen:
+            # el cursor no avanza: cortar la descarga antes que repetir filas para siempre
+            raise RuntimeError("export: cursor repetido")
+        seen.add(cursor)
+
+
+def _attachment(name: str):
+    return {"Content-Disposition": f"attachment; filename={name}"}
+
+
+@APP.get("/export.csv")
+def export_csv():
+    etag = export_fingerprint("csv")
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    def generate():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(COLUMNS_XLSX)
+        yield buf.getvalue()
+
+        for values in iter_export_rows():
+            buf.seek(0)
+            buf.truncate()
+            writer.writerow(values)
+            yield buf.getvalue()
+
+    resp = Response(stream_with_context(generate()), mimetype="text/csv", headers=_attachment("crm_export.csv"))
+    return with_etag(resp, etag)
+
+
+@APP.get("/export.ndjson")
+def export_ndjson():
+    etag = export_fingerprint("ndjson")
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    def generate():
+        for values in iter_export_rows():
+            yield json.dumps(dict(zip(COLUMNS_XLSX, values)), ensure_ascii=False) + "\n"
+
+    resp = Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers=_attachment("crm_export.ndjson"),
+    )
+    return with_etag(resp, etag)
+
+
+# ---------- Import (XLSX / CSV) ----------
+IMPORT_BATCH = int(os.environ.get("CRM_IMPORT_BATCH") or 500)
+IMPORT_FIELDS = {"NOMBRE": "nombre", "TELEFONO": "telefono", "FECHA": "fecha", "SERVICIO": "servicio", "COMENTARIO": "comentario"}
+IMPORT_MAX_ERRORS = 100
+
+
+def _cell_text(v) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, datetime):
+        return fmt_ddmmyyyy(v)
+    if isinstance(v, date):
+        return v.strftime("%d/%m/%Y")
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))  # teléfonos que Excel guardó como número
+    return str(v).strip()
+
+
+def _csv_encoding(fileobj) -> str:
+    """
+    utf-8 (con o sin BOM) si el archivo entero decodifica así; si no cp1252, que es como guarda
+    los CSV el Excel en español ("Peña"). Lee por bloques y vuelve al principio.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        for chunk in iter(lambda: fileobj.read(64 * 1024), b""):
+            decoder.decode(chunk)
+        decoder.decode(b"", final=True)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "cp1252"
+    finally:
+        fileobj.seek(0)
+
+
+def iter_import_rows(fileobj, filename: str):
+    """
+    (número de fila, registro) por cada fila del archivo, sin cargarlo entero:
+    XLSX con openpyxl read-only, CSV con csv.reader. Columnas por nombre (COLUMNS_XLSX);
+    FECHA RETOQUE se ignora porque se calcula.
+    Un archivo que no se puede leer (formato o codificación) levanta ValueError.
+    """
+    wb = None
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        try:
+            wb = load_workbook(fileobj, read_only=True, data_only=True)
+        except Exception as e:
+            raise ValueError(f"No se pudo leer el Excel: {e}") from e
+        ws = wb["CRM"] if "CRM" in wb.sheetnames else wb.worksheets[0]
+        rows = ws.iter_rows(values_only=True)
+    else:
+        text = io.TextIOWrapper(fileobj, encoding=_csv_encoding(fileobj), newline="")
+        # Excel en español guarda CSV con ";": el separador se decide por el encabezado
+        first = text.readline()
+        text.seek(0)
+        delimiter = max(",;\t", key=first.count)
+        rows = csv.reader(text, delimiter=delimiter)
+
+    try:
+        header = next(rows, None) or []
+        cols = {}
+        for i, h in enumerate(header):
+            field = IMPORT_FIELDS.get(_cell_text(h).upper())
+            if field:
+                cols[i] = field
+
+        for n, values in enumerate(rows, start=2):
+            rec = {f: (_cell_text(values[i]) if i < len(values) else "") for i, f in cols.items()}
+            if not any(rec.values()):
+                continue
+            yield n, rec
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise ValueError(f"No se pudo leer el CSV: {e}") from e
+    except Exception as e:
+        if wb is None:
+            raise
+        # read-only lee las filas a medida que se piden: un archivo dañado falla acá, no al abrirlo
+        raise ValueError(f"No se pudo leer el Excel: {e}") from e
+    finally:
+        if wb is not None:
+            wb.close()
+
+
+def import_records(fileobj, filename: str, batch_size: int = IMPORT_BATCH):
+    """
+    Importa registros nuevos en lotes de batch_size (un upsert por lote; con cola de escrituras,
+    un append por lote, así las filas y su entrada de Deshacer se envían en orden).
+    Todo el import queda como UNA entrada de Deshacer. Devuelve un reporte con filas/seg.
+    """
+    q = get_write_queue()
+    batch_size = max(1, int(batch_size))
+    started = time.perf_counter()
+
+    inserted = []
+    errors = []
+    invalid = 0
+    batch = []
+
+    def flush():
+        if q is not None:
+            q.extend([{"op": "upsert", "id": p["id"], "row": p} for p in batch])
+        else:
+            with cache_write():
+                resp = get_sb().table(CRM_TABLE).upsert(batch).execute()
+                _cache_put(resp.data)
+        inserted.extend(p["id"] for p in batch)
+        batch.clear()
+
+    try:
+        for n, rec in iter_import_rows(fileobj, filename):
+            rec.setdefault("nombre", "")
+            rec.setdefault("servicio", "")
+            rec["fecha"] = supa_to_ui_date(rec.get("fecha", ""))  # acepta también YYYY-MM-DD
+
+            err = validate_row(rec["nombre"], rec["fecha"], rec["servicio"])
+            if err:
+                invalid += 1
+                if len(errors) < IMPORT_MAX_ERRORS:
+                    errors.append({"fila": n, "error": err})
+                continue
+
+            batch.append(_row_payload(rec))
+            if len(batch) >= batch_size:
+                flush()
+
+        if batch:
+            flush()
+    finally:
+        # ✅ aunque falle a mitad, lo ya insertado se puede deshacer de una vez
+        if inserted:
+            push_undo_snapshot(undo_entry(remove=inserted))
+
+    seconds = time.perf_counter() - started
+    return {
+        "inserted": len(inserted),
+        "invalid": invalid,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(len(inserted) / seconds, 1) if seconds > 0 else None,
+    }
+
+
+@APP.post("/import")
+def import_upload():
+    f = request.files.get("file")
+    if f is None or not f.filename:
+        return jsonify(error="Falta el archivo (campo 'file', .xlsx o .csv)."), 400
+
+    try:
+        batch_size = int(request.form.get("batch_size") or IMPORT_BATCH)
+    except ValueError:
+        batch_size = IMPORT_BATCH
+
+    try:
+        report = import_records(f.stream, f.filename, batch_size)
+    except ValueError as e:
+        # archivo ilegible: error del que lo sube, no de Supabase
+        return jsonify(error=str(e).replace("\n", " ")), 400
+    except Exception as e:
+        msg = str(e).replace("\n", " ")
+        return jsonify(error=f"Supabase error: {msg}"), 502
+    return jsonify(report)
+
+
+def import_json_files(data_path: str, undo_path: str = ""):
+    """
+    Carga crm_data.json / crm_undo.json (formato de la versión con archivos) en el almacenamiento actual.
+    Las filas mantienen su orden (created_at decreciente) y la pila de Deshacer se apila en el mismo orden.
+    Devuelve (filas importadas, entradas de undo).
+    """
+    with open(data_path, encoding="utf-8") as f:
+        data = json.load(f) or []
+
+    base = datetime.now(timezone.utc)
+    rows = []
+    for i, r in enumerate(data):
+        created = r.get("created_at") or (base - timedelta(milliseconds=i)).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+        rows.append({**r, "id": r.get("id") or str(uuid.uuid4()), "created_at": created})
+    saved, _ = apply_row_changes(rows, [])
+
+    stack = []
+    if undo_path and os.path.exists(undo_path):
+        with open(undo_path, encoding="utf-8") as f:
+            stack = (json.load(f) or {}).get("stack") or []
+        for snap in stack[-UNDO_MAX:]:
+            push_undo_snapshot(snap)  # snapshots completos: apply_undo los sigue aceptando
+
+    return len(saved), min(len(stack), UNDO_MAX)
+
+
+@APP.cli.command("import-json")
+@click.option("--data", "data_path", default="crm_data.json", show_default=True,
+              type=click.Path(exists=True, dir_okay=False))
+@click.option("--undo", "undo_path", default="crm_undo.json", show_default=True, type=click.Path(dir_okay=False))
+def import_json_command(data_path, undo_path):
+    """Importa crm_data.json y crm_undo.json (p.ej. a una base local con CRM_STORAGE=sqlite)."""
+    n_rows, n_undo = import_json_files(data_path, undo_path)
+    click.echo(f"{n_rows} registros y {n_undo} entradas de Deshacer importados ({STORAGE})")
+
+
+@APP.cli.command("import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--batch-size", default=IMPORT_BATCH, show_default=True, help="Filas por upsert.")
+def import_command(path, batch_size):
+    """Importa registros desde un .xlsx o .csv (columnas como el export)."""
+    with open(path, "rb") as f:
+        report = import_records(f, path, batch_size)
+
+    click.echo(
+        f"{report['inserted']} importados, {report['invalid']} inválidos "
+        f"en {report['seconds']}s ({report['rows_per_sec']} filas/seg)"
+    )
+    for e in report["errors"]:
+        click.echo(f"  fila {e['fila']}: {e['error']}")
 
 
 if __name__ == "__main__":
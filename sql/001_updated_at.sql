@@ -0,0 +1,29 @@
+-- 001: columna updated_at en crm_records (versión barata para la caché de registros)
+--
+-- La app compara (count(*), max(updated_at)) contra su caché en memoria para saber
+-- si otro worker cambió algo. Sin esta columna la caché se desactiva y cada vista
+-- vuelve a leer la tabla completa.
+--
+-- Ejecutar una vez en el SQL Editor de Supabase.
+
+alter table public.crm_records
+  add column if not exists updated_at timestamptz not null default now();
+
+create or replace function public.crm_touch_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+  new.updated_at := clock_timestamp();
+  return new;
+end;
+$$;
+
+drop trigger if exists crm_records_touch_updated_at on public.crm_records;
+create trigger crm_records_touch_updated_at
+  before insert or update on public.crm_records
+  for each row execute function public.crm_touch_updated_at();
+
+-- max(updated_at) por índice (order by updated_at desc limit 1)
+create index if not exists crm_records_updated_at_idx
+  on public.crm_records (updated_at desc);
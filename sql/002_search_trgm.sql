@@ -0,0 +1,45 @@
+-- 002: búsqueda en la base de datos (load_data(q) y GET /search)
+--
+-- Índices trigram para que `ilike '%texto%'` sobre nombre/telefono/servicio/comentario
+-- use índice (BitmapOr) en vez de recorrer la tabla, y una función que devuelve los
+-- resultados ya ordenados por parecido. Si la función no existe, la app usa
+-- `or=(nombre.ilike.*q*,...)` directo sobre la tabla (igual aprovecha los índices).
+--
+-- Ejecutar una vez en el SQL Editor de Supabase.
+
+create extension if not exists pg_trgm;
+
+create index if not exists crm_records_nombre_trgm_idx
+  on public.crm_records using gin (nombre gin_trgm_ops);
+create index if not exists crm_records_telefono_trgm_idx
+  on public.crm_records using gin (telefono gin_trgm_ops);
+create index if not exists crm_records_servicio_trgm_idx
+  on public.crm_records using gin (servicio gin_trgm_ops);
+create index if not exists crm_records_comentario_trgm_idx
+  on public.crm_records using gin (comentario gin_trgm_ops);
+
+-- lim = null -> sin límite
+create or replace function public.crm_search_records(q text, lim int default 50)
+returns setof public.crm_records
+language sql
+stable
+as $$
+  with t as (
+    select '%' || replace(replace(replace(q, '\', '\\'), '%', '\%'), '_', '\_') || '%' as pat
+  )
+  select r.*
+  from public.crm_records r, t
+  where r.nombre ilike t.pat
+     or r.telefono ilike t.pat
+     or r.servicio ilike t.pat
+     or r.comentario ilike t.pat
+  order by
+    (r.nombre ilike t.pat) desc,
+    greatest(
+      word_similarity(q, coalesce(r.nombre, '')),
+      word_similarity(q, coalesce(r.telefono, '')),
+      word_similarity(q, coalesce(r.comentario, ''))
+    ) desc,
+    r.created_at desc
+  limit lim;
+$$;
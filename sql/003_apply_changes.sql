@@ -0,0 +1,34 @@
+-- 003: aplicar un delta de filas en una sola transacción (Deshacer)
+--
+-- La app calcula qué filas cambiar (upserts) y cuáles borrar (delete_ids) y llama a
+-- esta función una sola vez: el undo es atómico y los otros lectores nunca ven la
+-- tabla vacía. Si la función no existe, la app manda los mismos cambios en lotes.
+--
+-- Ejecutar una vez en el SQL Editor de Supabase.
+
+create or replace function public.crm_apply_changes(
+  upserts jsonb default '[]'::jsonb,
+  delete_ids uuid[] default '{}'::uuid[]
+)
+returns setof public.crm_records
+language plpgsql
+as $$
+begin
+  delete from public.crm_records where id = any(delete_ids);
+
+  return query
+  insert into public.crm_records as t
+    (id, nombre, telefono, fecha, servicio, comentario, recordatorio, created_at)
+  select r.id, r.nombre, r.telefono, r.fecha, r.servicio, r.comentario,
+         coalesce(r.recordatorio, false), coalesce(r.created_at, now())
+  from jsonb_populate_recordset(null::public.crm_records, coalesce(upserts, '[]'::jsonb)) r
+  on conflict (id) do update set
+    nombre = excluded.nombre,
+    telefono = excluded.telefono,
+    fecha = excluded.fecha,
+    servicio = excluded.servicio,
+    comentario = excluded.comentario,
+    recordatorio = excluded.recordatorio
+  returning t.*;
+end;
+$$;
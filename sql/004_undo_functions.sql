@@ -0,0 +1,51 @@
+-- 004: bookkeeping del Deshacer en una sola llamada
+--
+-- crm_push_undo inserta la entrada y recorta la pila a `keep` (UNDO_MAX en la app).
+-- crm_apply_undo saca una entrada y aplica su delta en una sola transacción (usa sql/003).
+-- Si no existen, la app usa las consultas separadas de antes.
+--
+-- Ejecutar una vez en el SQL Editor de Supabase.
+
+create or replace function public.crm_push_undo(entry jsonb, keep int default 30)
+returns void
+language sql
+as $$
+  insert into public.crm_undo_snapshots (snapshot) values (entry);
+
+  delete from public.crm_undo_snapshots
+  where id not in (
+    select id from public.crm_undo_snapshots order by id desc limit keep
+  );
+$$;
+
+-- Deshacer: saca la entrada `undo_id` y aplica su delta (como crm_apply_changes, sql/003)
+-- en la misma transacción. Si otro request ya la sacó devuelve null sin tocar nada;
+-- si algo falla no se borra. Devuelve {"rows": [filas guardadas], "more": bool}.
+create or replace function public.crm_apply_undo(
+  undo_id bigint,
+  upserts jsonb default '[]'::jsonb,
+  delete_ids uuid[] default '{}'::uuid[]
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+  saved jsonb;
+begin
+  delete from public.crm_undo_snapshots where id = undo_id;
+  if not found then
+    return null;
+  end if;
+
+  select coalesce(jsonb_agg(to_jsonb(r)), '[]'::jsonb) into saved
+  from public.crm_apply_changes(upserts, delete_ids) r;
+
+  return jsonb_build_object(
+    'rows', saved,
+    'more', exists (select 1 from public.crm_undo_snapshots)
+  );
+end;
+$$;
+
+-- reemplazada por crm_apply_undo (sacar antes de aplicar perdía la entrada si fallaba)
+drop function if exists public.crm_pop_undo();
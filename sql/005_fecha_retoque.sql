@@ -0,0 +1,40 @@
+-- 005: fecha_retoque guardada en la tabla + índice
+--
+-- Misma regla que compute_retouch_date(): fecha + 21 días, o + 365 si el servicio es RETOQUE.
+-- La mantiene un trigger (funciona tanto si `fecha` es date como si es texto YYYY-MM-DD),
+-- así "ya tocan", "esta semana" y "el más cercano" salen de consultas por índice.
+-- Si la columna no existe, la app la calcula en Python como antes.
+--
+-- Ejecutar una vez en el SQL Editor de Supabase.
+
+alter table public.crm_records
+  add column if not exists fecha_retoque date;
+
+create or replace function public.crm_set_fecha_retoque()
+returns trigger
+language plpgsql
+as $$
+begin
+  if new.fecha is null then
+    new.fecha_retoque := null;
+  else
+    new.fecha_retoque := new.fecha::date
+      + case when upper(trim(coalesce(new.servicio, ''))) = 'RETOQUE' then 365 else 21 end;
+  end if;
+  return new;
+end;
+$$;
+
+drop trigger if exists crm_records_set_fecha_retoque on public.crm_records;
+create trigger crm_records_set_fecha_retoque
+  before insert or update of fecha, servicio on public.crm_records
+  for each row execute function public.crm_set_fecha_retoque();
+
+-- backfill de las filas existentes
+update public.crm_records
+set fecha_retoque = fecha::date
+  + case when upper(trim(coalesce(servicio, ''))) = 'RETOQUE' then 365 else 21 end
+where fecha is not null;
+
+create index if not exists crm_records_fecha_retoque_idx
+  on public.crm_records (fecha_retoque);
@@ -0,0 +1,11 @@
+-- 006: índice parcial para la lista de recordatorios pendientes (/reminders)
+--
+-- La consulta es "fecha_retoque <= hoy y recordatorio = false, ordenado por fecha_retoque":
+-- el índice solo contiene las filas sin recordatorio, así que su tamaño depende de lo
+-- pendiente y no de todo el historial. Requiere sql/005_fecha_retoque.sql.
+--
+-- Ejecutar una vez en el SQL Editor de Supabase.
+
+create index if not exists crm_records_reminders_due_idx
+  on public.crm_records (fecha_retoque, id)
+  where recordatorio = false;
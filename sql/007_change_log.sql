@@ -0,0 +1,38 @@
+-- 007: registro de cambios para el feed en vivo (GET /events)
+--
+-- Cada insert/update/delete de crm_records deja una línea (seq, op, record_id). Cada worker
+-- consulta "seq > último visto" cada pocos segundos (índice por seq), actualiza su caché con
+-- solo esas filas y las empuja a los navegadores por Server-Sent Events. Hace de LISTEN/NOTIFY
+-- sin conexión persistente (funciona igual con la base SQLite local).
+-- Si la tabla no existe, la app sigue los cambios por updated_at (sql/001_updated_at.sql),
+-- pero así no ve los borrados hasta que cambia la cantidad de filas.
+--
+-- Ejecutar una vez en el SQL Editor de Supabase.
+
+create table if not exists public.crm_changes (
+  seq bigserial primary key,
+  op text not null,            -- INSERT / UPDATE / DELETE
+  record_id uuid not null,
+  changed_at timestamptz not null default now()
+);
+
+create or replace function public.crm_log_change()
+returns trigger
+language plpgsql
+as $$
+begin
+  insert into public.crm_changes (op, record_id)
+  values (tg_op, case when tg_op = 'DELETE' then old.id else new.id end);
+
+  -- el feed solo necesita lo reciente: de vez en cuando se limpia lo de más de un día
+  if random() < 0.01 then
+    delete from public.crm_changes where changed_at < now() - interval '1 day';
+  end if;
+  return null;
+end;
+$$;
+
+drop trigger if exists crm_records_log_change on public.crm_records;
+create trigger crm_records_log_change
+  after insert or update or delete on public.crm_records
+  for each row execute function public.crm_log_change();
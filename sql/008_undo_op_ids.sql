@@ -0,0 +1,42 @@
+-- 008: entradas de Deshacer de la cola de escrituras sin duplicados
+--
+-- La cola (CRM_WRITE_QUEUE) reenvía el lote entero si el proceso se corta después de mandarlo
+-- y antes de anotar que salió. Las filas se guardan por upsert (reenviar no cambia nada), pero
+-- cada crm_push_undo apila una entrada más. Cada entrada de la cola lleva un op_id: crm_push_undo
+-- lo anota en crm_undo_ops en la misma transacción e ignora los que ya vio. Los op_id se guardan
+-- unos días (un reenvío llega en segundos o minutos), aunque la entrada ya se haya deshecho o recortado.
+-- Requiere sql/004_undo_functions.sql. Sin esto la app apila las entradas como antes.
+--
+-- Ejecutar una vez en el SQL Editor de Supabase.
+
+create table if not exists public.crm_undo_ops (
+  id text primary key,
+  pushed_at timestamptz not null default now()
+);
+
+create index if not exists crm_undo_ops_pushed_at_idx on public.crm_undo_ops (pushed_at);
+
+-- la firma cambia: se reemplaza la de sql/004 (dos versiones harían ambigua la llamada por nombre)
+drop function if exists public.crm_push_undo(jsonb, int);
+
+create or replace function public.crm_push_undo(entry jsonb, keep int default 30, op_id text default null)
+returns void
+language plpgsql
+as $$
+begin
+  if op_id is not null then
+    insert into public.crm_undo_ops (id) values (op_id) on conflict (id) do nothing;
+    if not found then
+      return;  -- ya apilada por un envío anterior del mismo lote
+    end if;
+    delete from public.crm_undo_ops where pushed_at < now() - interval '7 days';
+  end if;
+
+  insert into public.crm_undo_snapshots (snapshot) values (entry);
+
+  delete from public.crm_undo_snapshots
+  where id not in (
+    select id from public.crm_undo_snapshots order by id desc limit keep
+  );
+end;
+$$;
@@ -1 +1,4 @@
 python -m flask --app crm_web run --host 0.0.0.0 --port $PORT
+# flask run atiende cada request en un hilo. Con gunicorn y cambios en vivo (CRM_FEED_INTERVAL > 0)
+# cada pestaña abierta ocupa un hilo con /events, así que usar workers con hilos:
+#   gunicorn crm_web:APP --worker-class gthread --threads 16 --bind 0.0.0.0:$PORT
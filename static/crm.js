@@ -0,0 +1,539 @@
+function goFullscreen(){
+  const el = document.documentElement;
+  if (el.requestFullscreen) el.requestFullscreen();
+  else if (el.webkitRequestFullscreen) el.webkitRequestFullscreen();
+}
+
+function dateValueToDDMMYYYY(val){
+  const parts = (val || "").split("-");
+  if(parts.length !== 3) return "";
+  const yy = parts[0], mm = parts[1], dd = parts[2];
+  if(!yy || !mm || !dd) return "";
+  return `${dd}/${mm}/${yy}`;
+}
+
+function ddmmyyyyToDateValue(ddmmyyyy){
+  const parts = (ddmmyyyy || "").split("/");
+  if(parts.length !== 3) return "";
+  const dd = parts[0], mm = parts[1], yy = parts[2];
+  if(dd.length!==2 || mm.length!==2 || yy.length!==4) return "";
+  return `${yy}-${mm}-${dd}`;
+}
+
+function computeRetouchFromHidden(servicio){
+  const ddmmyyyy = document.getElementById("fecha_hidden").value.trim();
+  try{
+    const parts = ddmmyyyy.split("/");
+    if(parts.length !== 3) return "";
+    const d = parseInt(parts[0],10), m = parseInt(parts[1],10)-1, y = parseInt(parts[2],10);
+    const dt = new Date(y, m, d);
+    if(isNaN(dt.getTime())) return "";
+    const isRet = (servicio || "").trim().toUpperCase() === "RETOQUE";
+    const days = isRet ? 365 : 21; // ✅ 21 para todos, 365 si RETOQUE
+    dt.setDate(dt.getDate() + days);
+    const dd = String(dt.getDate()).padStart(2,"0");
+    const mm = String(dt.getMonth()+1).padStart(2,"0");
+    const yy = dt.getFullYear();
+    return `${dd}/${mm}/${yy}`;
+  }catch(e){ return ""; }
+}
+
+function updateRetouch(){
+  const s = document.getElementById("servicio").value.trim();
+  document.getElementById("retoque").value = computeRetouchFromHidden(s);
+}
+
+function syncHiddenFromPicker(){
+  const picker = document.getElementById("fecha_picker");
+  const hidden = document.getElementById("fecha_hidden");
+  const ddmmyyyy = dateValueToDDMMYYYY(picker.value);
+  if(ddmmyyyy) hidden.value = ddmmyyyy;
+  updateRetouch();
+}
+
+function loadRow(r){
+  document.getElementById("rid").value = r.id || "";
+  document.getElementById("nombre").value = r.nombre || "";
+  document.getElementById("telefono").value = r.telefono || "";
+  document.getElementById("servicio").value = r.servicio || "";
+  document.getElementById("comentario").value = r.comentario || "";
+
+  const picker = document.getElementById("fecha_picker");
+  const hidden = document.getElementById("fecha_hidden");
+  hidden.value = r.fecha || hidden.value;
+  const iso = ddmmyyyyToDateValue(hidden.value);
+  if(iso) picker.value = iso;
+
+  updateRetouch();
+  window.scrollTo({ top: 0, behavior: "smooth" });
+}
+
+function clearForm(){
+  document.getElementById("rid").value = "";
+  document.getElementById("nombre").value = "";
+  document.getElementById("telefono").value = "";
+  document.getElementById("servicio").value = "";
+  document.getElementById("comentario").value = "";
+
+  document.getElementById("fecha_picker").value = document.body.dataset.todayIso;
+  document.getElementById("fecha_hidden").value = document.body.dataset.todayDdmmyyyy;
+
+  updateRetouch();
+}
+
+function confirmReminder(chk){
+  const form = chk.closest("form");
+  const targetInput = form.querySelector('input[name="target"]');
+  const want = chk.checked ? "1" : "0";
+  targetInput.value = want;
+
+  const msg = (want === "1")
+    ? "¿Se le envió recordatorio?\n\nSí = marcar / No = no marcar"
+    : "¿Quitar marca de recordatorio?\n\nSí = quitar / No = mantener";
+
+  const ok = confirm(msg);
+  if(ok){
+    const id = form.querySelector('input[name="id"]').value;
+    const r = table.byId.get(id);
+    if(r) r.recordatorio = chk.checked;
+    queueReminder(id, chk.checked, chk);
+  } else {
+    chk.checked = !chk.checked;
+  }
+}
+
+// los cambios de recordatorio se juntan y se mandan en lote, sin recargar la página
+const pendingReminders = new Map();
+let reminderTimer = null;
+
+function queueReminder(id, want, chk){
+  pendingReminders.set(id, { want, chk });
+  clearTimeout(reminderTimer);
+  reminderTimer = setTimeout(flushReminders, 400);
+}
+
+async function flushReminders(){
+  const batch = Array.from(pendingReminders.entries());
+  pendingReminders.clear();
+
+  for(const want of [true, false]){
+    const items = batch.filter(([, v]) => v.want === want);
+    if(!items.length) continue;
+    try{
+      const resp = await fetch("/reminders/bulk", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ ids: items.map(([id]) => id), target: want }),
+      });
+      const data = await resp.json();
+      if(!resp.ok || !data.ok) throw new Error(data.error || resp.statusText);
+      if(data.can_undo) document.getElementById("undoBtn").disabled = false;
+    }catch(e){
+      for(const [id, v] of items){
+        v.chk.checked = !want;
+        const r = table.byId.get(id);
+        if(r) r.recordatorio = !want;
+      }
+      alert(`No se pudo guardar el recordatorio: ${e.message}`);
+    }
+  }
+}
+
+// ---- tabla: filas en memoria + índice de búsqueda + dibujo virtual ----
+// Las filas llegan como JSON compacto (#rowsData). Al primer filtro se indexan por palabra y se busca
+// por prefijo en ese índice; mientras se sigue escribiendo solo se achica el resultado anterior.
+// En el DOM existen solo las filas visibles del scroll.
+const OVERSCAN = 8;       // filas de más arriba/abajo de lo visible
+const FILTER_DELAY = 120; // ms sin teclear antes de filtrar
+
+const table = {
+  rows: [],              // orden created_at desc, igual que el servidor
+  byId: new Map(),
+  hayOf: new WeakMap(),  // fila -> " palabra palabra ..." (prefijo = includes(" " + w))
+  index: null,           // palabra -> [filas]; null hasta el primer filtro
+  sorted: null,          // palabras ordenadas (búsqueda por prefijo); null = reordenar
+  view: [],              // filas que pasan el filtro
+  viewQuery: null,       // consulta de view; null = hay que filtrar desde cero
+  rowH: 44,              // alto estimado de fila, se corrige midiendo lo dibujado
+  trs: new WeakMap(),    // fila -> <tr> ya armado
+  drawn: null,
+};
+
+function normText(s){
+  s = String(s || "").toLowerCase();
+  return /[^\x00-\x7f]/.test(s) ? s.normalize("NFD").replace(/[\u0300-\u036f]/g, "") : s;
+}
+
+function words(text){
+  return normText(text).split(/[^a-z0-9]+/).filter(Boolean);
+}
+
+function rowHay(r){
+  let hay = table.hayOf.get(r);
+  if(hay === undefined){
+    const ws = words([r.nombre, r.telefono, r.fecha, r.servicio, r.comentario].join(" "));
+    const digits = (r.telefono || "").replace(/\D/g, "");
+    if(digits) ws.push(digits); // "987 654 321" también se encuentra escribiendo "987654"
+    hay = " " + ws.join(" ");
+    table.hayOf.set(r, hay);
+  }
+  return hay;
+}
+
+function rowTokens(r){
+  return new Set(rowHay(r).slice(1).split(" ").filter(Boolean));
+}
+
+function indexRow(r){
+  if(!table.index) return;
+  for(const t of rowTokens(r)){
+    const list = table.index.get(t);
+    if(list) list.push(r);
+    else {
+      table.index.set(t, [r]);
+      table.sorted = null;
+    }
+  }
+}
+
+function unindexRow(r){
+  if(!table.index) return;
+  for(const t of rowTokens(r)){
+    const list = table.index.get(t);
+    const i = list ? list.indexOf(r) : -1;
+    if(i >= 0) list.splice(i, 1); // las palabras sin filas se limpian al reordenar
+  }
+}
+
+function sortedTokens(){
+  if(!table.index){
+    table.index = new Map();
+    for(const r of table.rows) indexRow(r);
+  }
+  if(!table.sorted){
+    for(const [t, list] of table.index) if(!list.length) table.index.delete(t);
+    table.sorted = Array.from(table.index.keys()).sort();
+  }
+  return table.sorted;
+}
+
+function prefixRows(prefix){
+  // filas con alguna palabra que empieza con prefix (búsqueda binaria en las palabras ordenadas)
+  const list = sortedTokens();
+  let lo = 0, hi = list.length;
+  while(lo < hi){
+    const mid = (lo + hi) >> 1;
+    if(list[mid] < prefix) lo = mid + 1; else hi = mid;
+  }
+  const out = new Set();
+  for(let i = lo; i < list.length && list[i].startsWith(prefix); i++){
+    for(const r of table.index.get(list[i])) out.add(r);
+  }
+  return out;
+}
+
+function rowMatches(r, qwords){
+  const hay = rowHay(r);
+  return qwords.every(w => hay.includes(" " + w));
+}
+
+function filterRows(q){
+  const qwords = words(q);
+  if(!qwords.length) return table.rows;
+  // se siguió escribiendo: alcanza con achicar el resultado anterior
+  if(table.viewQuery && q.startsWith(table.viewQuery)){
+    return table.view.filter(r => rowMatches(r, qwords));
+  }
+  const longest = qwords.reduce((a, b) => (b.length > a.length ? b : a));
+  const cand = prefixRows(longest);
+  return table.rows.filter(r => cand.has(r) && rowMatches(r, qwords));
+}
+
+function addRows(list){
+  for(const r of list){
+    if(table.byId.has(r.id)) continue;
+    table.rows.push(r);
+    table.byId.set(r.id, r);
+    indexRow(r);
+  }
+  table.viewQuery = null;
+}
+
+function spacer(height){
+  const tr = document.createElement("tr");
+  tr.className = "spacer";
+  const cell = document.createElement("td");
+  cell.colSpan = 8;
+  cell.style.height = `${height}px`;
+  tr.appendChild(cell);
+  return tr;
+}
+
+function renderTable(force){
+  const wrap = document.querySelector(".tableWrap");
+  const tbody = document.getElementById("tbodyRows");
+  const view = table.view;
+  const top = Math.max(0, wrap.scrollTop - wrap.querySelector("thead").offsetHeight);
+  const start = Math.max(0, Math.floor(top / table.rowH) - OVERSCAN);
+  const end = Math.min(view.length, start + Math.ceil(wrap.clientHeight / table.rowH) + 2 * OVERSCAN);
+
+  const d = table.drawn;
+  if(!force && d && d.view === view && d.start === start && d.end === end) return;
+  table.drawn = { view, start, end };
+
+  if(!view.length){
+    tbody.innerHTML = '<tr id="emptyRow"><td colspan="8" class="muted">No hay resultados.</td></tr>';
+    return;
+  }
+  const trs = [];
+  for(let i = start; i < end; i++){
+    let tr = table.trs.get(view[i]);
+    if(!tr){
+      tr = buildRow(view[i]);
+      table.trs.set(view[i], tr);
+    }
+    trs.push(tr);
+  }
+  tbody.replaceChildren(spacer(start * table.rowH), ...trs, spacer((view.length - end) * table.rowH));
+
+  // las filas con comentario largo son más altas: la estimación sigue a lo que se ve
+  const measured = trs.reduce((sum, tr) => sum + tr.offsetHeight, 0) / trs.length;
+  if(measured > 0 && Math.abs(measured - table.rowH) > 2) table.rowH = measured;
+}
+
+let lastQuery = "";
+function applyFilterLive(){
+  const q = normText(document.getElementById("q").value).trim();
+  table.view = filterRows(q);
+  table.viewQuery = q;
+  if(q !== lastQuery) document.querySelector(".tableWrap").scrollTop = 0;
+  lastQuery = q;
+  renderTable(true);
+  document.getElementById("countInfo").textContent =
+    `Mostrando ${table.view.length} de ${table.rows.length} registros`;
+}
+
+let filterTimer = null;
+function scheduleFilter(){
+  clearTimeout(filterTimer);
+  filterTimer = setTimeout(applyFilterLive, FILTER_DELAY);
+}
+
+let renderPending = false;
+document.querySelector(".tableWrap").addEventListener("scroll", () => {
+  if(renderPending) return;
+  renderPending = true;
+  requestAnimationFrame(() => {
+    renderPending = false;
+    renderTable(false);
+  });
+}, { passive: true });
+
+function loadTableData(){
+  const data = JSON.parse(document.getElementById("rowsData").textContent);
+  addRows(data.rows.map(v => Object.fromEntries(data.cols.map((c, i) => [c, v[i]]))));
+}
+
+function td(text, cls){
+  const el = document.createElement("td");
+  if(cls) el.className = cls;
+  el.textContent = text || "";
+  return el;
+}
+
+function buildRow(r){
+  const tr = document.createElement("tr");
+  tr.className = r.row_class || "";
+  tr.setAttribute("data-id", r.id);
+  tr.style.cursor = "pointer";
+  tr.addEventListener("click", () => loadRow(r));
+
+  const name = document.createElement("td");
+  const b = document.createElement("b");
+  b.textContent = r.nombre || "";
+  name.appendChild(b);
+  tr.appendChild(name);
+  tr.appendChild(td(r.telefono));
+  tr.appendChild(td(r.fecha));
+  tr.appendChild(td(r.retoque));
+  tr.appendChild(td(r.servicio));
+  tr.appendChild(td(r.comentario, "comment"));
+
+  const rem = td("", "rem");
+  rem.innerHTML =
+    '<form method="post" action="/toggle_reminder" style="margin:0;">' +
+    '<input type="hidden" name="id"><input type="hidden" name="target" value="">' +
+    '<div class="chkWrap"><input class="chk" type="checkbox"></div></form>';
+  rem.querySelector('input[name="id"]').value = r.id;
+  const chk = rem.querySelector(".chk");
+  chk.checked = !!r.recordatorio;
+  chk.addEventListener("change", () => confirmReminder(chk));
+  tr.appendChild(rem);
+
+  const act = td("", "act");
+  act.innerHTML =
+    '<form method="post" action="/delete" style="margin:0;"' +
+    ' onsubmit="return confirm(\'¿Eliminar este registro?\');">' +
+    '<input type="hidden" name="id"><button class="btn btn-danger" type="submit">🗑️</button></form>';
+  act.querySelector('input[name="id"]').value = r.id;
+  tr.appendChild(act);
+
+  for(const cell of [rem, act]){
+    cell.addEventListener("click", (ev) => ev.stopPropagation());
+  }
+  return tr;
+}
+
+let loadingMore = false;
+async function loadMoreRows(){
+  const more = document.getElementById("moreRows");
+  const cursor = more.getAttribute("data-next");
+  if(!cursor || loadingMore) return;
+  loadingMore = true;
+  try{
+    const resp = await fetch(`/rows?cursor=${encodeURIComponent(cursor)}`);
+    if(!resp.ok) return;
+    const data = await resp.json();
+    addRows(data.rows);
+    more.setAttribute("data-next", data.next || "");
+    if(!data.next) more.style.display = "none";
+    applyFilterLive();
+  }finally{
+    loadingMore = false;
+  }
+  // si la página era corta el centinela sigue visible: seguir cargando
+  const wrap = document.querySelector(".tableWrap").getBoundingClientRect();
+  if(more.getAttribute("data-next") && more.getBoundingClientRect().top < wrap.bottom + 200){
+    loadMoreRows();
+  }
+}
+
+if(document.getElementById("moreRows").getAttribute("data-next")){
+  const obs = new IntersectionObserver((entries) => {
+    if(entries.some(e => e.isIntersecting)) loadMoreRows();
+  }, { root: document.querySelector(".tableWrap"), rootMargin: "200px" });
+  obs.observe(document.getElementById("moreRows"));
+}
+
+// ---- mutaciones por fetch (JSON): se parchea la tabla sin recargar ----
+async function postJson(url, body){
+  const resp = await fetch(url, { method: "POST", body, headers: { "Accept": "application/json" } });
+  let data = {};
+  try{ data = await resp.json(); }catch(e){}
+  if(!resp.ok || !data.ok) throw new Error(data.error || resp.statusText);
+  return data;
+}
+
+function showError(msg){
+  const el = document.getElementById("errorMsg");
+  el.textContent = msg ? `⚠️ ${msg}` : "";
+  el.style.display = msg ? "" : "none";
+}
+
+function putRow(r){
+  const old = table.byId.get(r.id);
+  if(old){
+    unindexRow(old);
+    table.rows[table.rows.indexOf(old)] = r;
+  } else {
+    // orden created_at desc, igual que el servidor
+    const created = r.created_at || "";
+    const i = table.rows.findIndex(x => (x.created_at || "") < created);
+    table.rows.splice(i < 0 ? table.rows.length : i, 0, r);
+  }
+  table.byId.set(r.id, r);
+  indexRow(r);
+  table.viewQuery = null;
+}
+
+function dropRow(id){
+  const r = table.byId.get(id);
+  if(!r) return;
+  unindexRow(r);
+  table.rows.splice(table.rows.indexOf(r), 1);
+  table.byId.delete(id);
+  table.viewQuery = null;
+}
+
+function afterMutation(data){
+  showError("");
+  document.getElementById("undoBtn").disabled = !data.can_undo;
+  applyFilterLive();
+}
+
+document.getElementById("mainForm").addEventListener("submit", async (ev) => {
+  ev.preventDefault();
+  const form = ev.target;
+  try{
+    if(ev.submitter && ev.submitter.id === "undoBtn"){
+      const data = await postJson("/undo", new FormData());
+      for(const id of data.deleted) dropRow(id);
+      for(const r of data.rows) putRow(r);
+      afterMutation(data);
+    } else {
+      const data = await postJson("/save", new FormData(form));
+      if(data.row) putRow(data.row);
+      clearForm();
+      afterMutation(data);
+    }
+  }catch(e){
+    showError(e.message);
+  }
+});
+
+document.getElementById("tbodyRows").addEventListener("submit", async (ev) => {
+  const form = ev.target;
+  if(ev.defaultPrevented || form.getAttribute("action") !== "/delete") return;
+  ev.preventDefault();
+  try{
+    const data = await postJson("/delete", new FormData(form));
+    for(const id of data.deleted) dropRow(id);
+    afterMutation(data);
+  }catch(e){
+    showError(e.message);
+  }
+});
+
+document.getElementById("q").addEventListener("input", scheduleFilter);
+document.getElementById("fecha_picker").addEventListener("change", syncHiddenFromPicker);
+document.getElementById("servicio").addEventListener("change", updateRetouch);
+
+syncHiddenFromPicker();
+loadTableData();
+applyFilterLive();
+// el índice se arma con la página ya dibujada, así el primer filtro no espera
+(window.requestIdleCallback || setTimeout)(() => sortedTokens());
+
+// ---- cambios hechos en otras pantallas (Server-Sent Events, GET /events) ----
+function startFeed(){
+  // solo si el servidor tiene el feed activo (CRM_FEED_INTERVAL > 0)
+  if(!window.EventSource || !document.body.dataset.feedOn) return;
+  const since = document.body.dataset.feed || "";
+  const es = new EventSource("/events" + (since ? `?since=${encodeURIComponent(since)}` : ""));
+
+  es.addEventListener("upsert", (ev) => {
+    const r = JSON.parse(ev.data).row;
+    // con paginado, una fila más vieja que lo ya cargado aparece sola al bajar
+    if(!table.byId.has(r.id) && document.getElementById("moreRows").getAttribute("data-next")){
+      const last = table.rows[table.rows.length - 1];
+      if(last && (r.created_at || "") < (last.created_at || "")) return;
+    }
+    putRow(r);
+    applyFilterLive();
+  });
+
+  es.addEventListener("delete", (ev) => {
+    dropRow(JSON.parse(ev.data).id);
+    applyFilterLive();
+  });
+
+  es.addEventListener("reset", () => {
+    // se perdieron cambios: recargar, salvo que haya algo a medio escribir (y no más de una vez cada 10s)
+    const last = Number(sessionStorage.getItem("crmFeedReset") || 0);
+    if(document.getElementById("nombre").value || Date.now() - last < 10000) return;
+    sessionStorage.setItem("crmFeedReset", String(Date.now()));
+    location.reload();
+  });
+}
+
+startFeed();
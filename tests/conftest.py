@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crm_web  # noqa: E402
+
+
+def _reset_state():
+    crm_web._SB.update(client=None, pid=None, healthy=True)
+    crm_web._WQ.update(queue=None, pid=None)
+    crm_web._cache_reset()
+    crm_web._SUMMARY.update(key=None, value=None)
+    crm_web._EXPORT_CACHE.clear()
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """App apuntando a un SQLite nuevo en tmp_path (CRM_STORAGE=sqlite), sin cola ni feed."""
+    path = str(tmp_path / "crm.db")
+    monkeypatch.setattr(crm_web, "STORAGE", "sqlite")
+    monkeypatch.setattr(crm_web, "SQLITE_PATH", path)
+    monkeypatch.setattr(crm_web, "WRITE_QUEUE_PATH", "")
+    monkeypatch.setattr(crm_web, "FEED_INTERVAL", 0)
+    monkeypatch.setattr(crm_web, "PAGE_SIZE", 0)
+    _reset_state()
+    yield path
+    _reset_state()
+
+
+@pytest.fixture
+def client(db_path):
+    return crm_web.APP.test_client()
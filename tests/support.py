@@ -0,0 +1,16 @@
+"""
+Helpers compartidos por los tests de rutas.
+"""
+JSON = {"Accept": "application/json"}
+
+
+def save(client, rid="", **fields):
+    data = {"id": rid, "nombre": "Ana", "telefono": "", "fecha": "01/01/2025",
+            "servicio": "CEJAS", "comentario": "", **fields}
+    resp = client.post("/save", data=data, headers=JSON)
+    assert resp.status_code == 200, resp.get_json()
+    return resp.get_json()["row"]
+
+
+def names(rows):
+    return [r["nombre"] for r in rows]
@@ -0,0 +1,73 @@
+"""
+Feed de cambios (CRM_FEED_INTERVAL): lo que escriben otros workers llega a la caché sin recargarla.
+"""
+import uuid
+
+import crm_sqlite
+import crm_web
+from support import names, save
+
+
+def new_row(nombre, fecha):
+    return {"id": str(uuid.uuid4()), "nombre": nombre, "servicio": "CEJAS", "fecha": fecha}
+
+
+def test_feed_keeps_cache_in_sync(client, db_path):
+    a = save(client, nombre="Ana")
+    save(client, nombre="Bea")
+    feed = crm_web.ChangeFeed()
+    feed.poll()  # primera consulta: solo toma la posición
+    assert feed.mode == "log"
+    crm_web.load_data()
+
+    other = crm_sqlite.SQLiteClient(db_path)
+    other.table(crm_web.CRM_TABLE).update({"nombre": "Ana cambiada"}).eq("id", a["id"]).execute()
+    other.table(crm_web.CRM_TABLE).insert(new_row("Carla", "2025-01-03")).execute()
+
+    sub, missed = feed.subscribe()
+    assert missed == []
+    assert feed.poll() == 2
+    assert {ev["op"] for _, ev in [sub.get_nowait(), sub.get_nowait()]} == {"upsert"}
+
+    misses = crm_web.CACHE_STATS["misses"]
+    assert names(crm_web.load_data()) == ["Carla", "Bea", "Ana cambiada"]
+    assert crm_web.CACHE_STATS["misses"] == misses
+
+
+def test_feed_leaves_invalidated_cache_for_reload(client, db_path):
+    save(client, nombre="Ana")
+    feed = crm_web.ChangeFeed()
+    feed.poll()
+    crm_web.load_data()
+
+    # la caché ya estaba marcada para recargar antes de la consulta del feed
+    with crm_web._CACHE_LOCK:
+        crm_web._CACHE["synced"] = None
+    other = crm_sqlite.SQLiteClient(db_path)
+    other.table(crm_web.CRM_TABLE).insert(new_row("Bea", "2025-01-02")).execute()
+    feed.poll()
+
+    misses = crm_web.CACHE_STATS["misses"]
+    assert names(crm_web.load_data()) == ["Bea", "Ana"]
+    assert crm_web.CACHE_STATS["misses"] == misses + 1
+
+
+def test_older_rows_do_not_overwrite_cache(client):
+    a = save(client, nombre="Ana")
+    crm_web.load_data()
+    stamp = crm_web._CACHE["stamps"][a["id"]]
+
+    # el feed leyó la fila antes de una recarga que ya trajo una versión más nueva
+    crm_web._cache_put([{"id": a["id"], "nombre": "Vieja", "fecha": "2025-01-01", "servicio": "CEJAS",
+                         "created_at": a["created_at"], "updated_at": "2000-01-01T00:00:00+00:00"}])
+    assert crm_web._CACHE["stamps"][a["id"]] == stamp
+    assert names(crm_web.load_data()) == ["Ana"]
+
+
+def test_page_enables_the_feed_only_when_configured(client, monkeypatch):
+    assert "data-feed-on" not in client.get("/").get_data(as_text=True)
+    assert crm_web.get_change_feed() is None
+
+    monkeypatch.setattr(crm_web, "FEED_INTERVAL", 3600)
+    monkeypatch.setattr(crm_web, "_FEED", {"feed": None, "pid": None})
+    assert 'data-feed-on="1"' in client.get("/").get_data(as_text=True)
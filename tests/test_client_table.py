@@ -0,0 +1,23 @@
+"""
+Datos embebidos para la tabla del navegador (filtro incremental y scroll virtual en crm.js).
+"""
+import json
+import re
+
+import crm_web
+from support import save
+
+
+def embedded_rows(html):
+    m = re.search(r'<script id="rowsData" type="application/json">(.*?)</script>', html, re.S)
+    return json.loads(m.group(1))
+
+
+def test_index_embeds_compact_rows(client):
+    save(client, nombre="Ana", fecha="01/01/2020")
+    save(client, nombre="</script><b>", fecha="01/01/2099")
+
+    data = embedded_rows(client.get("/").get_data(as_text=True))
+    assert data["cols"] == [*crm_web.TABLE_COLUMNS, "row_class"]
+    rows = [dict(zip(data["cols"], r)) for r in data["rows"]]
+    assert [(r["nombre"], r["row_class"]) for r in rows] == [("</script><b>", ""), ("Ana", "due")]
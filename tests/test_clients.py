@@ -0,0 +1,48 @@
+"""
+Índice de clientes (/clients y /clients/<key>): visitas agrupadas por teléfono o nombre.
+"""
+import crm_web
+from support import JSON, names, save
+
+
+def test_clients(client):
+    save(client, nombre="Ana", telefono="987 654 321", fecha="01/01/2025")
+    save(client, nombre="Ana P.", telefono="987654321", fecha="05/01/2025", servicio="RETOQUE")
+    save(client, nombre="Bea", fecha="02/01/2025")
+
+    data = client.get("/clients").get_json()
+    assert data["total"] == 2
+    assert data["clients"][0]["key"] == "tel-987654321"
+    assert data["clients"][0]["visitas"] == 2
+
+    hist = client.get("/clients/tel-987654321").get_json()
+    assert hist["client"]["ultimo_servicio"] == "RETOQUE"
+    assert names(hist["visits"]) == ["Ana P.", "Ana"]
+    assert client.get("/clients/nom-nadie").status_code == 404
+
+
+def test_index_follows_edits_and_deletes(client):
+    a = save(client, nombre="Ana", telefono="987654321")
+    save(client, nombre="Ana", telefono="987654321", fecha="02/01/2025")
+    client.get("/clients")
+
+    # la visita cambia de teléfono: pasa de un cliente al otro sin recargar la caché
+    misses = crm_web.CACHE_STATS["misses"]
+    save(client, rid=a["id"], nombre="Ana", telefono="911222333")
+    data = client.get("/clients").get_json()
+    assert {c["key"]: c["visitas"] for c in data["clients"]} == {"tel-987654321": 1, "tel-911222333": 1}
+    assert crm_web.CACHE_STATS["misses"] == misses
+
+    client.post("/delete", data={"id": a["id"]}, headers=JSON)
+    assert client.get("/clients/tel-911222333").status_code == 404
+
+
+def test_history_without_data_version(client, monkeypatch):
+    save(client, nombre="José Núñez", fecha="01/01/2025")
+    save(client, nombre="Jose Nunez", fecha="02/01/2025")
+    save(client, nombre="Ana", telefono="987 654 321")
+    monkeypatch.setattr(crm_web, "db_version", lambda fresh=False: None)
+
+    hist = client.get("/clients/nom-jose-nunez").get_json()
+    assert names(hist["visits"]) == ["Jose Nunez", "José Núñez"]
+    assert names(client.get("/clients/tel-987654321").get_json()["visits"]) == ["Ana"]
@@ -0,0 +1,54 @@
+"""
+Fechas memoizadas: mismo resultado que strptime, también para los caminos en lote.
+"""
+from datetime import date, datetime
+
+import pytest
+
+import crm_web
+
+UI_DATES = ["01/01/2025", "1/2/2025", "31/12/2024", "29/02/2024", "29/02/2025", "31/04/2025",
+            "00/01/2025", "01/13/2025", "1/1/25", "01-01-2025", "", "  05/06/2025 ", "aa/bb/cccc"]
+
+
+def strptime_or_none(s, fmt):
+    try:
+        return datetime.strptime(s.strip(), fmt).date()
+    except ValueError:
+        return None
+
+
+@pytest.mark.parametrize("s", UI_DATES)
+def test_ui_date_matches_strptime(s):
+    expected = strptime_or_none(s, "%d/%m/%Y") if len(s.strip().split("/")[-1]) == 4 else None
+    assert crm_web.ui_date(s) == expected
+
+
+def test_iso_dates_and_round_trip():
+    assert crm_web.iso_date("2025-03-09") == date(2025, 3, 9)
+    assert crm_web.iso_date("2025-03-09T10:00:00+00:00") == date(2025, 3, 9)
+    assert crm_web.iso_date("2025-02-30") is None
+    assert crm_web.supa_to_ui_date("2025-03-09") == "09/03/2025"
+    assert crm_web.supa_to_ui_date("09/03/2025") == "09/03/2025"
+    assert crm_web.ui_to_supa_date("9/3/2025") == "2025-03-09"
+    assert crm_web.ui_to_supa_date("no es fecha") == "no es fecha"
+
+
+def test_retouch_and_due_flags():
+    assert crm_web.compute_retouch_date("01/01/2025", "cejas") == "22/01/2025"
+    assert crm_web.compute_retouch_date("01/01/2025", " retoque ") == "01/01/2026"
+    with pytest.raises(ValueError):
+        crm_web.compute_retouch_date("31/02/2025", "CEJAS")
+
+    today = date(2025, 1, 22)
+    retouches = ["21/01/2025", "22/01/2025", "23/01/2025", "", "xx"]
+    assert crm_web.due_flags(retouches, today) == [crm_web.is_due(r, today) for r in retouches]
+    assert crm_web.due_flags(retouches, today) == [True, True, False, False, False]
+
+
+def test_dates_are_parsed_once():
+    crm_web.ui_date.cache_clear()
+    for _ in range(100):
+        crm_web.ui_date("15/08/2025")
+    info = crm_web.ui_date.cache_info()
+    assert (info.misses, info.hits) == (1, 99)
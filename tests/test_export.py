@@ -0,0 +1,97 @@
+"""
+Exports: XLSX (/export) con estilos y caché por versión de datos, CSV y NDJSON en streaming.
+"""
+import csv
+import io
+import json
+from collections import OrderedDict
+
+from openpyxl import load_workbook
+
+import crm_web
+from support import save
+
+
+def export_sheet(client):
+    resp = client.get("/export")
+    assert resp.status_code == 200
+    return load_workbook(io.BytesIO(resp.get_data()))["CRM"]
+
+
+def test_export_rows_and_due_style(client):
+    save(client, nombre="Vencida", fecha="01/01/2020", telefono="987654321")
+    save(client, nombre="Futura", fecha="01/01/2099")
+
+    ws = export_sheet(client)
+    rows = list(ws.iter_rows(values_only=True))
+    assert list(rows[0]) == crm_web.COLUMNS_XLSX
+    assert rows[1][:4] == ("Futura", None, "01/01/2099", "22/01/2099")
+    assert rows[2][:4] == ("Vencida", "987654321", "01/01/2020", "22/01/2020")
+    assert ws["A1"].style == "crm_header"
+    assert ws["A2"].style == "crm_cell"
+    assert ws["A3"].style == "crm_due"
+
+
+def test_export_cache_hit_and_invalidation(client):
+    save(client, nombre="Ana")
+    stats = dict(crm_web.EXPORT_STATS)
+    first = client.get("/export").get_data()
+    assert client.get("/export").get_data() == first
+    assert crm_web.EXPORT_STATS["misses"] == stats["misses"] + 1
+    assert crm_web.EXPORT_STATS["hits"] == stats["hits"] + 1
+
+    # con otra versión de datos se vuelve a generar
+    save(client, nombre="Bea")
+    client.get("/export")
+    assert crm_web.EXPORT_STATS["misses"] == stats["misses"] + 2
+
+
+def test_export_cache_lru_eviction(monkeypatch):
+    monkeypatch.setattr(crm_web, "EXPORT_CACHE_MAX_ITEMS", 2)
+    monkeypatch.setattr(crm_web, "EXPORT_CACHE_MAX_BYTES", 10)
+    monkeypatch.setattr(crm_web, "_EXPORT_CACHE", OrderedDict())
+    evictions = crm_web.EXPORT_STATS["evictions"]
+
+    crm_web._export_cache_put("a", b"1234")
+    crm_web._export_cache_put("b", b"1234")
+    assert crm_web._export_cache_get("a") == b"1234"  # "a" pasa a ser la más reciente
+    crm_web._export_cache_put("c", b"1234")
+    assert list(crm_web._EXPORT_CACHE) == ["a", "c"]
+
+    crm_web._export_cache_put("d", b"12345678")  # por tamaño: sale todo lo demás
+    assert list(crm_web._EXPORT_CACHE) == ["d"]
+    crm_web._export_cache_put("e", b"x" * 11)  # más grande que el máximo: no se guarda
+    assert list(crm_web._EXPORT_CACHE) == ["d"]
+    assert crm_web.EXPORT_STATS["evictions"] == evictions + 3
+
+
+def test_csv_and_ndjson_stream_across_pages(client, monkeypatch):
+    monkeypatch.setattr(crm_web, "PAGE_MAX", 2)  # varias páginas de load_page
+    for i in range(5):
+        save(client, nombre=f"Cliente {i}", comentario='dice "hola", chau')
+
+    resp = client.get("/export.csv")
+    assert resp.is_streamed
+    assert resp.headers["Content-Disposition"] == "attachment; filename=crm_export.csv"
+    rows = list(csv.reader(io.StringIO(resp.get_data(as_text=True))))
+    assert [r[0] for r in rows[1:]] == [f"Cliente {i}" for i in reversed(range(5))]
+    assert rows[1][5] == 'dice "hola", chau'
+
+    lines = client.get("/export.ndjson").get_data(as_text=True).splitlines()
+    assert [json.loads(line)["NOMBRE"] for line in lines] == [r[0] for r in rows[1:]]
+
+
+def test_csv_export_includes_queued_writes(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(crm_web, "PAGE_MAX", 2)
+    rows = [save(client, nombre=f"Cliente {i}") for i in range(3)]
+    monkeypatch.setattr(crm_web, "WRITE_QUEUE_PATH", str(tmp_path / "queue.jsonl"))
+    monkeypatch.setattr(crm_web.WriteQueue, "start", lambda self: None)
+
+    save(client, nombre="Nueva")
+    save(client, rid=rows[1]["id"], nombre="Editada")
+    client.post("/delete", data={"id": rows[0]["id"]})
+
+    expected = [r["nombre"] for r in crm_web.load_data()]
+    assert expected == ["Nueva", "Cliente 2", "Editada"]
+    lines = client.get("/export.csv").get_data(as_text=True).splitlines()
+    assert [line.split(",")[0] for line in lines[1:]] == expected
@@ -0,0 +1,38 @@
+"""
+ETag/Last-Modified y 304 en el índice y los listados JSON.
+"""
+import crm_web
+from support import save
+
+
+def test_index_etag(client):
+    save(client, nombre="Ana")
+    first = client.get("/")
+    assert first.status_code == 200
+    assert client.get("/", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+    save(client, nombre="Bea")
+    assert client.get("/", headers={"If-None-Match": first.headers["ETag"]}).status_code == 200
+
+
+def test_json_listings_revalidate(client):
+    save(client, nombre="Ana", fecha="01/01/2025")
+    for url in ("/rows?limit=5", "/reminders.json", "/search?q=ana", "/clients", "/export.csv"):
+        first = client.get(url)
+        assert first.status_code == 200, url
+        assert "no-cache" in first.headers["Cache-Control"]
+        assert first.headers["Last-Modified"]
+        assert client.get(url, headers={"If-None-Match": first.headers["ETag"]}).status_code == 304, url
+
+
+def test_one_version_query_per_request(client, monkeypatch):
+    save(client, nombre="Ana")
+    etag = client.get("/").headers["ETag"]
+    calls = []
+    real = crm_web._query_db_version
+    monkeypatch.setattr(crm_web, "_query_db_version", lambda: calls.append(1) or real())
+
+    client.get("/")
+    assert len(calls) == 1
+    client.get("/", headers={"If-None-Match": etag})
+    assert len(calls) == 2
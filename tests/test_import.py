@@ -0,0 +1,69 @@
+"""
+Import de XLSX/CSV por /import.
+"""
+import io
+import zipfile
+
+from openpyxl import Workbook
+
+import crm_web
+from support import names
+
+
+def upload(client, data: bytes, filename: str):
+    return client.post("/import", data={"file": (io.BytesIO(data), filename)}, content_type="multipart/form-data")
+
+
+def test_import_cp1252_csv(client):
+    # CSV guardado por Excel en español: ";" y cp1252
+    src = "NOMBRE;TELEFONO;FECHA;SERVICIO;COMENTARIO\nPeña;;01/01/2025;CEJAS;señal\n"
+    resp = upload(client, src.encode("cp1252"), "datos.csv")
+    assert resp.status_code == 200, resp.get_json()
+    assert resp.get_json()["inserted"] == 1
+    assert names(crm_web.load_data()) == ["Peña"]
+    assert crm_web.load_data()[0]["comentario"] == "señal"
+
+
+def test_import_unreadable_file_is_400(client):
+    resp = upload(client, b"esto no es un zip", "datos.xlsx")
+    assert resp.status_code == 400
+    assert "Supabase" not in resp.get_json()["error"]
+
+
+def test_import_damaged_sheet_is_400(client):
+    # el zip abre bien pero la hoja está cortada: openpyxl falla recién al leer las filas
+    wb = Workbook()
+    wb.active.append(["NOMBRE", "FECHA", "SERVICIO"])
+    wb.active.append(["Ana", "01/01/2025", "CEJAS"])
+    buf = io.BytesIO()
+    wb.save(buf)
+    src, out = zipfile.ZipFile(buf), io.BytesIO()
+    with zipfile.ZipFile(out, "w") as z:
+        for item in src.infolist():
+            data = src.read(item.filename)
+            z.writestr(item, data[:len(data) // 2] if item.filename.startswith("xl/worksheets/") else data)
+
+    resp = upload(client, out.getvalue(), "datos.xlsx")
+    assert resp.status_code == 400
+    assert "Supabase" not in resp.get_json()["error"]
+
+
+def test_import_goes_through_write_queue(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(crm_web, "WRITE_QUEUE_PATH", str(tmp_path / "queue.jsonl"))
+    monkeypatch.setattr(crm_web.WriteQueue, "start", lambda self: None)
+    resp = upload(client, b"NOMBRE;FECHA;SERVICIO\nAna;01/01/2025;CEJAS\nBea;01/01/2025;CEJAS\n", "datos.csv")
+    assert resp.get_json()["inserted"] == 2
+
+    q = crm_web.get_write_queue()
+    assert [op["op"] for _, op in q.pending()] == ["upsert", "upsert", "undo"]
+    q.flush(wait=True)
+    assert sorted(names(crm_web.load_data())) == ["Ana", "Bea"]
+
+
+def test_import_storage_error_is_502(client, monkeypatch):
+    def boom(*args, **kwargs):
+        raise RuntimeError("sin conexión")
+
+    monkeypatch.setattr(crm_web, "get_sb", boom)
+    resp = upload(client, b"NOMBRE;FECHA;SERVICIO\nAna;01/01/2025;CEJAS\n", "datos.csv")
+    assert resp.status_code == 502
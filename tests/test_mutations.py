@@ -0,0 +1,59 @@
+"""
+/save, /delete y /toggle_reminder: JSON para fetch (Accept: application/json), redirect para formularios.
+"""
+import crm_web
+from support import JSON, save
+
+
+def test_form_posts_still_redirect(client):
+    resp = client.post("/save", data={"nombre": "Ana", "fecha": "01/01/2025", "servicio": "CEJAS"})
+    assert resp.status_code == 302
+    assert resp.headers["Location"] == "/"
+
+    resp = client.post("/save", data={"nombre": "", "fecha": "01/01/2025", "servicio": "CEJAS"})
+    assert resp.status_code == 302
+    assert resp.headers["Location"].startswith("/?error=")
+
+
+def test_json_responses_carry_the_changed_row(client):
+    resp = client.post("/save", data={"nombre": "Ana", "fecha": "01/01/2025", "servicio": "CEJAS"}, headers=JSON)
+    out = resp.get_json()
+    assert out["ok"] is True
+    assert out["created"] is True
+    assert out["can_undo"] is True
+    assert out["row"]["retoque"] == "22/01/2025"
+
+    out = client.post("/toggle_reminder", data={"id": out["row"]["id"], "target": "1"}, headers=JSON).get_json()
+    assert out["row"]["recordatorio"] is True
+
+    out = client.post("/delete", data={"id": "00000000-0000-4000-8000-000000000000"}, headers=JSON).get_json()
+    assert out == {"ok": True, "deleted": [], "can_undo": True}
+
+
+def test_storage_errors_are_json_502(client, monkeypatch):
+    a = save(client, nombre="Ana")
+
+    def boom(*args, **kwargs):
+        raise RuntimeError("sin conexión")
+
+    monkeypatch.setattr(crm_web, "fetch_row", boom)
+    for path, data in (("/save", {"id": a["id"], "nombre": "Ana", "fecha": "01/01/2025", "servicio": "CEJAS"}),
+                       ("/delete", {"id": a["id"]}),
+                       ("/toggle_reminder", {"id": a["id"], "target": "1"})):
+        resp = client.post(path, data=data, headers=JSON)
+        assert resp.status_code == 502
+        assert resp.get_json() == {"ok": False, "error": "Supabase error: sin conexión"}
+
+
+def test_mutations_do_not_load_the_table(client, monkeypatch):
+    a = save(client, nombre="Ana")
+
+    def full_load(*args, **kwargs):
+        raise AssertionError("no debería bajar la tabla entera")
+
+    monkeypatch.setattr(crm_web, "load_data", full_load)
+    monkeypatch.setattr(crm_web, "_cache_reload", full_load)
+    save(client, rid=a["id"], nombre="Ana editada")
+    client.post("/toggle_reminder", data={"id": a["id"], "target": "1"}, headers=JSON)
+    assert client.post("/delete", data={"id": a["id"]}, headers=JSON).get_json()["deleted"] == [a["id"]]
+    assert client.post("/undo", headers=JSON).get_json()["ok"] is True
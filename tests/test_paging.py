@@ -0,0 +1,81 @@
+"""
+Listado paginado por keyset (created_at desc, id desc): / y /rows.
+"""
+import uuid
+
+import pytest
+
+import crm_sqlite
+import crm_web
+from support import names, save
+
+
+def test_rows_paging(client, monkeypatch):
+    for i in range(7):
+        save(client, nombre=f"Cliente {i}")
+    monkeypatch.setattr(crm_web, "PAGE_SIZE", 3)
+
+    html = client.get("/").get_data(as_text=True)
+    assert 'data-next=""' not in html
+
+    seen, cursor = [], ""
+    while True:
+        data = client.get(f"/rows?limit=3&cursor={cursor}").get_json()
+        seen += names(data["rows"])
+        cursor = data["next"] or ""
+        if not cursor:
+            break
+    assert seen == [f"Cliente {i}" for i in reversed(range(7))]
+
+
+def test_rows_paging_breaks_ties_by_id(client, db_path):
+    other = crm_sqlite.SQLiteClient(db_path)
+    ids = sorted(str(uuid.uuid4()) for _ in range(4))
+    other.table(crm_web.CRM_TABLE).insert([
+        {"id": rid, "nombre": f"N{i}", "servicio": "CEJAS", "fecha": "2025-01-01",
+         "created_at": "2025-01-01T10:00:00.000000+00:00"}
+        for i, rid in enumerate(ids)
+    ]).execute()
+
+    seen, cursor = [], ""
+    while True:
+        data = client.get(f"/rows?limit=1&cursor={cursor}").get_json()
+        seen += [r["id"] for r in data["rows"]]
+        cursor = data["next"] or ""
+        if not cursor:
+            break
+    assert seen == list(reversed(ids))
+
+
+def test_rows_invalid_cursor_starts_over(client):
+    save(client, nombre="Ana")
+    bad = [crm_web.encode_cursor({"id": str(uuid.uuid4()), "created_at": v}) for v in ("0000", '2025",id.gt.0')]
+    for cursor in ["no-es-un-cursor", *bad]:
+        resp = client.get(f"/rows?limit=5&cursor={cursor}")
+        assert resp.status_code == 200
+        assert names(resp.get_json()["rows"]) == ["Ana"]
+        assert resp.get_json()["next"] is None
+
+
+def test_cursor_across_null_created_at():
+    # sin created_at (columna nullable en Supabase): van primero y el cursor sigue avanzando
+    ids = sorted(str(uuid.uuid4()) for _ in range(4))
+    rows = [crm_web._normalize_row({"id": rid, "nombre": f"N{i}", "created_at": None if i < 2 else f"2025-01-0{i}"})
+            for i, rid in enumerate(ids)]
+
+    seen, cursor = [], ""
+    while True:
+        page, cursor = crm_web._rows_page(rows, crm_web.decode_cursor(cursor, nullable=True), 1)
+        seen += names(page)
+        if not cursor:
+            break
+    assert seen == ["N1", "N0", "N3", "N2"]
+
+
+def test_export_stops_on_repeated_cursor(monkeypatch):
+    row = crm_web._normalize_row({"id": str(uuid.uuid4()), "nombre": "Ana"})
+    monkeypatch.setattr(crm_web, "load_page", lambda cursor, limit: ([row], "mismo"))
+    rows = crm_web.iter_export_rows()
+    assert [next(rows)[0], next(rows)[0]] == ["Ana", "Ana"]
+    with pytest.raises(RuntimeError):
+        next(rows)
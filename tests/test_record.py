@@ -0,0 +1,31 @@
+"""
+Record: fila normalizada inmutable que se lee como dict.
+"""
+import json
+
+import pytest
+
+import crm_web
+
+
+def test_record_reads_like_a_dict():
+    r = crm_web._normalize_row({"id": 7, "nombre": " Ana ", "fecha": "2025-01-01", "servicio": "CEJAS",
+                                "telefono": None, "recordatorio": 1, "created_at": "2025-01-01T10:00:00+00:00"})
+    assert r["nombre"] == r.nombre == "Ana"
+    assert r["id"] == "7"
+    assert r.get("telefono") == ""
+    assert r.get("no_existe", "x") == "x"
+    assert "retoque" in r and "no_existe" not in r
+    with pytest.raises(KeyError):
+        r["no_existe"]
+    assert r["fecha"] == "01/01/2025" and r["retoque"] == "22/01/2025"
+    assert not hasattr(r, "__dict__")
+
+
+def test_record_converts_on_the_way_out():
+    r = crm_web.Record(id="1", nombre="Ana", fecha="01/01/2025")
+    assert dict(r) == r.to_dict()
+    assert json.loads(json.dumps(r.to_dict(row_class="due")))["row_class"] == "due"
+    changed = r.replace(recordatorio=True)
+    assert changed.recordatorio and not r.recordatorio
+    assert crm_web.present_rows([r])[0]["nombre"] == "Ana"
@@ -0,0 +1,79 @@
+"""
+Caché de registros por worker: versión (count, max updated_at) y write-through.
+"""
+import time
+
+import crm_sqlite
+import crm_web
+from support import JSON, names, save
+
+
+def test_cache_sees_writes_from_other_workers(client, db_path):
+    x = save(client, nombre="X")
+    y = save(client, nombre="Y")
+    assert names(crm_web.load_data()) == ["Y", "X"]  # caché cargada
+
+    # otro worker cambia X; después este worker escribe Y (su updated_at tapa al de X)
+    other = crm_sqlite.SQLiteClient(db_path)
+    time.sleep(0.01)
+    other.table(crm_web.CRM_TABLE).update({"nombre": "X cambiada"}).eq("id", x["id"]).execute()
+    time.sleep(0.01)
+    client.post("/toggle_reminder", data={"id": y["id"], "target": "1"}, headers=JSON)
+
+    assert names(crm_web.load_data()) == ["Y", "X cambiada"]
+
+
+def test_own_writes_keep_cache_warm(client):
+    save(client, nombre="Ana")
+    crm_web.load_data()
+    hits = crm_web.CACHE_STATS["hits"]
+    save(client, nombre="Bea")
+    assert names(crm_web.load_data()) == ["Bea", "Ana"]
+    assert crm_web.CACHE_STATS["hits"] == hits + 1
+
+
+def test_cache_put_large_batch(db_path):
+    def raw(i, nombre):
+        return {"id": f"00000000-0000-4000-8000-{i:012d}", "nombre": nombre, "servicio": "CEJAS",
+                "fecha": "2025-01-01", "created_at": f"2025-01-01T00:00:00.{i:06d}+00:00",
+                "updated_at": "2025-01-02T00:00:00.000000+00:00"}
+
+    # 20k filas pares en memoria (created_at desc); el lote edita 1000 y agrega 2000 impares
+    cached = [raw(i, "vieja") for i in range(40000, 0, -2)]
+    crm_web._CACHE.update(rows=[crm_web._normalize_row(r) for r in cached],
+                          stamps={r["id"]: r["updated_at"] for r in cached}, synced=None)
+    batch = [raw(i, "editada") for i in range(2, 2002, 2)] + [raw(i, "nueva") for i in range(1, 4001, 2)]
+
+    started = time.perf_counter()
+    crm_web._cache_put(batch)
+    assert time.perf_counter() - started < 1.0
+
+    rows = crm_web._CACHE["rows"]
+    assert len(rows) == 22000
+    assert [r["created_at"] for r in rows] == sorted((r["created_at"] for r in rows), reverse=True)
+    by_name = {}
+    for r in rows:
+        by_name[r["nombre"]] = by_name.get(r["nombre"], 0) + 1
+    assert by_name == {"vieja": 19000, "editada": 1000, "nueva": 2000}
+
+
+def test_cache_sees_write_between_check_and_own_write(client, db_path, monkeypatch):
+    x = save(client, nombre="X")
+    y = save(client, nombre="Y")
+    crm_web.load_data()
+
+    # otro worker edita X justo después de que este worker comprobó la versión
+    other = crm_sqlite.SQLiteClient(db_path)
+    real = crm_web._query_db_version
+
+    def racy():
+        ver = real()
+        monkeypatch.setattr(crm_web, "_query_db_version", real)
+        time.sleep(0.01)
+        other.table(crm_web.CRM_TABLE).update({"nombre": "X cambiada"}).eq("id", x["id"]).execute()
+        time.sleep(0.01)
+        return ver
+
+    monkeypatch.setattr(crm_web, "_query_db_version", racy)
+    client.post("/toggle_reminder", data={"id": y["id"], "target": "1"}, headers=JSON)
+    assert names(crm_web.load_data()) == ["Y", "X cambiada"]
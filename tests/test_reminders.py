@@ -0,0 +1,128 @@
+"""
+Recordatorios: fecha_retoque en la BD, lista de pendientes (/reminders) y marcado en lote.
+"""
+import uuid
+
+import crm_sqlite
+import crm_web
+from support import JSON, names, save
+
+
+def test_fecha_retoque_comes_from_the_database(client, db_path):
+    cejas = save(client, nombre="Ana", fecha="31/12/2024", servicio="CEJAS")
+    retoque = save(client, nombre="Bea", fecha="01/03/2024", servicio="RETOQUE")
+    other = crm_sqlite.SQLiteClient(db_path)
+    stored = {r["id"]: r["fecha_retoque"] for r in other.table(crm_web.CRM_TABLE).select("id,fecha_retoque").execute().data}
+    assert stored == {cejas["id"]: "2025-01-21", retoque["id"]: "2025-03-01"}
+
+    # sin la columna (BD sin sql/005) se calcula igual en la app
+    for r in other.table(crm_web.CRM_TABLE).select("*").execute().data:
+        r.pop("fecha_retoque")
+        assert crm_web._normalize_row(r)["retoque"] == crm_web.supa_to_ui_date(stored[r["id"]])
+
+
+def test_reminders_total_is_stable_across_pages(client):
+    for i in range(5):
+        save(client, nombre=f"Cliente {i}", fecha="01/01/2025")
+    save(client, nombre="Futuro", fecha="01/01/2099")
+
+    totals, seen, cursor = [], [], ""
+    while True:
+        data = client.get(f"/reminders.json?limit=2&cursor={cursor}").get_json()
+        totals.append(data["total"])
+        seen += names(data["rows"])
+        cursor = data["next"] or ""
+        if not cursor:
+            break
+    assert totals == [5, 5, 5]
+    assert sorted(seen) == [f"Cliente {i}" for i in range(5)]
+
+    html = client.get("/reminders").get_data(as_text=True)
+    assert "Recordatorios pendientes (5)" in html
+
+
+def test_reminders_without_fecha_retoque_column(client, monkeypatch):
+    for i in range(3):
+        save(client, nombre=f"Cliente {i}", fecha="01/01/2025")
+    done = save(client, nombre="Avisada", fecha="01/01/2025")
+    client.post("/toggle_reminder", data={"id": done["id"], "target": "1"}, headers=JSON)
+    expected = client.get("/reminders.json?limit=2").get_json()
+
+    # BD sin sql/005: mismo resultado filtrando las filas en Python
+    with crm_web.APP.test_request_context("/reminders.json"):
+        rows, cursor, total = crm_web._load_reminders_from_rows("", 2)
+    assert total == expected["total"] == 3
+    assert [r["id"] for r in rows] == [r["id"] for r in expected["rows"]]
+    assert cursor == expected["next"]
+
+
+def test_toggle_reminder_and_bulk(client):
+    a = save(client, nombre="Ana")
+    b = save(client, nombre="Bea")
+
+    resp = client.post("/toggle_reminder", data={"id": a["id"], "target": "1"}, headers=JSON)
+    assert resp.get_json()["row"]["recordatorio"] is True
+
+    resp = client.post("/reminders/bulk", json={"ids": [a["id"], b["id"]], "target": True})
+    assert resp.get_json()["changed"] == [b["id"]]
+    assert all(r["recordatorio"] for r in crm_web.load_data())
+
+    # una sola entrada de Deshacer para el lote
+    client.post("/undo", headers=JSON)
+    state = {r["nombre"]: r["recordatorio"] for r in crm_web.load_data()}
+    assert state == {"Ana": True, "Bea": False}
+
+
+def test_bulk_rejects_bad_input(client):
+    assert client.post("/reminders/bulk", json={"ids": ["no-es-uuid"], "target": True}).status_code == 400
+    ids = [str(uuid.UUID(int=i)) for i in range(crm_web.REMINDERS_BULK_MAX + 1)]
+    assert client.post("/reminders/bulk", json={"ids": ids, "target": True}).status_code == 400
+
+
+def test_bulk_at_max_size_chunks_the_id_filter(client, db_path, monkeypatch):
+    ids = [str(uuid.UUID(int=i + 1)) for i in range(crm_web.REMINDERS_BULK_MAX)]
+    crm_sqlite.SQLiteClient(db_path).table(crm_web.CRM_TABLE).insert([
+        {"id": rid, "nombre": "N", "servicio": "CEJAS", "fecha": "2025-01-01"} for rid in ids
+    ]).execute()
+
+    # con Supabase los ids van en la URL: ningún filtro in_ más grande que WRITE_BATCH
+    sizes = []
+    real = crm_sqlite._Query.in_
+
+    def in_(self, col, values):
+        sizes.append(len(values))
+        return real(self, col, values)
+
+    monkeypatch.setattr(crm_sqlite._Query, "in_", in_)
+
+    resp = client.post("/reminders/bulk", json={"ids": ids, "target": True})
+    assert resp.status_code == 200
+    assert len(resp.get_json()["changed"]) == crm_web.REMINDERS_BULK_MAX
+    assert max(sizes) <= crm_web.WRITE_BATCH
+    assert all(r["recordatorio"] for r in crm_web.load_data())
+
+
+def test_reminders_bad_cursor_is_400(client):
+    save(client, nombre="Ana", fecha="01/01/2020")
+    rid = str(uuid.uuid4())
+    for value in ("2025-13-01", "2025-01-01,id.gt.0", ""):
+        cursor = crm_web.encode_cursor({"id": rid, "fecha_retoque": value}, "fecha_retoque")
+        assert client.get(f"/reminders.json?cursor={cursor}").status_code == 400
+    assert client.get("/reminders?cursor=no-es-un-cursor").status_code == 400
+
+
+def test_reminders_fallback_only_without_column(client, monkeypatch):
+    save(client, nombre="Ana", fecha="01/01/2020")
+    real = crm_sqlite._Query.lte
+    error = RuntimeError("timeout")
+
+    def lte(self, col, value):
+        if col == "fecha_retoque":
+            raise error
+        return real(self, col, value)
+
+    monkeypatch.setattr(crm_sqlite._Query, "lte", lte)
+    assert client.get("/reminders.json").status_code == 500  # no baja toda la tabla por un error de red
+
+    error = crm_sqlite.StorageError("column crm_records.fecha_retoque does not exist")
+    assert client.get("/reminders.json").get_json()["total"] == 1
@@ -0,0 +1,20 @@
+"""
+Cliente por proceso: reconstrucción tras un error de conexión.
+"""
+import threading
+from types import SimpleNamespace
+
+import crm_web
+
+
+def test_rebuild_closes_old_pool_after_grace(db_path, monkeypatch):
+    monkeypatch.setattr(crm_web, "SB_CLOSE_GRACE", 0.05)
+    closed = threading.Event()
+    old = SimpleNamespace(postgrest=SimpleNamespace(session=SimpleNamespace(close=closed.set)))
+    crm_web._SB.update(client=old, pid=crm_web.os.getpid(), healthy=False)
+
+    new = crm_web.get_sb()
+    assert new is not old
+    # otros hilos pueden seguir usando el cliente viejo un rato
+    assert not closed.is_set()
+    assert closed.wait(2)
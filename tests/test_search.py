@@ -0,0 +1,45 @@
+"""
+Búsqueda en la BD (/search y load_data(q)); sin crm_search_records se usa el fallback con ilike.
+"""
+import crm_sqlite
+import crm_web
+from support import names, save
+
+
+def test_search_ranks_name_matches_first(client):
+    save(client, nombre="Rosa Soto", fecha="01/01/2025")
+    save(client, nombre="Ana", comentario="viene con Rosa", fecha="02/01/2025")
+    save(client, nombre="Marrosa", fecha="03/01/2025")
+    save(client, nombre="Bea", fecha="04/01/2025")
+
+    data = client.get("/search?q=rosa").get_json()
+    assert names(data["rows"]) == ["Rosa Soto", "Marrosa", "Ana"]
+    assert [r["rank"] for r in data["rows"]] == [1, 2, 3]
+
+
+def test_search_other_columns_and_limit(client):
+    save(client, nombre="Ana", telefono="987654321")
+    save(client, nombre="Bea", telefono="912345678")
+    assert names(crm_web.load_data("9876")) == ["Ana"]
+    assert len(client.get("/search?q=9&limit=1").get_json()["rows"]) == 1
+
+
+def test_search_ignores_postgrest_reserved_characters(client):
+    save(client, nombre="Ana (hija)")
+    assert names(crm_web.load_data("Ana (")) == ["Ana (hija)"]
+    assert client.get('/search?q=%2C%28%29%22').get_json()["rows"] == []
+
+
+def test_search_falls_back_only_when_function_is_missing(client, monkeypatch):
+    save(client, nombre="Ana")
+    error = crm_web.APIError({"message": "Could not find the function", "code": "PGRST202"})
+
+    class Rpc:
+        def execute(self):
+            raise error
+
+    monkeypatch.setattr(crm_sqlite.SQLiteClient, "rpc", lambda self, fn, params=None: Rpc())
+    assert names(crm_web.load_data("ana")) == ["Ana"]
+
+    error = RuntimeError("timeout")
+    assert client.get("/search?q=ana").status_code == 500
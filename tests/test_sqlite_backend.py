@@ -0,0 +1,119 @@
+"""
+Rutas de la app contra el backend SQLite (CRM_STORAGE=sqlite) en un archivo temporal.
+"""
+import csv
+import io
+import json
+import time
+
+from openpyxl import load_workbook
+
+import crm_sqlite
+import crm_web
+from support import JSON, names, save
+
+
+def test_save_edit_delete_and_undo(client):
+    ana = save(client, nombre="Ana")
+    save(client, nombre="Bea")
+    assert names(crm_web.load_data()) == ["Bea", "Ana"]
+
+    edited = save(client, rid=ana["id"], nombre="Ana María")
+    assert edited["id"] == ana["id"]
+
+    resp = client.post("/delete", data={"id": ana["id"]}, headers=JSON)
+    assert resp.get_json()["deleted"] == [ana["id"]]
+    assert names(crm_web.load_data()) == ["Bea"]
+
+    # deshacer: borrado, edición y alta de Bea, en ese orden
+    out = client.post("/undo", headers=JSON).get_json()
+    assert names(out["rows"]) == ["Ana María"]
+    out = client.post("/undo", headers=JSON).get_json()
+    assert names(out["rows"]) == ["Ana"]
+    out = client.post("/undo", headers=JSON).get_json()
+    assert len(out["deleted"]) == 1
+    assert names(crm_web.load_data()) == ["Ana"]
+
+
+def test_save_validates(client):
+    resp = client.post("/save", data={"nombre": "", "fecha": "01/01/2025", "servicio": "CEJAS"}, headers=JSON)
+    assert resp.status_code == 400
+    assert resp.get_json()["ok"] is False
+
+
+def test_import_and_export(client):
+    src = "NOMBRE;TELEFONO;FECHA;SERVICIO;COMENTARIO\nAna;987654321;2025-01-01;CEJAS;hola\nSin fecha;;;CEJAS;\nBea;;02/01/2025;RETOQUE;\n"
+    resp = client.post("/import", data={"file": (io.BytesIO(src.encode("utf-8")), "datos.csv")},
+                       content_type="multipart/form-data")
+    report = resp.get_json()
+    assert report["inserted"] == 2
+    assert report["invalid"] == 1
+
+    rows = list(csv.reader(io.StringIO(client.get("/export.csv").get_data(as_text=True))))
+    assert rows[0] == list(crm_web.COLUMNS_XLSX)
+    assert sorted(r[0] for r in rows[1:]) == ["Ana", "Bea"]
+
+    lines = client.get("/export.ndjson").get_data(as_text=True).splitlines()
+    assert sorted(json.loads(line)["NOMBRE"] for line in lines if line) == ["Ana", "Bea"]
+
+    wb = load_workbook(io.BytesIO(client.get("/export").get_data()), read_only=True)
+    assert sorted(r[0] for r in wb.worksheets[0].iter_rows(min_row=2, values_only=True)) == ["Ana", "Bea"]
+    wb.close()
+
+    # todo el import se deshace de una vez
+    client.post("/undo", headers=JSON)
+    assert crm_web.load_data() == []
+
+
+def test_import_json_files(db_path, tmp_path):
+    data = tmp_path / "crm_data.json"
+    data.write_text(json.dumps([
+        {"nombre": "Nueva", "fecha": "03/01/2025", "servicio": "CEJAS"},
+        {"nombre": "Vieja", "fecha": "01/01/2025", "servicio": "CEJAS"},
+    ]), encoding="utf-8")
+    undo = tmp_path / "crm_undo.json"
+    undo.write_text(json.dumps({"stack": [[{"nombre": "Antes", "fecha": "01/01/2025", "servicio": "CEJAS"}]]}),
+                    encoding="utf-8")
+
+    assert crm_web.import_json_files(str(data), str(undo)) == (2, 1)
+    assert names(crm_web.load_data()) == ["Nueva", "Vieja"]
+
+    # el snapshot completo de la versión con archivos se sigue pudiendo deshacer
+    crm_web.APP.test_client().post("/undo", headers=JSON)
+    assert names(crm_web.load_data()) == ["Antes"]
+
+
+def test_sqlite_client_query_interface(db_path):
+    sb = crm_sqlite.SQLiteClient(db_path)
+    t = crm_web.CRM_TABLE
+    ids = [f"00000000-0000-4000-8000-00000000000{i}" for i in range(4)]
+    sb.table(t).insert([
+        {"id": ids[0], "nombre": "Ñandú", "servicio": "CEJAS", "fecha": "2025-01-01", "recordatorio": False},
+        {"id": ids[1], "nombre": "ana", "servicio": "RETOQUE", "fecha": "2025-01-02", "recordatorio": True},
+        {"id": ids[2], "nombre": "Bea", "servicio": "CEJAS", "fecha": "2025-01-03", "telefono": "987"},
+        {"id": ids[3], "nombre": "Carla", "servicio": "CEJAS", "fecha": None},
+    ]).execute()
+
+    def q():
+        return sb.table(t).select("id", count="exact").order("id")
+
+    assert [r["id"] for r in q().ilike("nombre", "%ñAN%").execute().data] == [ids[0]]
+    assert q().eq("recordatorio", True).execute().data == [{"id": ids[1]}]
+    assert q().is_("fecha", "null").execute().count == 1
+    resp = q().or_(f'telefono.eq.987,and(servicio.eq.RETOQUE,fecha.lte."2025-01-02")').execute()
+    assert [r["id"] for r in resp.data] == [ids[1], ids[2]]
+    resp = q().or_(f"and(fecha.is.null,id.lt.{ids[3]}),fecha.not.is.null").execute()
+    assert [r["id"] for r in resp.data] == ids[:3]
+    resp = q().in_("id", ids[1:]).range(0, 1).execute()
+    assert (len(resp.data), resp.count) == (2, 3)
+
+    # upsert como PostgREST: solo pisa las columnas que vienen; updated_at avanza
+    before = sb.table(t).select("*").eq("id", ids[2]).execute().data[0]
+    time.sleep(0.002)
+    after = sb.table(t).upsert({"id": ids[2], "nombre": "Bea M."}).execute().data[0]
+    assert (after["nombre"], after["telefono"]) == ("Bea M.", "987")
+    assert after["updated_at"] > before["updated_at"]
+    assert after["fecha_retoque"] == "2025-01-24"
+
+    assert [r["id"] for r in sb.table(t).delete().eq("servicio", "RETOQUE").execute().data] == [ids[1]]
+    sb.close()
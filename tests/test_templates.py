@@ -0,0 +1,28 @@
+"""
+Plantillas precompiladas y estáticos con hash en la URL.
+"""
+import crm_web
+from support import save
+
+
+def test_index_links_hashed_assets(client):
+    save(client, nombre="Ana <b>")
+    html = client.get("/").get_data(as_text=True)
+    for name, digest in crm_web.ASSET_HASHES.items():
+        assert f"/static/{name}?v={digest}" in html
+    assert "Ana <b>" not in html  # las filas van escapadas dentro del JSON de la página
+    assert "Ana \\u003cb\\u003e" in html
+
+
+def test_hashed_assets_are_immutable(client):
+    url = crm_web.asset_url("crm.js")
+    resp = client.get(url)
+    assert resp.status_code == 200
+    assert "immutable" in resp.headers["Cache-Control"]
+    assert "max-age=31536000" in resp.headers["Cache-Control"]
+    resp.close()
+
+    # sin ?v= no se promete nada
+    resp = client.get("/static/crm.js")
+    assert "immutable" not in (resp.headers.get("Cache-Control") or "")
+    resp.close()
@@ -0,0 +1,116 @@
+"""
+Deshacer: pila de entradas en UNDO_TABLE y estado del botón.
+"""
+import re
+
+import crm_sqlite
+import crm_web
+from support import JSON, names, save
+
+
+def undo_enabled(html):
+    return re.search(r'id="undoBtn"[^>]*disabled', html) is None
+
+
+def test_can_undo_follows_other_workers_in_paged_mode(client, db_path, monkeypatch):
+    monkeypatch.setattr(crm_web, "PAGE_SIZE", 3)
+    assert not undo_enabled(client.get("/").get_data(as_text=True))
+
+    # otro worker guarda una fila con su entrada de Deshacer
+    other = crm_sqlite.SQLiteClient(db_path)
+    other.rpc("crm_push_undo", {"entry": crm_web.undo_entry(remove=["x"]), "keep": crm_web.UNDO_MAX}).execute()
+    other.table(crm_web.CRM_TABLE).insert({"id": "00000000-0000-4000-8000-000000000001", "nombre": "Bea",
+                                           "servicio": "CEJAS", "fecha": "2025-01-02"}).execute()
+
+    html = client.get("/").get_data(as_text=True)
+    assert "Bea" in html
+    assert undo_enabled(html)
+
+
+def test_save_response_reuses_version(client, monkeypatch):
+    save(client, nombre="Ana")
+    client.get("/")
+    calls = []
+    real = crm_web._query_db_version
+    monkeypatch.setattr(crm_web, "_query_db_version", lambda: calls.append(1) or real())
+
+    resp = client.post("/save", data={"nombre": "Bea", "fecha": "02/01/2025", "servicio": "CEJAS"}, headers=JSON)
+    assert resp.get_json()["can_undo"] is True
+    assert len(calls) == 2  # solo las comprobaciones antes y después de escribir
+
+
+def test_undo_failure_keeps_entry(client, monkeypatch):
+    ana = save(client, nombre="Ana")
+    save(client, rid=ana["id"], nombre="Editada")
+
+    def boom(*args, **kwargs):
+        raise RuntimeError("sin conexión")
+
+    # falla dentro de crm_apply_undo (se revierte también el borrado de la entrada) y en el fallback
+    monkeypatch.setattr(crm_sqlite.SQLiteClient, "_rpc_crm_apply_changes", boom)
+    monkeypatch.setattr(crm_web, "_apply_row_changes", boom)
+    resp = client.post("/undo", headers=JSON)
+    assert resp.status_code == 502
+    assert resp.get_json()["ok"] is False
+
+    monkeypatch.undo()
+    out = client.post("/undo", headers=JSON).get_json()
+    assert names(out["rows"]) == ["Ana"]
+
+
+def test_same_entry_is_applied_once(client):
+    ana = save(client, nombre="Ana")
+    save(client, rid=ana["id"], nombre="Editada")
+    sid, snap = crm_web.peek_undo_snapshot()
+
+    with crm_web.APP.test_request_context("/undo"):
+        assert names(crm_web.apply_undo(snap, sid)[0]) == ["Ana"]
+    save(client, rid=ana["id"], nombre="Otra vez")
+    # un segundo Deshacer que leyó la misma entrada no la vuelve a aplicar
+    with crm_web.APP.test_request_context("/undo"):
+        assert crm_web.apply_undo(snap, sid) == ([], [])
+    assert names(crm_web.load_data()) == ["Otra vez"]
+
+
+def test_undo_entries_hold_only_the_touched_rows(client):
+    ana = save(client, nombre="Ana")
+    save(client, nombre="Bea")
+    save(client, rid=ana["id"], nombre="Ana editada")
+
+    _, entry = crm_web.peek_undo_snapshot()
+    assert entry["remove"] == []
+    assert names(entry["restore"]) == ["Ana"]
+
+    client.post("/delete", data={"id": ana["id"]}, headers=JSON)
+    _, entry = crm_web.peek_undo_snapshot()
+    assert names(entry["restore"]) == ["Ana editada"]
+
+
+def test_undo_rewrites_only_changed_rows(client, db_path):
+    ana = save(client, nombre="Ana")
+    bea = save(client, nombre="Bea")
+    other = crm_sqlite.SQLiteClient(db_path)
+
+    def stamps():
+        rows = other.table(crm_web.CRM_TABLE).select("id,updated_at").execute().data
+        return {r["id"]: r["updated_at"] for r in rows}
+
+    save(client, rid=ana["id"], nombre="Ana editada")
+    before = stamps()
+    client.post("/undo", headers=JSON)
+    after = stamps()
+    assert after[bea["id"]] == before[bea["id"]]  # Bea no se toca
+    assert after[ana["id"]] != before[ana["id"]]
+
+
+def test_undo_legacy_full_snapshot(client):
+    save(client, nombre="Ana")
+    bea = save(client, nombre="Bea")
+    # entrada con el formato viejo: la tabla entera
+    snapshot = [r.to_dict() for r in crm_web.load_data() if r["id"] != bea["id"]]
+    crm_web.get_sb().table(crm_web.UNDO_TABLE).insert({"snapshot": snapshot}).execute()
+
+    out = client.post("/undo", headers=JSON).get_json()
+    assert out["deleted"] == [bea["id"]]
+    assert out["rows"] == []
+    assert names(crm_web.load_data()) == ["Ana"]
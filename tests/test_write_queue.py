@@ -0,0 +1,183 @@
+"""
+Cola de escrituras (CRM_WRITE_QUEUE): anotar sin conexión, sincronizar y compactar.
+"""
+import json
+import os
+
+import crm_sqlite
+import crm_web
+from support import JSON, names, save
+
+
+class Offline:
+    def __getattr__(self, name):
+        raise RuntimeError("sin conexión")
+
+
+def test_write_queue_offline(client, tmp_path, monkeypatch):
+    a = save(client, nombre="Ana")
+    crm_web.load_data()
+    monkeypatch.setattr(crm_web, "WRITE_QUEUE_PATH", str(tmp_path / "queue.jsonl"))
+    monkeypatch.setattr(crm_web, "QUEUE_INTERVAL", 3600)
+
+    real = crm_web.get_sb
+    monkeypatch.setattr(crm_web, "get_sb", lambda: Offline())
+    save(client, rid=a["id"], nombre="Ana editada")
+    resp = client.post("/reminders/bulk", json={"ids": [a["id"]], "target": True})
+    assert resp.status_code == 200
+    assert names(crm_web.load_data()) == ["Ana editada"]
+
+    # al volver la conexión se sincroniza y Deshacer va en orden: recordatorio, edición, alta
+    monkeypatch.setattr(crm_web, "get_sb", real)
+    out = client.post("/undo", headers=JSON).get_json()
+    assert out["rows"][0]["recordatorio"] is False
+    out = client.post("/undo", headers=JSON).get_json()
+    assert names(out["rows"]) == ["Ana"]
+    out = client.post("/undo", headers=JSON).get_json()
+    assert out["deleted"] == [a["id"]]
+
+
+def test_pending_after_compaction(tmp_path, monkeypatch):
+    # dos workers sobre el mismo archivo; las dos operaciones ocupan exactamente los mismos bytes
+    monkeypatch.setattr(crm_web.WriteQueue, "start", lambda self: None)
+    monkeypatch.setattr(crm_web.time, "time", lambda: 1700000000.0)
+    sent = []
+    monkeypatch.setattr(crm_web, "_send_queued_ops", lambda ops: sent.extend(ops))
+
+    path = str(tmp_path / "queue.jsonl")
+    w1, w2 = crm_web.WriteQueue(path), crm_web.WriteQueue(path)
+    w1.append({"op": "patch", "id": "x", "fields": {"nombre": "AAAA"}})
+    assert len(w2.pending()) == 1  # w2 la deja en su caché
+
+    assert w1.flush() == 1  # enviada y compactada
+    w1.append({"op": "patch", "id": "x", "fields": {"nombre": "BBBB"}})
+
+    assert w2.flush() == 1
+    assert [op["fields"]["nombre"] for op in sent] == ["AAAA", "BBBB"]
+    assert w1.pending() == w2.pending() == []
+
+
+def test_queued_edit_keeps_other_workers_writes(client, db_path, tmp_path, monkeypatch):
+    a = save(client, nombre="Ana")
+    crm_web.load_data()  # caché de este worker cargada
+    monkeypatch.setattr(crm_web, "WRITE_QUEUE_PATH", str(tmp_path / "queue.jsonl"))
+
+    other = crm_sqlite.SQLiteClient(db_path)
+    other.table(crm_web.CRM_TABLE).update({"recordatorio": True}).eq("id", a["id"]).execute()
+
+    save(client, rid=a["id"], comentario="nuevo comentario")
+    crm_web.get_write_queue().flush(wait=True)
+    row = other.table(crm_web.CRM_TABLE).select("*").eq("id", a["id"]).execute().data[0]
+    assert row["comentario"] == "nuevo comentario"
+    assert row["recordatorio"]
+
+
+def test_queued_edit_uses_cache_when_offline(client, tmp_path, monkeypatch):
+    a = save(client, nombre="Ana")
+    crm_web.load_data()
+    monkeypatch.setattr(crm_web, "WRITE_QUEUE_PATH", str(tmp_path / "queue.jsonl"))
+    monkeypatch.setattr(crm_web, "QUEUE_INTERVAL", 3600)
+    q = crm_web.get_write_queue()
+    q.stats["retry_in"] = 5.0  # el último envío falló
+
+    calls = []
+    monkeypatch.setattr(crm_web, "get_sb", lambda: calls.append(1) or Offline())
+    assert crm_web.fetch_row(a["id"])["nombre"] == "Ana"
+    assert calls == []
+
+
+def test_queued_edit_does_not_wait_for_supabase(client, tmp_path, monkeypatch):
+    a = save(client, nombre="Ana")
+    crm_web.load_data()
+    monkeypatch.setattr(crm_web, "WRITE_QUEUE_PATH", str(tmp_path / "queue.jsonl"))
+    monkeypatch.setattr(crm_web.WriteQueue, "start", lambda self: None)
+
+    calls = []
+    monkeypatch.setattr(crm_web, "get_sb", lambda: calls.append(1) or Offline())
+    before = crm_web.fetch_row(a["id"])
+    row = crm_web.save_row_upsert(a["id"], "Ana editada", "", "02/01/2025", "CEJAS", "", existing=True)
+    assert calls == []
+    assert (before["nombre"], row["nombre"], row["fecha"]) == ("Ana", "Ana editada", "02/01/2025")
+
+    (_, op), = crm_web.get_write_queue().pending()
+    assert op["op"] == "patch" and "recordatorio" not in op["fields"]
+
+
+def test_offline_export_pages_through_cache(client, tmp_path, monkeypatch):
+    for i in range(5):
+        save(client, nombre=f"Cliente {i}")
+    crm_web.load_data()
+    monkeypatch.setattr(crm_web, "WRITE_QUEUE_PATH", str(tmp_path / "queue.jsonl"))
+    monkeypatch.setattr(crm_web, "PAGE_MAX", 2)
+    monkeypatch.setattr(crm_web, "get_sb", lambda: Offline())
+
+    lines = client.get("/export.csv").get_data(as_text=True).splitlines()
+    assert lines[1:] == [f"Cliente {i},,01/01/2025,22/01/2025,CEJAS," for i in reversed(range(5))]
+
+
+def test_replayed_batch_does_not_duplicate_undo(client, db_path, tmp_path, monkeypatch):
+    monkeypatch.setattr(crm_web, "WRITE_QUEUE_PATH", str(tmp_path / "queue.jsonl"))
+    monkeypatch.setattr(crm_web.WriteQueue, "start", lambda self: None)
+    save(client, nombre="Ana")
+    ops = [op for _, op in crm_web.get_write_queue().pending()]
+    assert [op["op"] for op in ops] == ["undo", "upsert"]
+
+    # corte entre el envío y el ack: el mismo lote sale dos veces
+    crm_web._send_queued_ops(ops)
+    crm_web._send_queued_ops(ops)
+    other = crm_sqlite.SQLiteClient(db_path)
+    assert len(other.table(crm_web.UNDO_TABLE).select("id").execute().data) == 1
+
+
+def test_rejected_op_goes_to_dead_letter(client, tmp_path, monkeypatch):
+    a = save(client, nombre="Ana")
+    b = save(client, nombre="Bea")
+    monkeypatch.setattr(crm_web, "WRITE_QUEUE_PATH", str(tmp_path / "queue.jsonl"))
+    monkeypatch.setattr(crm_web.WriteQueue, "start", lambda self: None)
+    q = crm_web.get_write_queue()
+    q.append({"op": "patch", "id": a["id"], "fields": {"nombre": None}})  # NOT NULL: la BD lo rechaza
+    q.append({"op": "patch", "id": b["id"], "fields": {"nombre": "Bea editada"}})
+
+    assert q.flush(wait=True) == 2
+    assert q.pending() == []
+    assert sorted(names(crm_web.load_data())) == ["Ana", "Bea editada"]
+    assert q.info()["dead_letters"] == 1
+    with open(q.path + ".dead", encoding="utf-8") as f:
+        assert json.loads(f.readline())["op"]["id"] == a["id"]
+
+
+def test_rejected_means_4xx(monkeypatch):
+    err = crm_web.APIError({"message": "x", "code": "23502"})
+    for status, rejected in ((400, True), (403, True), (429, False), (503, False)):
+        monkeypatch.setattr(crm_web._SB_CALL, "status", status, raising=False)
+        assert crm_web.sb_rejected(err) is rejected
+    assert crm_web.sb_rejected(RuntimeError("sin conexión")) is False
+
+
+def test_corrupted_line_is_skipped(client, tmp_path, monkeypatch):
+    a = save(client, nombre="Ana")
+    monkeypatch.setattr(crm_web, "WRITE_QUEUE_PATH", str(tmp_path / "queue.jsonl"))
+    monkeypatch.setattr(crm_web.WriteQueue, "start", lambda self: None)
+    q = crm_web.get_write_queue()
+    with open(q.path, "ab") as f:
+        f.write(b'{"op": "patch", "id": \n')
+    q.append({"op": "patch", "id": a["id"], "fields": {"nombre": "Ana editada"}})
+    with open(q.path, "ab") as f:
+        f.write(b"\x00\x00\n")
+
+    assert [op["id"] for _, op in q.pending()] == [a["id"]]
+    assert names(crm_web.load_data()) == ["Ana editada"]
+    assert q.flush(wait=True) == 1
+    assert q.pending() == [] and q.info()["dead_letters"] == 2
+    assert os.path.getsize(q.path) == 0  # todo atrás: compactada
+
+
+def test_queued_save_of_unknown_row_returns_it(client, tmp_path, monkeypatch):
+    a = save(client, nombre="Ana")
+    monkeypatch.setattr(crm_web, "WRITE_QUEUE_PATH", str(tmp_path / "queue.jsonl"))
+    monkeypatch.setattr(crm_web.WriteQueue, "start", lambda self: None)
+    crm_web._cache_reset()  # caché vacía y sin conexión: la fila no se puede resolver
+    monkeypatch.setattr(crm_web, "get_sb", lambda: Offline())
+
+    row = crm_web.save_row_upsert(a["id"], "Ana editada", "", "02/01/2025", "CEJAS", "", existing=True)
+    assert (row["id"], row["nombre"], row["fecha"]) == (a["id"], "Ana editada", "02/01/2025")